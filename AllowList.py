@@ -0,0 +1,159 @@
+# Name:         PN5180 Python Library
+# Description:  Memory-mapped UID allow-list index for access decisions.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from Polling import TAG_ARRIVED
+
+# File layout: _HEADER (MAGIC, number of sections), one _SECTION per UID size (UID length,
+# number of UIDs, number of slots, file offset of the table), then the tables. A table is
+# an open addressing hash table of 'slots' (a power of 2) slots of the UID length, a UID
+# lives in slot crc32(uid) & (slots - 1) or, linearly probed, in one of the next slots;
+# an all-zero slot is empty. The load factor is at most LOAD_FACTOR.
+MAGIC = b'PN5180AL'
+UID_LENGTHS = (4, 7, 10)
+LOAD_FACTOR = 0.5
+_HEADER = struct.Struct('<8sI')
+_SECTION = struct.Struct('<BxxxIIQ')
+
+
+def compile_allow_list(uids, path):
+    '''Write the index file 'path' for the UIDs (bytes-like of 4, 7 or 10 bytes) and
+    return the number of UIDs in it. The file is replaced atomically, AllowLists reading
+    it switch to the new file by themselves.'''
+
+    sections = {length: set() for length in UID_LENGTHS}
+    for uid in uids:
+        uid = bytes(uid)
+        if (len(uid) not in sections) or (not any(uid)):
+            raise ValueError("Invalid UID {}".format(uid.hex()))
+        sections[len(uid)].add(uid)
+
+    offset = _HEADER.size + len(UID_LENGTHS) * _SECTION.size
+    header = _HEADER.pack(MAGIC, len(UID_LENGTHS))
+    tables = []
+    for length in UID_LENGTHS:
+        members = sections[length]
+        slots = 1
+        while (slots * LOAD_FACTOR < len(members)):
+            slots <<= 1
+        table = bytearray(slots * length)
+        mask = slots - 1
+        for uid in members:
+            slot = zlib.crc32(uid) & mask
+            while any(table[slot * length:(slot + 1) * length]):
+                slot = (slot + 1) & mask
+            table[slot * length:(slot + 1) * length] = uid
+        header += _SECTION.pack(length, len(members), slots, offset)
+        tables.append(table)
+        offset += len(table)
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        for table in tables:
+            f.write(table)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return sum(len(members) for members in sections.values())
+
+
+class AllowList:
+    '''Read-only view of an index file written by compile_allow_list().
+
+    The file is memory mapped, the processes using it share one copy in the page cache
+    and opening it costs no loading. A lookup hashes the raw UID (crc32) and compares one
+    or a few slots, a few microseconds even with millions of UIDs. Every 'check_interval'
+    seconds a lookup checks whether the file was replaced and maps the new one; while the
+    file can't be read (e.g. it was removed) the lookups go on with the current mapping.'''
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._map = None
+        self._file_id = None
+        self._next_check = 0
+        self._sections = {}       # UID length -> (map, table offset, slot mask)
+        self.counts = {}          # UID length -> number of UIDs
+        self._open()
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            new_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = _HEADER.unpack_from(new_map)
+        if (magic != MAGIC):
+            new_map.close()
+            raise ValueError("{} is not a UID allow-list".format(self.path))
+        sections, counts = {}, {}
+        for i in range(count):
+            length, uids, slots, offset = _SECTION.unpack_from(new_map, _HEADER.size + i * _SECTION.size)
+            sections[length] = (new_map, offset, slots - 1)
+            counts[length] = uids
+        # The old map is not closed, a lookup in another thread may still use it; the
+        # sections carry their map, so a lookup never mixes the old and the new file
+        self._map, self._sections, self.counts = new_map, sections, counts
+        self._file_id = (stat.st_ino, stat.st_mtime_ns)
+
+    def reload(self):
+        '''Map the file again if it was replaced. Returns True if it was, False if not or
+        if it can't be read, the current mapping is kept then.'''
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            stat = os.stat(self.path)
+            if ((stat.st_ino, stat.st_mtime_ns) == self._file_id):
+                return False
+            self._open()
+        except (OSError, ValueError, struct.error):
+            return False
+        return True
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def __contains__(self, uid):
+        '''uid : bytes-like, e.g. a memoryview of the buffer of read_card_serial()'''
+        if (time.monotonic() >= self._next_check):
+            self.reload()
+        length = len(uid)
+        section = self._sections.get(length)
+        if (section is None):
+            return False
+        data, offset, mask = section
+        slot = zlib.crc32(uid) & mask
+        while True:
+            start = offset + slot * length
+            stored = data[start:start + length]
+            if (stored == uid):
+                return True
+            if (not any(stored)):
+                return False
+            slot = (slot + 1) & mask
+
+    def close(self):
+        if (self._map is not None):
+            self._map.close()
+            self._map = None
+
+    def on_tag(self, granted, denied=None):
+        '''Callback for TagPoller.run() / ReaderPool: every arriving tag is looked up and
+        handed to granted(event) or denied(event).'''
+        def hook(event):
+            if (event.kind != TAG_ARRIVED):
+                return
+            if (event.uid in self):
+                granted(event)
+            elif (denied is not None):
+                denied(event)
+        return hook
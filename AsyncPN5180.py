@@ -0,0 +1,119 @@
+# Name:         PN5180 Python Library
+# Description:  asyncio front-end of the PN5180 classes.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PN5180 import PN5180Error
+from Polling import TagPoller
+
+
+class AsyncPN5180:
+    '''Awaitable counterpart of a PN5180 object.
+
+    The blocking calls (BUSY handshake, IRQ waits) run on one worker thread owned by this
+    object. All hardware access is therefore serialized and the event loop keeps serving
+    other tasks while the reader works.'''
+
+    def __init__(self, device):
+        self.device = device
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='PN5180')
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    async def begin(self):
+        return await self._run(self.device.begin)
+
+    async def reset(self):
+        return await self._run(self.device.reset)
+
+    async def transceive_command(self, send_buffer, recv_buffer=None):
+        return await self._run(self.device.transceive_command, send_buffer, recv_buffer)
+
+    async def read_register(self, reg):
+        return await self._run(self.device.read_register, reg)
+
+    async def write_register(self, reg, value):
+        return await self._run(self.device.write_register, reg, value)
+
+    async def read_eeprom(self, addr, buffer):
+        return await self._run(self.device.read_eeprom, addr, buffer)
+
+    async def load_rf_config(self, tx_conf, rx_conf):
+        return await self._run(self.device.load_rf_config, tx_conf, rx_conf)
+
+    async def set_rf_on(self):
+        return await self._run(self.device.set_rf_on)
+
+    async def send_data(self, data, len, valid_bits):
+        return await self._run(self.device.send_data, data, len, valid_bits)
+
+    async def wait_for_rx(self, timeout=None):
+        return await self._run(self.device.wait_for_rx, timeout)
+
+    async def read_data(self, buffer):
+        return await self._run(self.device.read_data, buffer)
+
+    async def close(self):
+        '''Wait for the running call and stop the worker thread.'''
+        await self._run(self.device.close)
+        self._executor.shutdown(wait=True)
+
+
+class AsyncISO14443(AsyncPN5180):
+    '''Awaitable counterpart of a Protocol.ISO14443 object.'''
+
+    async def setup_rf(self):
+        return await self._run(self.device.setup_rf)
+
+    async def mifare_activate_type_A(self, buffer, kind):
+        return await self._run(self.device.mifare_activate_type_A, buffer, kind)
+
+    async def inventory_type_A(self, max_tags=16):
+        return await self._run(self.device.inventory_type_A, max_tags)
+
+    async def read_sectors(self, sectors, *args):
+        return await self._run(self.device.read_sectors, sectors, *args)
+
+    async def dump(self, *args):
+        return await self._run(self.device.dump, *args)
+
+    async def read_card_serial(self, buffer):
+        return await self._run(self.device.read_card_serial, buffer)
+
+    async def is_card_present(self):
+        return await self._run(self.device.is_card_present)
+
+    async def tags(self, interval=0.1, misses=2):
+        '''Poll for cards every 'interval' seconds and yield TagEvent(kind, uid, timestamp).
+
+        The cycles are those of Polling.TagPoller: TAG_ARRIVED is yielded when a new UID is
+        read, TAG_DEPARTED once the card was not seen in 'misses' consecutive polls. The
+        timestamp is time.monotonic() of the poll that detected the change. Like
+        TagPoller.run() the field is switched on first and a failing cycle takes the next
+        step of the poller's RecoveryPolicy, the iteration goes on.'''
+
+        poller = TagPoller(self.device, interval=interval, misses=misses)
+        try:
+            await self._run(poller.setup)
+        except PN5180Error as error:
+            poller.recovery.failed(error)
+        next_cycle = time.monotonic()
+        while True:
+            for event in await self._run(poller.cycle):
+                yield event
+            next_cycle += interval
+            delay = next_cycle - time.monotonic()
+            if (delay <= 0):
+                next_cycle = time.monotonic()
+            await asyncio.sleep(max(0, delay))
@@ -0,0 +1,289 @@
+# Name:         PN5180 Python Library
+# Description:  Benchmark suite of the PN5180 host interface and the tag reads.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+# Usage:
+#   python Benchmark.py                          Simulated PN5180 running at hardware pace
+#   python Benchmark.py --hardware               PN5180 wired as in Transport.py (PN5180_*)
+#   python Benchmark.py --json result.json       Write the results as JSON ('-': to stdout,
+#                                                the report and comparison go to stderr)
+#   python Benchmark.py --baseline result.json   Compare with stored results, exit status 1
+#                                                on a regression beyond --tolerance
+#   python Benchmark.py --handshake              Also compare the safe and fast handshake
+#   python Benchmark.py --spi-hz 1000000         SPI clock of both targets, default 7 MHz
+#
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import PN5180
+from PN5180 import regs, NoTag, CollisionError
+from Metrics import Metrics
+from Protocol import ISO14443
+from Transport import RPiTransport, SpiProfile
+from Transport import PN5180_SPI_BUS, PN5180_SPI_DEV, PN5180_NNS, PN5180_BUSY, PN5180_RST, PN5180_IRQ
+
+# Tags of the simulated runs, one per UID size
+SIMULATED_UIDS = (bytes([0x08, 0x11, 0x22, 0x33]),
+                  bytes([0x04, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66]),
+                  bytes([0x04, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x77, 0x88, 0x99]))
+
+
+def _samples(fn, count, after):
+    '''Durations of fn() in microseconds, after() runs between the calls, not timed.'''
+    samples = []
+    for i in range(count):
+        started = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - started) / 1000)
+        if after is not None:
+            after()
+    return samples
+
+
+def measure(fn, count, after=None):
+    '''Median and maximum duration of fn() in microseconds.'''
+    samples = _samples(fn, count, after)
+    return statistics.median(samples), max(samples)
+
+
+def latency(fn, count, after=None):
+    '''Latency of fn() in us: median, 95th percentile and maximum.'''
+    samples = sorted(_samples(fn, count, after))
+    return {'median_us': statistics.median(samples),
+            'p95_us': samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+            'max_us': samples[-1]}
+
+
+def bench_registers(nfc, count):
+    return {
+        'read_register': latency(lambda: nfc.read_register(regs._RF_STATUS), count),
+        'write_register': latency(lambda: nfc.write_register(regs._IRQ_CLEAR, 0), count),
+        'write_register_or_mask': latency(lambda: nfc.write_register_with_or_mask(regs._CRC_RX_CONFIG, 0x01), count),
+    }
+
+
+def bench_eeprom(nfc, count):
+    '''Whole EEPROM (255 bytes) per READ_EEPROM.'''
+    eeprom = bytearray(255)
+    result = latency(lambda: nfc.read_eeprom(0, eeprom), count)
+    result['bytes_per_s'] = len(eeprom) / (result['median_us'] / 1e6)
+    return result
+
+
+def _activate(nfc):
+    '''WUPA activation of the tag in the field, the UID length, 0 without a tag.'''
+    try:
+        return len(nfc.activate_type_A(1).uid)
+    except (NoTag, CollisionError):
+        return 0
+
+
+def bench_activation(nfc, count):
+    '''activate_type_A latency of the tag in the field, then the host commands and SPI
+    bytes per activation (counted in a second pass, with Metrics attached). The HLTA that
+    lets WUPA find the tag again is not part of the activation.
+    Returns (UID length, result), UID length 0 without a tag.'''
+    uid_length = _activate(nfc)
+    if (uid_length == 0):
+        return 0, None
+    nfc.mifare_halt()
+    result = latency(lambda: _activate(nfc), count, nfc.mifare_halt)
+
+    metrics = nfc.metrics = Metrics()
+    for i in range(count):
+        _activate(nfc)
+        nfc.metrics = None
+        nfc.mifare_halt()
+        nfc.metrics = metrics
+    nfc.metrics = None
+    result['commands'] = sum(h.count for h in metrics.commands.values()) / count
+    result['spi_bytes_out'] = metrics.spi_bytes_out / count
+    result['spi_bytes_in'] = metrics.spi_bytes_in / count
+    return uid_length, result
+
+
+def bench_sustained(nfc, seconds):
+    '''UIDs read per second in a loop of activations and HLTAs for 'seconds' seconds, and
+    the median duration of one loop, steadier from run to run than the rate.'''
+    reads = failures = 0
+    cycles = []
+    started = time.perf_counter()
+    while (time.perf_counter() - started < seconds):
+        cycle = time.perf_counter_ns()
+        if _activate(nfc):
+            reads += 1
+            nfc.mifare_halt()   # WUPA wakes it up again
+        else:
+            failures += 1
+        cycles.append((time.perf_counter_ns() - cycle) / 1000)
+    elapsed = time.perf_counter() - started
+    return {'uids_per_s': reads / elapsed, 'cycle_median_us': statistics.median(cycles),
+            'failures': failures}
+
+
+def bench_handshake(nfc, count):
+    '''Safe against fast handshake, median us per command.'''
+    eeprom = bytearray(2)
+    cases = [
+        ("READ_REGISTER", lambda: nfc.read_register(regs._RF_STATUS), None),
+        ("WRITE_REGISTER", lambda: nfc.write_register(regs._IRQ_CLEAR, 0), None),
+        ("WRITE_REGISTER_OR_MASK", lambda: nfc.write_register_with_or_mask(regs._CRC_RX_CONFIG, 0x01), None),
+        ("READ_EEPROM (2 bytes)", lambda: nfc.read_eeprom(PN5180._PRODUCT_VERSION, eeprom), None),
+        ("activate_type_A", lambda: _activate(nfc), nfc.mifare_halt),
+    ]
+    result = {}
+    for handshake in (PN5180.PN5180.HANDSHAKE_SAFE, PN5180.PN5180.HANDSHAKE_FAST):
+        nfc.handshake = handshake
+        for name, fn, after in cases:
+            result.setdefault(name, {})[handshake + '_median_us'] = measure(fn, count, after)[0]
+    nfc.handshake = PN5180.PN5180.HANDSHAKE_FAST
+    return result
+
+
+def run(args):
+    sim = None
+    if args.hardware:
+        transport = RPiTransport(PN5180_SPI_BUS, PN5180_SPI_DEV, PN5180_NNS, PN5180_BUSY, PN5180_RST, PN5180_IRQ,
+                                 profile=SpiProfile(args.spi_hz))
+    else:
+        from Simulator import SimulatedPN5180, ISO14443ATag
+        # Same SPI clock as on the hardware, without one the transfers would take no time
+        transport = sim = SimulatedPN5180()
+        sim.set_speed(args.spi_hz)
+    nfc = ISO14443(PN5180_SPI_BUS, PN5180_SPI_DEV, PN5180_NNS, PN5180_BUSY, PN5180_RST, PN5180_IRQ,
+                   transport=transport)
+    nfc.begin()
+    nfc.reset()
+    # setup_rf() without its messages, the JSON may go to stdout
+    nfc.load_rf_config(0x00, 0x80)
+    nfc.set_rf_on()
+
+    results = {'meta': {'target': 'hardware' if args.hardware else 'simulator', 'count': args.count,
+                        'spi_hz': args.spi_hz,
+                        'python': platform.python_version(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}}
+    results['registers'] = bench_registers(nfc, args.count)
+    results['read_eeprom'] = bench_eeprom(nfc, args.count)
+
+    # The simulator runs each UID size, on hardware the tag on the antenna is measured
+    results['activation'] = {}
+    results['sustained'] = {}
+    for uid in (SIMULATED_UIDS if sim else (None,)):
+        if sim:
+            sim.tags = [ISO14443ATag(uid)]
+        uid_length, result = bench_activation(nfc, args.count)
+        if result is not None:
+            results['activation']['uid{}'.format(uid_length)] = result
+            results['sustained']['uid{}'.format(uid_length)] = bench_sustained(nfc, args.seconds)
+    if not results['activation']:
+        print("*** ERROR: No tag in the field, activation not measured!", file=sys.stderr)
+
+    if args.handshake:
+        results['handshake'] = bench_handshake(nfc, args.count)
+    nfc.close()
+    return results
+
+
+def _flatten(results, prefix=''):
+    '''{'a': {'b': 1}} -> {'a.b': 1}, numbers only.'''
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix + key + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+# Metrics judged by compare(), p95 and maximum latencies and the sustained UIDs/s (one
+# run, any stall counts) are too noisy for a verdict; the medians stand in for them
+COMPARED = ('median_us', 'commands', 'spi_bytes_out', 'spi_bytes_in', 'bytes_per_s')
+
+
+def compare(results, baseline, tolerance, out=sys.stdout):
+    '''Print the COMPARED metrics of both runs to 'out' and return the names of the
+    regressions: latencies, commands and bytes higher, throughput lower than the baseline
+    by more than 'tolerance'.'''
+    current, stored = _flatten(results), _flatten(baseline)
+    regressions = []
+    print("\n{:<44} {:>12} {:>12} {:>8}".format("metric", "baseline", "current", "change"), file=out)
+    for name in sorted(set(current) & set(stored)):
+        if (not name.endswith(COMPARED)):
+            continue
+        old, new = stored[name], current[name]
+        change = (new - old) / old if old else 0.0
+        higher_is_better = name.endswith('bytes_per_s')
+        worse = -change if higher_is_better else change
+        flag = ''
+        if (worse > tolerance):
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print("{:<44} {:>12.1f} {:>12.1f} {:>+7.1f}%{}".format(name, old, new, 100 * change, flag), file=out)
+    return regressions
+
+
+def report(results, out=sys.stdout):
+    print("\n{:<28} {:>12} {:>12} {:>12}".format("[us]", "median", "p95", "max"), file=out)
+    rows = [('registers.' + name, r) for name, r in results['registers'].items()]
+    rows.append(('read_eeprom (255 bytes)', results['read_eeprom']))
+    rows += [('activation.' + name, r) for name, r in results['activation'].items()]
+    for name, r in rows:
+        print("{:<28} {:>12.1f} {:>12.1f} {:>12.1f}".format(name, r['median_us'], r['p95_us'], r['max_us']), file=out)
+    print("\nread_eeprom: {:.0f} bytes/s".format(results['read_eeprom']['bytes_per_s']), file=out)
+    for name, r in results['activation'].items():
+        sustained = results['sustained'][name]
+        print("{}: {:.1f} commands, {:.0f} bytes out, {:.0f} bytes in per activation, {:.1f} UIDs/s"
+              .format(name, r['commands'], r['spi_bytes_out'], r['spi_bytes_in'], sustained['uids_per_s']), file=out)
+    if 'handshake' in results:
+        print("\n{:<24} {:>14} {:>14} {:>8}".format("command [us, median]", "safe", "fast", "speedup"), file=out)
+        for name, r in results['handshake'].items():
+            safe, fast = r['safe_median_us'], r['fast_median_us']
+            print("{:<24} {:>14.0f} {:>14.0f} {:>7.1f}x".format(name, safe, fast, safe / fast), file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of the PN5180 host interface and the tag reads.")
+    parser.add_argument('--hardware', action='store_true', help="use the PN5180 on the SPI bus")
+    parser.add_argument('-n', '--count', type=int, default=50, help="repetitions per measurement")
+    parser.add_argument('--seconds', type=float, default=2.0, help="duration of the sustained read test")
+    parser.add_argument('--handshake', action='store_true', help="compare the safe and fast handshake")
+    parser.add_argument('--spi-hz', type=int, default=7000000,
+                        help="SPI clock in Hz, also of the simulator (default 7000000, the PN5180 maximum)")
+    parser.add_argument('--json', metavar='FILE', help="write the results as JSON ('-' for stdout)")
+    parser.add_argument('--baseline', metavar='FILE', help="compare with the results in FILE")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed regression of the medians (default 0.25, run to run noise stays below)")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    out = sys.stdout
+    if (args.json == '-'):
+        json.dump(results, sys.stdout, indent=1)
+        print()
+        out = sys.stderr    # Keep stdout parseable
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    report(results, out)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, out)
+        if regressions:
+            print("\n{} regression(s) beyond {:.0f}%".format(len(regressions), 100 * args.tolerance), file=out)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,510 @@
+# Name:         PN5180 Python Library
+# Description:  Reader daemon: owns the PN5180 readers and serves tag events and
+#               commands to any number of local clients over a Unix socket.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+# Usage:
+#   python Daemon.py                    PN5180 wired as in Transport.py (PN5180_*)
+#   python Daemon.py --simulate         Simulated PN5180 with one tag
+#   python Daemon.py --socket PATH      Socket path, default /tmp/pn5180.sock
+#
+
+import argparse
+import errno
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from PN5180 import PN5180Error, NoTag
+from Polling import TagEvent, TAG_ARRIVED, TAG_DEPARTED
+from Protocol import ISO14443, ISO14443_4, NTAG
+from ReaderPool import ReaderPool
+from Transport import PN5180_SPI_BUS, PN5180_SPI_DEV, PN5180_NNS, PN5180_BUSY, PN5180_RST, PN5180_IRQ
+
+# Wire format, both directions: _HEADER (body length, message type), then the body.
+# Strings are a 2 byte length (little endian) followed by UTF-8, byte strings a 2 byte
+# length and the bytes.
+#   EVENT   daemon -> client : _EVENT (kind 0 arrived / 1 departed, timestamp as
+#                              time.monotonic() of the daemon), reader, technology, uid
+#   COMMAND client -> daemon : _COMMAND (request id, command), reader, then the arguments
+#   RESULT  daemon -> client : _RESULT (request id, status 0 ok / 1 error), then the data
+#                              or the UTF-8 error message
+EVENT, COMMAND, RESULT = range(1, 4)
+_HEADER = struct.Struct('<IB')
+_EVENT = struct.Struct('<Bd')
+_COMMAND = struct.Struct('<IB')
+_RESULT = struct.Struct('<IB')
+_LENGTH = struct.Struct('<H')
+_KINDS = (TAG_ARRIVED, TAG_DEPARTED)
+MAX_MESSAGE = 4096              # Longest body a client may send
+
+# Commands and their arguments
+CMD_READ_EEPROM = 0x01          # address, length -> EEPROM bytes of the reader
+CMD_NTAG_READ = 0x02            # first page, number of pages -> page data
+CMD_MIFARE_READ = 0x03          # sector -> sector data, read with the default keys
+CMD_APDU = 0x04                 # command APDU -> response APDU of an ISO14443-4 card
+
+
+class DaemonError(Exception):
+    '''A command failed in the daemon, the message is the one the daemon sent.'''
+
+
+def _bytes(data):
+    return _LENGTH.pack(len(data)) + data
+
+
+def _string(text):
+    '''None as empty string, other names (e.g. the int names of a ReaderPool) as str().'''
+    return _bytes(('' if text is None else str(text)).encode('utf-8'))
+
+
+def _take_string(body, offset):
+    length, = _LENGTH.unpack_from(body, offset)
+    start = offset + _LENGTH.size
+    if (start + length > len(body)):
+        raise IndexError("String beyond the end of the message")
+    return bytes(body[start:start + length]), start + length
+
+
+def _message(kind, body):
+    return _HEADER.pack(len(body), kind) + body
+
+
+def encode_event(event):
+    uid = bytes(event.uid)
+    return _message(EVENT, _EVENT.pack(_KINDS.index(event.kind), event.timestamp) +
+                    _string(event.reader) + _string(event.technology) + _bytes(uid))
+
+
+def decode_event(body):
+    kind, timestamp = _EVENT.unpack_from(body)
+    reader, offset = _take_string(body, _EVENT.size)
+    technology, offset = _take_string(body, offset)
+    uid, offset = _take_string(body, offset)
+    return TagEvent(_KINDS[kind], uid, timestamp, reader.decode('utf-8'), technology.decode('utf-8') or None)
+
+
+# ------------------------------------
+#       Commands, run on the polling thread of the reader
+
+def _read_eeprom(reader, args):
+    addr, length = struct.unpack('<BB', args)
+    buffer = bytearray(length)
+    if (not reader.read_eeprom(addr, buffer)):
+        raise PN5180Error("READ_EEPROM failed")
+    return bytes(buffer)
+
+
+def _ntag_read(reader, args):
+    first, count = struct.unpack('<BB', args)
+    ntag = NTAG(reader)
+    try:
+        if (not ntag.activate()):
+            raise NoTag("No NTAG/Ultralight in the field")
+        data = ntag.read_pages(first, count)
+    finally:
+        reader.mifare_halt()    # The poller finds the tag with WUPA again
+    if (data is None):
+        raise PN5180Error("Reading pages {}-{} failed".format(first, first + count - 1))
+    return data
+
+
+def _mifare_read(reader, args):
+    sector, = struct.unpack('<B', args)
+    data = reader.read_sectors((sector,)).get(sector)
+    if (data is None):
+        raise PN5180Error("Sector {} could not be read".format(sector))
+    return data
+
+
+def _apdu(reader, args):
+    session = ISO14443_4(reader)
+    if (session.activate() is None):
+        reader.mifare_halt()    # A tag without ISO14443-4 stays selected
+        raise NoTag("No ISO14443-4 card in the field")
+    try:
+        response = session.transceive_apdu(bytes(args))
+    finally:
+        session.deselect()
+    if (response is None):
+        raise PN5180Error("APDU exchange failed")
+    return response
+
+
+COMMANDS = {CMD_READ_EEPROM: _read_eeprom, CMD_NTAG_READ: _ntag_read,
+            CMD_MIFARE_READ: _mifare_read, CMD_APDU: _apdu}
+
+
+class _Client:
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.futures = set()      # Commands queued or running
+        self.closed = False
+
+
+class ReaderDaemon:
+    '''Owns the readers of a ReaderPool and serves them to local clients over a Unix socket.
+
+    Every tag event of the pool is encoded once and sent to all connected clients. Clients
+    send commands (COMMANDS), they are queued per reader and run on its polling thread
+    between two cycles, the clients are served round robin (ReaderPool.submit). A client
+    may have MAX_QUEUED commands waiting; a client that does not read its socket is
+    dropped when MAX_BUFFERED bytes are waiting for it, so it can't stall the others.
+
+    One thread handles all sockets with a selector, one forwards the events.'''
+
+    MAX_QUEUED = 32
+    MAX_BUFFERED = 1 << 20
+
+    def __init__(self, pool, path):
+        self.pool = pool
+        self.path = path
+        self.clients = {}         # socket -> _Client
+        self._lock = threading.Lock()
+        self._selector = None
+        self._server = None
+        self._wakeup = None       # (read, write) socketpair waking up the selector
+        self._threads = []
+        self._running = False
+
+    def start(self):
+        '''Listen on the socket and start the polling, the socket and the event thread.'''
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except ConnectionRefusedError:
+                os.unlink(self.path)  # Left over by a daemon that died
+            else:
+                raise OSError(errno.EADDRINUSE, "A daemon is serving on {} already".format(self.path))
+            finally:
+                probe.close()
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(16)
+        self._server.setblocking(False)
+        self._wakeup = socket.socketpair()
+        self._wakeup[0].setblocking(False)
+        self._wakeup[1].setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._server, selectors.EVENT_READ)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+
+        self._running = True
+        self.pool.start()
+        for target, name in ((self._serve, 'PN5180-daemon'), (self._forward_events, 'PN5180-events')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        '''Stop serving, disconnect the clients and stop the polling.'''
+        self._running = False
+        self._wake()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.pool.stop()
+        for client in list(self.clients.values()):
+            self._close(client)
+        self._selector.close()
+        self._server.close()
+        for sock in self._wakeup:
+            sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _wake(self):
+        try:
+            self._wakeup[1].send(b'\0')
+        except (BlockingIOError, OSError):
+            pass    # A wake-up is pending already
+
+    def _forward_events(self):
+        while self._running:
+            event = self.pool.get_event(0.2)
+            if (event is None):
+                continue
+            try:
+                message = encode_event(event)
+            except Exception as error:  # A broken event must not stop the forwarding
+                print("*** ERROR: Event {} not forwarded: {}".format(event, error))
+                continue
+            with self._lock:
+                clients = list(self.clients.values())
+            for client in clients:
+                self._send(client, message)
+
+    def _send(self, client, message):
+        '''Queue a message for a client. The socket is written right away if nothing is
+        waiting for it, else the selector thread writes it when the client reads.'''
+        with self._lock:
+            if client.closed:
+                return
+            if (not client.outbox):
+                try:
+                    sent = client.sock.send(message)
+                except BlockingIOError:
+                    sent = 0
+                except OSError:
+                    sent = len(message)   # Gone, the selector thread closes it
+                message = message[sent:]
+                if (not message):
+                    return
+            client.outbox += message
+            if (len(client.outbox) > self.MAX_BUFFERED):
+                client.outbox = bytearray()
+                client.closed = True      # Too slow, dropped by the selector thread
+        self._wake()
+
+    def _serve(self):
+        while self._running:
+            for key, mask in self._selector.select():
+                if (key.fileobj is self._server):
+                    self._accept()
+                elif (key.fileobj is self._wakeup[0]):
+                    try:
+                        self._wakeup[0].recv(4096)
+                    except BlockingIOError:
+                        pass
+                else:
+                    client = key.data
+                    if (mask & selectors.EVENT_READ):
+                        self._receive(client)
+                    if (mask & selectors.EVENT_WRITE) and (not client.closed):
+                        self._flush(client)
+            self._update()
+
+    def _accept(self):
+        try:
+            sock, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client = _Client(sock)
+        with self._lock:
+            self.clients[sock] = client
+        self._selector.register(sock, selectors.EVENT_READ, client)
+
+    def _update(self):
+        '''Close the dropped clients, select the others for writing while data waits.'''
+        with self._lock:
+            clients = list(self.clients.values())
+        for client in clients:
+            if client.closed:
+                self._close(client)
+                continue
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outbox else 0)
+            if (self._selector.get_key(client.sock).events != events):
+                self._selector.modify(client.sock, events, client)
+
+    def _flush(self, client):
+        with self._lock:
+            try:
+                sent = client.sock.send(client.outbox)
+            except BlockingIOError:
+                return
+            except OSError:
+                client.closed = True
+                return
+            del client.outbox[:sent]
+
+    def _close(self, client):
+        with self._lock:
+            client.closed = True
+            self.clients.pop(client.sock, None)
+            futures = list(client.futures)
+        for future in futures:
+            future.cancel()       # Queued commands of a gone client are not run
+        try:
+            self._selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+    def _receive(self, client):
+        try:
+            data = client.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if (not data):
+            client.closed = True
+            return
+        client.inbox += data
+        while (len(client.inbox) >= _HEADER.size):
+            length, kind = _HEADER.unpack_from(client.inbox)
+            if (length > MAX_MESSAGE) or (kind != COMMAND):
+                client.closed = True      # Not a client of this protocol
+                return
+            if (len(client.inbox) < _HEADER.size + length):
+                return
+            body = bytes(client.inbox[_HEADER.size:_HEADER.size + length])
+            del client.inbox[:_HEADER.size + length]
+            self._command(client, body)
+
+    def _command(self, client, body):
+        try:
+            request, command = _COMMAND.unpack_from(body)
+            name, offset = _take_string(body, _COMMAND.size)
+            name = name.decode('utf-8')
+        except (struct.error, IndexError, UnicodeDecodeError):
+            client.closed = True
+            return
+        handler = COMMANDS.get(command)
+        name = {str(key): key for key in self.pool.readers}.get(name, name)  # Reader names as sent in the events
+        if (handler is None) or (name not in self.pool.readers):
+            self._result(client, request, None, "Unknown command 0x{:02x} or reader '{}'".format(command, name))
+            return
+        if (len(client.futures) >= self.MAX_QUEUED):
+            self._result(client, request, None, "Too many queued commands")
+            return
+        args = body[offset:]
+        future = self.pool.submit(name, lambda reader: handler(reader, args), client=client)
+        with self._lock:
+            client.futures.add(future)
+        future.add_done_callback(lambda done: self._finished(client, request, done))
+
+    def _finished(self, client, request, future):
+        with self._lock:
+            client.futures.discard(future)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if (error is None):
+            self._result(client, request, future.result(), None)
+        else:
+            self._result(client, request, None, str(error) or type(error).__name__)
+
+    def _result(self, client, request, data, error):
+        if (error is None):
+            body = _RESULT.pack(request, 0) + bytes(data)
+        else:
+            body = _RESULT.pack(request, 1) + error.encode('utf-8')
+        self._send(client, _message(RESULT, body))
+
+
+class DaemonClient:
+    '''Connection to a ReaderDaemon. Events that arrive while a command waits for its
+    result are kept for get_event(). Not thread safe, use one client per thread.'''
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self._inbox = bytearray()
+        self._events = deque()
+        self._results = {}
+        self._next_request = 1
+
+    def close(self):
+        self.sock.close()
+
+    def _read(self, deadline):
+        '''Receive one message and file it, False if none came before 'deadline'.'''
+        while (len(self._inbox) < _HEADER.size) or \
+                (len(self._inbox) < _HEADER.size + _HEADER.unpack_from(self._inbox)[0]):
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if (timeout is not None) and (timeout <= 0):
+                return False
+            self.sock.settimeout(timeout)
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                return False
+            if (not data):
+                raise ConnectionError("Daemon closed the connection")
+            self._inbox += data
+        length, kind = _HEADER.unpack_from(self._inbox)
+        body = bytes(self._inbox[_HEADER.size:_HEADER.size + length])
+        del self._inbox[:_HEADER.size + length]
+        if (kind == EVENT):
+            self._events.append(decode_event(body))
+        elif (kind == RESULT):
+            request, status = _RESULT.unpack_from(body)
+            self._results[request] = (status, body[_RESULT.size:])
+        return True
+
+    def get_event(self, timeout=None):
+        '''Next TagEvent, None if none came within 'timeout' seconds.'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while (not self._events):
+            if (not self._read(deadline)):
+                return None
+        return self._events.popleft()
+
+    def command(self, reader, command, args=b'', timeout=5.0):
+        '''Run a command on the reader named 'reader', returns its data (bytes).
+        Raises DaemonError if it failed, TimeoutError without a result in 'timeout' s.'''
+        request = self._next_request
+        self._next_request = (request + 1) & 0xFFFFFFFF
+        body = _COMMAND.pack(request, command) + _string(reader) + bytes(args)
+        self.sock.settimeout(None)
+        self.sock.sendall(_message(COMMAND, body))
+        deadline = time.monotonic() + timeout
+        while (request not in self._results):
+            if (not self._read(deadline)):
+                raise TimeoutError("No result for command 0x{:02x}".format(command))
+        status, data = self._results.pop(request)
+        if (status):
+            raise DaemonError(data.decode('utf-8'))
+        return data
+
+    def read_eeprom(self, reader, addr, length):
+        return self.command(reader, CMD_READ_EEPROM, bytes((addr, length)))
+
+    def ntag_read(self, reader, first, count):
+        return self.command(reader, CMD_NTAG_READ, bytes((first, count)))
+
+    def mifare_read(self, reader, sector):
+        return self.command(reader, CMD_MIFARE_READ, bytes((sector,)))
+
+    def apdu(self, reader, apdu):
+        return self.command(reader, CMD_APDU, apdu)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PN5180 reader daemon serving tag events and commands.")
+    parser.add_argument('--socket', default='/tmp/pn5180.sock', help="Unix socket path")
+    parser.add_argument('--simulate', action='store_true', help="run a simulated PN5180 with one tag")
+    args = parser.parse_args()
+
+    pool = ReaderPool()
+    if args.simulate:
+        from Simulator import SimulatedPN5180, ISO14443ATag
+        transport = SimulatedPN5180([ISO14443ATag(bytes([0x04, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66]))])
+        pool.add_reader('reader0', ISO14443(PN5180_SPI_BUS, PN5180_SPI_DEV, PN5180_NNS, PN5180_BUSY,
+                                            PN5180_RST, PN5180_IRQ, transport=transport))
+    else:
+        pool.open('reader0', PN5180_SPI_BUS, PN5180_SPI_DEV, PN5180_NNS, PN5180_BUSY, PN5180_RST, PN5180_IRQ)
+    failed = pool.begin()
+    if failed:
+        print("*** ERROR: Readers {} did not start!".format(', '.join(failed)))
+        return 1
+
+    daemon = ReaderDaemon(pool, args.socket)
+    daemon.start()
+    print("Serving on {}".format(args.socket))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+        pool.close()
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+# Name:         PN5180 Python Library
+# Description:  EEPROM snapshot of a PN5180, decoded and cached per die identifier.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import json
+import os
+
+import PN5180
+
+EEPROM_SIZE = 255               # Addresses 0 to 254
+_READ_ONLY_END = 0x16           # Die identifier and versions, 0x00 - 0x15
+
+# Further EEPROM addresses (datasheet, EEPROM address map)
+_IDLE_IRQ_AFTER_BOOT = 0x16
+_XTAL_BOOT_TIME = 0x18
+_MISO_PULLUP_ENABLE = 0x1B
+_CLOCK_CONFIG = 0x30
+_MFC_AUTH_TIMEOUT = 0x32
+
+_cache = {}   # die identifier -> DeviceInfo of the chips read by this process
+
+
+class DeviceInfo:
+    '''Snapshot of the PN5180 EEPROM (addresses 0 to 254) with the fields decoded.
+
+    The fields are decoded from 'eeprom' on access. PN5180.write_eeprom() patches the
+    snapshot of the reader it is attached to, so the fields follow the writes.'''
+
+    def __init__(self, eeprom):
+        if (len(eeprom) != EEPROM_SIZE):
+            raise ValueError("EEPROM snapshot must be {} bytes long".format(EEPROM_SIZE))
+        self.eeprom = bytearray(eeprom)
+
+    def _version(self, addr):
+        return (self.eeprom[addr + 1], self.eeprom[addr])   # (major, minor)
+
+    def _u16(self, addr):
+        return int.from_bytes(self.eeprom[addr:addr + 2], byteorder='little')
+
+    @property
+    def die_id(self):
+        return bytes(self.eeprom[PN5180._DIE_IDENTIFIER:PN5180._DIE_IDENTIFIER + 16])
+
+    @property
+    def product_version(self):
+        return self._version(PN5180._PRODUCT_VERSION)
+
+    @property
+    def firmware_version(self):
+        return self._version(PN5180._FIRMWARE_VERSION)
+
+    @property
+    def eeprom_version(self):
+        return self._version(PN5180._EEPROM_VERSION)
+
+    @property
+    def idle_irq_after_boot(self):
+        return bool(self.eeprom[_IDLE_IRQ_AFTER_BOOT] & 0x01)
+
+    @property
+    def xtal_boot_time(self):
+        return self._u16(_XTAL_BOOT_TIME)
+
+    @property
+    def irq_pin_active_high(self):
+        return bool(self.eeprom[PN5180._IRQ_PIN_CONFIG] & 0x01)
+
+    @property
+    def miso_pullup(self):
+        return self.eeprom[_MISO_PULLUP_ENABLE]
+
+    @property
+    def clock_config(self):
+        return self.eeprom[_CLOCK_CONFIG]
+
+    @property
+    def mfc_auth_timeout(self):
+        return self._u16(_MFC_AUTH_TIMEOUT)
+
+    @property
+    def lpcd_reference_value(self):
+        return self._u16(PN5180._LPCD_REFERENCE_VALUE)
+
+    @property
+    def lpcd_field_on_time(self):
+        return self.eeprom[PN5180._LPCD_FIELD_ON_TIME]
+
+    @property
+    def lpcd_threshold(self):
+        return self.eeprom[PN5180._LPCD_THRESHOLD]
+
+    @property
+    def lpcd_mode(self):
+        return self.eeprom[PN5180._LPCD_REFVAL_GPO_CONTROL]
+
+    def __repr__(self):
+        return ("DeviceInfo(die_id={}, product={}.{}, firmware={}.{}, eeprom={}.{})"
+                .format(self.die_id.hex(), *self.product_version, *self.firmware_version,
+                        *self.eeprom_version))
+
+    def save(self, path):
+        '''Add the snapshot to the cache file 'path' (JSON, die identifier -> EEPROM).
+        The file is replaced atomically.'''
+        snapshots = _load_file(path)
+        snapshots[self.die_id.hex()] = self.eeprom.hex()
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshots, f, indent=1)
+        os.replace(tmp, path)
+
+
+def _load_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def read_device_info(reader, cache_path=None, verify=True):
+    '''DeviceInfo of the chip behind 'reader', also stored in reader.device_info. The IRQ
+    polarity of the reader's transport is set to the one configured in the EEPROM.
+
+    Without a cached snapshot the whole EEPROM is read with one READ_EEPROM. A snapshot is
+    cached per die identifier in this process and, with 'cache_path', in a file. With
+    verify=True the die identifier is read (one READ_EEPROM of 16 bytes) to find the
+    snapshot; verify=False uses the snapshot of a file holding exactly one chip without any
+    EEPROM access, for warm restarts of a device with a single PN5180.
+    Returns None if the EEPROM could not be read.'''
+
+    if (reader.device_info is not None):
+        return reader.device_info
+    snapshots = _load_file(cache_path) if cache_path else {}
+
+    info = None
+    if (not verify) and (len(snapshots) == 1):
+        info = _cache.get(bytes.fromhex(next(iter(snapshots))))
+        if (info is None):
+            info = DeviceInfo(bytes.fromhex(next(iter(snapshots.values()))))
+    elif (_cache or snapshots):
+        die_id = bytearray(16)
+        if (not reader.read_eeprom(PN5180._DIE_IDENTIFIER, die_id)):
+            return None
+        info = _cache.get(bytes(die_id))
+        if (info is None) and (die_id.hex() in snapshots):
+            info = DeviceInfo(bytes.fromhex(snapshots[die_id.hex()]))
+
+    if (info is None):
+        eeprom = bytearray(EEPROM_SIZE)
+        if (not reader.read_eeprom(0, eeprom)):
+            return None
+        info = DeviceInfo(eeprom)
+        if (cache_path):
+            info.save(cache_path)
+    _cache[info.die_id] = info
+    reader.device_info = info
+    reader._transport.set_irq_polarity(info.irq_pin_active_high)
+    return info
+
+
+def provision(reader, changes, cache_path=None):
+    '''Write EEPROM settings, changes = {address: int or bytes}.
+
+    The content is compared with the snapshot (read_device_info) and the bytes that differ
+    are written with one WRITE_EEPROM, from the first to the last changed address; nothing
+    is written if the EEPROM holds the values already. The die identifier and the versions
+    (0x00 - 0x15) are read only. Returns True on success.'''
+
+    info = read_device_info(reader, cache_path)
+    if (info is None):
+        return False
+    wanted = bytearray(info.eeprom)
+    for addr, value in changes.items():
+        value = bytes((value,)) if isinstance(value, int) else bytes(value)
+        if ((addr < _READ_ONLY_END) or (addr + len(value) > EEPROM_SIZE)):
+            print("ERROR: EEPROM address 0x{:02x} can not be provisioned!\n".format(addr))
+            return False
+        wanted[addr:addr + len(value)] = value
+
+    changed = [addr for addr in range(EEPROM_SIZE) if wanted[addr] != info.eeprom[addr]]
+    if (not changed):
+        return True
+    first, last = changed[0], changed[-1]
+    if (not reader.write_eeprom(first, wanted[first:last + 1])):
+        return False
+    if (cache_path):
+        info.save(cache_path)
+    return True
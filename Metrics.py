@@ -0,0 +1,190 @@
+# Name:         PN5180 Python Library
+# Description:  Instrumentation of the PN5180 host interface: counters, latency
+#               histograms, hooks and Prometheus text export.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import bisect
+import threading
+import time
+
+import PN5180
+
+# Opcode -> command name, from the _PN5180_* constants
+COMMAND_NAMES = {value: name[len('_PN5180_'):] for name, value in vars(PN5180).items()
+                 if name.startswith('_PN5180_') and isinstance(value, int)}
+
+# Upper bounds of the latency histogram buckets, in ns (10 us to 1 s, then +Inf)
+BUCKETS_NS = (10000, 20000, 50000, 100000, 200000, 500000, 1000000, 2000000, 5000000,
+              10000000, 20000000, 50000000, 100000000, 1000000000)
+
+
+class Histogram:
+    '''Latency histogram with fixed buckets (BUCKETS_NS), sum and count in ns.'''
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_NS) + 1)
+        self.sum_ns = 0
+        self.count = 0
+
+    def add(self, ns):
+        self.buckets[bisect.bisect_left(BUCKETS_NS, ns)] += 1
+        self.sum_ns += ns
+        self.count += 1
+
+    def quantile(self, q):
+        '''Upper bound in ns of the bucket holding the q-quantile, None if empty.'''
+        if (self.count == 0):
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if (seen >= rank):
+                return BUCKETS_NS[i] if i < len(BUCKETS_NS) else float('inf')
+        return float('inf')
+
+
+class Metrics:
+    '''Instrumentation of one or more PN5180 objects, enabled with nfc.metrics = Metrics().
+
+    Per host command (opcode): count, failures (BUSY timeouts) and a latency histogram of
+    transceive_command. Further: time spent waiting for BUSY and the part of it slept (the
+    fixed delays of the safe handshake and of reset() count as both), SPI bytes written
+    and read, IRQ waits and their timeouts, and the phases of the Type A activation
+    (request incl. the configuration, anticollision, select).
+
+    Hooks are called as hook(kind, name, duration_ns, ok) for every recorded event,
+    kind is 'command', 'irq' or 'phase'. With nfc.metrics = None (default) the library
+    only tests that attribute.'''
+
+    def __init__(self):
+        self.commands = {}        # opcode -> Histogram
+        self.failures = {}        # opcode -> BUSY timeouts
+        self.irq_waits = Histogram()
+        self.irq_timeouts = 0
+        self.phases = {}          # phase name -> Histogram
+        self.busy_wait_ns = 0
+        self.sleep_ns = 0
+        self.spi_bytes_out = 0    # Host -> PN5180
+        self.spi_bytes_in = 0     # PN5180 -> host
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _notify(self, kind, name, duration_ns, ok):
+        for hook in self.hooks:
+            hook(kind, name, duration_ns, ok)
+
+    # ------------------------------------
+    #       Recording, called by PN5180
+
+    def command(self, opcode, duration_ns, ok, bytes_out, bytes_in):
+        with self._lock:
+            histogram = self.commands.get(opcode)
+            if (histogram is None):
+                histogram = self.commands[opcode] = Histogram()
+            histogram.add(duration_ns)
+            if (not ok):
+                self.failures[opcode] = self.failures.get(opcode, 0) + 1
+            self.spi_bytes_out += bytes_out
+            self.spi_bytes_in += bytes_in
+        if self.hooks:
+            self._notify('command', COMMAND_NAMES.get(opcode, hex(opcode)), duration_ns, ok)
+
+    def busy(self, waited_ns, slept_ns):
+        with self._lock:
+            self.busy_wait_ns += waited_ns
+            self.sleep_ns += slept_ns
+
+    def irq(self, duration_ns, ok):
+        with self._lock:
+            self.irq_waits.add(duration_ns)
+            if (not ok):
+                self.irq_timeouts += 1
+        if self.hooks:
+            self._notify('irq', 'wait_for_irq', duration_ns, ok)
+
+    def phase(self, name, started_ns):
+        '''Record the phase 'name' that began at started_ns (perf_counter_ns), returns the
+        current perf_counter_ns as start of the next phase.'''
+        now = time.perf_counter_ns()
+        with self._lock:
+            histogram = self.phases.get(name)
+            if (histogram is None):
+                histogram = self.phases[name] = Histogram()
+            histogram.add(now - started_ns)
+        if self.hooks:
+            self._notify('phase', name, now - started_ns, True)
+        return now
+
+    # ------------------------------------
+    #       Export
+
+    def reset(self):
+        with self._lock:
+            hooks = self.hooks
+            self.__init__()
+            self.hooks = hooks
+
+    def summary(self):
+        '''{command name: (count, failures, mean us)} of the commands seen.'''
+        with self._lock:
+            return {COMMAND_NAMES.get(op, hex(op)): (h.count, self.failures.get(op, 0), h.sum_ns / h.count / 1000)
+                    for op, h in self.commands.items()}
+
+    def prometheus(self, prefix='pn5180', labels=None):
+        '''Prometheus text exposition format of all metrics. 'labels' ({name: value}) are
+        added to every sample, e.g. {'reader': 'door'}.'''
+
+        extra = ''.join(',{}="{}"'.format(k, v) for k, v in (labels or {}).items())
+        lines = []
+
+        def family(name, kind, help):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, help))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+
+        def sample(name, label, value):
+            text = (label + extra).lstrip(',')
+            lines.append('{}_{}{} {}'.format(prefix, name, '{' + text + '}' if text else '', value))
+
+        def histogram(name, label, h):
+            seen = 0
+            for bound, n in zip(BUCKETS_NS + (None,), h.buckets):
+                seen += n
+                le = '+Inf' if bound is None else repr(bound / 1e9)
+                sample(name + '_bucket', label + ',le="{}"'.format(le), seen)
+            sample(name + '_sum', label, h.sum_ns / 1e9)
+            sample(name + '_count', label, h.count)
+
+        with self._lock:
+            family('command_duration_seconds', 'histogram', 'Host interface command latency.')
+            for op, h in sorted(self.commands.items()):
+                histogram('command_duration_seconds', 'command="{}"'.format(COMMAND_NAMES.get(op, hex(op))), h)
+            family('command_failures_total', 'counter', 'Commands aborted by a BUSY timeout.')
+            for op, n in sorted(self.failures.items()):
+                sample('command_failures_total', 'command="{}"'.format(COMMAND_NAMES.get(op, hex(op))), n)
+            family('busy_wait_seconds_total', 'counter', 'Time spent waiting for the BUSY line, incl. handshake and reset delays.')
+            sample('busy_wait_seconds_total', '', self.busy_wait_ns / 1e9)
+            family('busy_sleep_seconds_total', 'counter', 'Part of the BUSY waits spent sleeping.')
+            sample('busy_sleep_seconds_total', '', self.sleep_ns / 1e9)
+            family('spi_bytes_total', 'counter', 'Bytes moved over SPI.')
+            sample('spi_bytes_total', 'direction="out"', self.spi_bytes_out)
+            sample('spi_bytes_total', 'direction="in"', self.spi_bytes_in)
+            family('irq_wait_duration_seconds', 'histogram', 'IRQ waits.')
+            histogram('irq_wait_duration_seconds', '', self.irq_waits)
+            family('irq_timeouts_total', 'counter', 'IRQ waits that timed out.')
+            sample('irq_timeouts_total', '', self.irq_timeouts)
+            family('phase_duration_seconds', 'histogram', 'Phases of the Type A activation.')
+            for name, h in sorted(self.phases.items()):
+                histogram('phase_duration_seconds', 'phase="{}"'.format(name), h)
+        return '\n'.join(lines) + '\n'
@@ -7,25 +7,26 @@
 #       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
 #
 
-import spidev
-import RPi.GPIO as GPIO
 import time
+import struct
+from collections import namedtuple
 from enum import Enum
+from Transport import Transport, RPiTransport
 
 # PN5180 Registers
 class regs:
     _SYSTEM_CONFIG  = 0x00
-    # _IRQ_ENABLE         = 0x01
+    _IRQ_ENABLE         = 0x01
     _IRQ_STATUS = 0x02
     _IRQ_CLEAR = 0x03
-    # _TRANSCEIVE_CONTROL = 0x04
-    # _TIMER1_RELOAD      = 0x0c
-    # _TIMER1_CONFIG      = 0x0f
-    # _RX_WAIT_CONFIG     = 0x11
+    _TRANSCEIVE_CONTROL = 0x04
+    _TIMER1_RELOAD      = 0x0c
+    _TIMER1_CONFIG      = 0x0f
+    _RX_WAIT_CONFIG     = 0x11
     _CRC_RX_CONFIG      = 0x12
-    # _RX_STATUS          = 0x13
-    # _TX_WAIT_CONFIG     = 0x17
-    # _TX_CONFIG          = 0x18
+    _RX_STATUS          = 0x13
+    _TX_WAIT_CONFIG     = 0x17
+    _TX_CONFIG          = 0x18
     _CRC_TX_CONFIG      = 0x19
     _RF_STATUS          = 0x1d
     # _SYSTEM_STATUS      = 0x24
@@ -50,11 +51,20 @@ _PN5180_SEND_DATA = 0x09
 _PN5180_READ_DATA = 0x0A
 # This instruction is used to switch the mode. It is only possible to switch from NormalMode to standby, LPCD or Autocoll
 _PN5180_SWITCH_MODE = 0x0B
+_SWITCH_MODE_STANDBY = 0x00
+_SWITCH_MODE_LPCD = 0x01
+# This instruction is used to perform a MIFARE Classic Authentication on an activated card
+_PN5180_MFC_AUTHENTICATE = 0x0C
 # This instruction is used to update the RF configuration from EEPROM into the configuration registers
 _PN5180_LOAD_RF_CONFIG = 0x11
 _PN5180_RF_ON = 0x16  # This instruction switch on the RF Field
 _PN5180_RF_OFF = 0x17  # This instruction switch off the RF Field
 
+# Constant command frames
+_READ_DATA_FRAME = bytes((_PN5180_READ_DATA, 0x00))
+_RF_ON_FRAME = bytes((_PN5180_RF_ON, 0x00))
+_RF_OFF_FRAME = bytes((_PN5180_RF_OFF, 0x00))
+
 
 # PN5180 EEPROM Addresses
 _DIE_IDENTIFIER = 0x00
@@ -62,6 +72,10 @@ _PRODUCT_VERSION = 0x10
 _FIRMWARE_VERSION = 0x12
 _EEPROM_VERSION = 0x14
 _IRQ_PIN_CONFIG = 0x1A
+_LPCD_REFERENCE_VALUE = 0x34
+_LPCD_FIELD_ON_TIME = 0x36
+_LPCD_THRESHOLD = 0x37
+_LPCD_REFVAL_GPO_CONTROL = 0x38
 
 # PN5180 Transceiver States
 class PN5180_Transceive_Stat(Enum):
@@ -75,28 +89,189 @@ class PN5180_Transceive_Stat(Enum):
   PN5180_TS_RESERVED        = 7
 
 # PN5180 IRQ_STATUS
-# _RX_IRQ_STAT         	= 1<<0  # End of RF rececption IRQ
-# _TX_IRQ_STAT         	= 1<<1  # End of RF transmission IRQ
+_RX_IRQ_STAT = 1 << 0  # End of RF rececption IRQ
+_TX_IRQ_STAT = 1 << 1  # End of RF transmission IRQ
 _IDLE_IRQ_STAT = 1 << 2  # IDLE IRQ
 # _RFOFF_DET_IRQ_STAT  	= 1<<6  # RF Field OFF detection IRQ
 # _RFON_DET_IRQ_STAT   	= 1<<7  # RF Field ON detection IRQ
-# _TX_RFOFF_IRQ_STAT   	= 1<<8  # RF Field OFF in PCD IRQ
+_TX_RFOFF_IRQ_STAT = 1 << 8  # RF Field OFF in PCD IRQ
 _TX_RFON_IRQ_STAT = 1 << 9  # RF Field ON in PCD IRQ
-# _RX_SOF_DET_IRQ_STAT 	= 1<<14 # RF SOF Detection IRQ
-# _GENERAL_ERROR_IRQ_STAT = 1<<17 # General error IRQ
-# _LPCD_IRQ_STAT          = 1<<19 # LPCD Detection IRQ
+_RX_SOF_DET_IRQ_STAT = 1 << 14  # RF SOF Detection IRQ
+_GENERAL_ERROR_IRQ_STAT = 1 << 17  # General error IRQ
+_LPCD_IRQ_STAT = 1 << 19  # LPCD Detection IRQ
+
+# PN5180 RX_STATUS
+_RX_NUM_BYTES_RECEIVED = 0x1FF         # Number of bytes in the reception buffer
+_RX_INTEGRITY_ERROR = 1 << 16          # CRC or parity error
+_RX_COLLISION_DETECTED = 1 << 18
+_RX_COLL_POS_SHIFT = 19                # Position of the first collision bit, 7 bits,
+_RX_COLL_POS_MASK = 0x7F               # counted from bit 0 of the first received byte
+
+
+class PN5180Error(Exception):
+    '''Base class of the errors raised by the PN5180 classes.'''
+
+
+class BusyTimeout(PN5180Error):
+    '''The BUSY line did not change within the deadline of the command, the host
+    interface is wedged (reset the chip).'''
+
+
+class TransceiveStateError(PN5180Error):
+    '''The transceiver is not in the state the operation needs.'''
+
+
+class NoTag(PN5180Error):
+    '''No tag answered.'''
+
+
+class CollisionError(PN5180Error):
+    '''Tags answered, but none could be selected: the collisions were not resolved or the
+    tag left the field during the exchange.'''
+
+
+class RxError(PN5180Error):
+    '''An answer was received with a CRC or parity error.'''
+
+
+class RfFieldError(PN5180Error):
+    '''The RF field could not be switched on or off, e.g. because of the field of another
+    reader (RF collision avoidance).'''
+
+
+# Result of PN5180.run_batch()
+#   ok        : True if all steps succeeded
+#   responses : one entry per step run: bytes of the read steps, the IRQ status of the
+#               wait steps, None for the others; the steps after a failure are missing
+#   failed    : index of the failed step, None if ok
+#   error     : the PN5180Error of the failed step, None if ok
+BatchResult = namedtuple('BatchResult', ['ok', 'responses', 'failed', 'error'])
+
+
+class Batch:
+    '''Sequence of host interface commands, built once and run with PN5180.run_batch().
+
+    The command frames are packed when a step is added, a batch can be kept and run again
+    (on any reader) without building anything. The builder methods return the batch, so
+    steps can be chained:
+
+        batch = Batch().load_rf_config(0x00, 0x80).send_data(b'\x52', 7).wait_for_rx().read_data(2)
+
+    A send_data() step arms the transceiver (SYSTEM_CONFIG Idle, then Transceive) without
+    reading the transceiver state first; a transceiver that is not ready sets GENERAL_ERROR
+    and the next wait_for_rx() step fails.'''
+
+    def __init__(self):
+        self.steps = []     # (command frames, response length, wait timeout)
+        self._effects = []  # (step, cmd, reg or tx, value or rx), replayed by run_batch()
+
+    def __len__(self):
+        return len(self.steps)
+
+    def _command(self, frame, length=0):
+        self.steps.append(((bytes(frame),), length, None))
+        return self
+
+    def _register(self, cmd, reg, value):
+        self._effects.append((len(self.steps), cmd, reg, value & 0xffffffff))
+        return self._command(struct.pack('<BBI', cmd, reg, value & 0xffffffff))
+
+    def write_register(self, reg, value):
+        return self._register(_PN5180_WRITE_REGISTER, reg, value)
+
+    def write_register_with_or_mask(self, reg, mask):
+        return self._register(_PN5180_WRITE_REGISTER_OR_MASK, reg, mask)
+
+    def write_register_with_and_mask(self, reg, mask):
+        return self._register(_PN5180_WRITE_REGISTER_AND_MASK, reg, mask)
+
+    def read_register(self, reg):
+        '''Response: the 4 register bytes, little endian.'''
+        return self._command(bytes((_PN5180_READ_REGISTER, reg)), 4)
+
+    def read_eeprom(self, addr, length):
+        if ((addr > 254) or ((addr + length) > 255)):
+            raise ValueError("Reading beyond addr 254")
+        return self._command(bytes((_PN5180_READ_EEPROM, addr, length)), length)
+
+    def load_rf_config(self, tx_conf, rx_conf):
+        self._effects.append((len(self.steps), _PN5180_LOAD_RF_CONFIG, tx_conf, rx_conf))
+        return self._command(bytes((_PN5180_LOAD_RF_CONFIG, tx_conf, rx_conf)))
+
+    def send_data(self, data, valid_bits=0):
+        if (len(data) > 260):
+            raise ValueError("send_data with more than 260 bytes is not supported")
+        step = len(self.steps)
+        self._effects.append((step, _PN5180_WRITE_REGISTER_AND_MASK, regs._SYSTEM_CONFIG, 0xfffffff8))
+        self._effects.append((step, _PN5180_WRITE_REGISTER_OR_MASK, regs._SYSTEM_CONFIG, 0x00000003))
+        self.steps.append(((struct.pack('<BBI', _PN5180_WRITE_REGISTER_AND_MASK, regs._SYSTEM_CONFIG, 0xfffffff8),
+                            struct.pack('<BBI', _PN5180_WRITE_REGISTER_OR_MASK, regs._SYSTEM_CONFIG, 0x00000003),
+                            bytes((_PN5180_SEND_DATA, valid_bits)) + bytes(data)), 0, None))
+        return self
+
+    def wait_for_rx(self, timeout=None):
+        '''Wait for the end of the reception (default timeout: rx_timeout of the reader),
+        fails with NoTag if no answer came, TransceiveStateError on GENERAL_ERROR. Response:
+        the IRQ status.'''
+        self.steps.append(((), 0, timeout))
+        return self
+
+    def read_data(self, length):
+        '''Response: 'length' bytes of the reception buffer.'''
+        if (length > 508):
+            raise ValueError("Reading more than 508 bytes is not supported")
+        return self._command(_READ_DATA_FRAME, length)
 
 
 class PN5180:
-    def __init__(self, bus, device, nns_pin, busy_pin, rst_pin, irq_pin,  protocol='ISO15693'):
-        # 11.4.1 Physical Host Interface
-        # The interface of the PN5180 to a host microcontroller is based on a SPI interface,
-        # extended by signal line BUSY. The maximum SPI speed is 7 Mbps and fixed to CPOL = 0 and CPHA = 0.
-        self._spi = spidev.SpiDev()
-        self._spi.open(bus, device)
-        self._spi.max_speed_hz = 50000
-        self._spi.mode = 0b00
-        self._spi.no_cs = True
+    # transceive_command() handshake modes:
+    #   HANDSHAKE_FAST follows the BUSY line only (datasheet 11.4.1),
+    #   HANDSHAKE_SAFE adds the fixed 2 ms / 1 ms delays around every NSS edge.
+    HANDSHAKE_FAST = 'fast'
+    HANDSHAKE_SAFE = 'safe'
+
+    BUSY_SPIN_MIN_NS = 20000    # Poll BUSY at least 20us before sleeping
+    BUSY_SPIN_MAX_NS = 500000   # and at most 500us
+    BUSY_SLEEP_MIN = 50e-6      # First sleep while waiting for BUSY (s), doubled up to
+    BUSY_SLEEP_MAX = 1e-3       # this value
+    FRAMED_BUSY_RISE_NS = 100000  # NSS of the SPI controller: BUSY rises within 100us
+    IRQ_POLL_MIN = 50e-6        # Without IRQ pin: first sleep between IRQ_STATUS reads (s),
+    IRQ_POLL_MAX = 1e-3         # doubled up to this value
+
+    # Deadline in us of every BUSY edge of a command, slower commands have their own
+    COMMAND_TIMEOUT_US = {_PN5180_WRITE_EEPROM: 100000, _PN5180_LOAD_RF_CONFIG: 20000,
+                          _PN5180_MFC_AUTHENTICATE: 50000}
+    RESET_LOW_TIME = 100e-6     # RESET_N low time (s), at least 10 us
+    RESET_RAMP_NS = 2000000     # RESET_N release until BUSY is high, at most 2 ms
+
+    # SPI clocks tried by tune_spi_speed(), the PN5180 supports up to 7 MHz
+    SPI_SPEEDS = (500000, 1000000, 2000000, 4000000, 5000000, 7000000)
+    # Register and values tune_spi_speed() writes and reads back (TIMER1_RELOAD, 20 bits)
+    _SPI_TEST_REG = regs._TIMER1_RELOAD
+    _SPI_TEST_PATTERNS = (0x000A5A5A, 0x0005A5A5, 0x000FFFFF, 0x00000000)
+
+    # Registers only the host writes, their reads can be answered from the register shadow
+    SHADOW_HOST_REGS = (regs._IRQ_ENABLE, regs._TRANSCEIVE_CONTROL, regs._TIMER1_RELOAD,
+                        regs._TIMER1_CONFIG, regs._RX_WAIT_CONFIG, regs._CRC_RX_CONFIG,
+                        regs._TX_WAIT_CONFIG, regs._TX_CONFIG, regs._CRC_TX_CONFIG)
+    # Registers kept in the shadow. IRQ_CLEAR and the status registers are never shadowed.
+    SHADOW_REGS = SHADOW_HOST_REGS + (regs._SYSTEM_CONFIG,)
+    # Bits the PN5180 changes on its own (SYSTEM_CONFIG: START_SEND, MFC_CRYPTO_ON),
+    # they are never taken from the shadow
+    SHADOW_VOLATILE_BITS = {regs._SYSTEM_CONFIG: 0x00000048}
+
+    # LPCD_REFVAL_GPO_CONTROL modes
+    LPCD_AUTO_CALIBRATION = 0x00
+    LPCD_SELF_CALIBRATION = 0x01
+
+    def __init__(self, bus, device, nns_pin, busy_pin, rst_pin, irq_pin,  protocol='ISO15693', transport=None):
+        '''transport : Transport used to reach the chip. Defaults to the spidev/RPi.GPIO
+        transport built from bus, device and the pin numbers. Pass a Simulator.SimulatedPN5180
+        to run without hardware.'''
+
+        if transport is None:
+            transport = RPiTransport(bus, device, nns_pin, busy_pin, rst_pin, irq_pin)
+        self._transport = transport
 
         self._PN5180_NSS = nns_pin   # active low
         self._PN5180_BUSY = busy_pin
@@ -104,46 +279,130 @@ class PN5180:
         self._PN5180_IRQ = irq_pin
         self._protocol = protocol
 
-        self.command_timeout = 50
+        self.command_timeout_us = 5000   # Deadline of a BUSY edge, see COMMAND_TIMEOUT_US
+        self.reset_timeout_ms = 50       # Reset release until the chip is up
+        self.rf_timeout_ms = 10          # RF_ON/RF_OFF until the field is on/off
+        self.handshake = PN5180.HANDSHAKE_FAST
+        self._busy_avg_ns = 0
+        self.irq_timeout = 1.0    # Seconds to wait for an IRQ
+        self.rx_timeout = .005    # Seconds to wait for the answer of a tag
+        self._irq_enable = None   # IRQ_ENABLE as last written, None if unknown
+        self.rf_config = None     # (tx, rx) configuration loaded last, None after reset
+        self.lpcd_active = False  # In Low-Power Card Detection, SWITCH_MODE sent, no IRQ yet
+        self.device_info = None   # EEPROM snapshot, see DeviceInfo.read_device_info()
+        self.metrics = None       # Metrics.Metrics recording the host interface, None is off
+
+        # Preallocated command frames, the per-poll path does not build lists
+        self._reg_frame = bytearray(6)        # WRITE_REGISTER(_OR/AND_MASK), READ_REGISTER
+        self._reg_value = bytearray(4)        # READ_REGISTER response
+        self._send_frame = bytearray(262)     # SEND_DATA, up to 260 bytes of data
+        self._send_view = memoryview(self._send_frame)
+        self._send_frame[0] = _PN5180_SEND_DATA
+
+        # Write-through shadow of the configuration registers (opt-in):
+        # reg -> (value, mask of the bits known to be in the chip)
+        self.register_shadow = False
+        self.shadow_saved = 0     # SPI transactions saved by the shadow
+        self._shadow = {}
 
     def begin(self):
-        # Reffering to the pins Broadcom SoC
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self._PN5180_NSS, GPIO.OUT)    # Chip Select Pin
-        GPIO.setup(self._PN5180_BUSY, GPIO.IN)    # Busy Pin
-        GPIO.setup(self._PN5180_RST, GPIO.OUT)    # Reset Pin
+        self._transport.begin()
 
-        GPIO.output(self._PN5180_NSS, GPIO.HIGH)  # Disable
-        GPIO.output(self._PN5180_RST, GPIO.HIGH)  # No Reset
+    def close(self):
+        self._transport.close()
 
     def reset(self):
-        #print ("I am Reset function :-)")   
-        GPIO.output(self._PN5180_RST, GPIO.LOW)   # At least 10us required
-        time.sleep(.01)                           # 10ms delay
-        GPIO.output(self._PN5180_RST, GPIO.HIGH)      # 2ms to ramp up required
-        time.sleep(.01)
-        
-        while (0 == (_IDLE_IRQ_STAT and self.get_irq_status())):            
-            pass  # Wait for system to start up
+        '''Hard reset through RESET_N. The chip is up when BUSY went low and the IDLE IRQ is
+        set, both within reset_timeout_ms. Returns False if it did not start up.
+
+        BUSY rises only some time after the release, so its rising edge is awaited first
+        (for RESET_RAMP_NS at most): a low BUSY seen before it is no finished boot.'''
+        self._transport.set_rst(Transport.LOW)    # At least 10us required
+        self._sleep(PN5180.RESET_LOW_TIME)
+        self._transport.set_rst(Transport.HIGH)   # BUSY is high while the chip boots
+        started = time.monotonic()
+        self._wait_busy(Transport.HIGH, PN5180.RESET_RAMP_NS)
+
+        self._irq_enable = None  # Reset clears IRQ_ENABLE
+        self.rf_config = None
+        self.lpcd_active = False
+        self.invalidate_shadow()
+        timeout = self.reset_timeout_ms / 1000
+        try:
+            up = (self._wait_busy(Transport.LOW, int(timeout * 1e9)) and
+                  self.wait_for_irq(_IDLE_IRQ_STAT, max(timeout - (time.monotonic() - started), 0)))
+        except BusyTimeout:
+            up = False
+        if (not up):  # Wait for system to start up
+            print("*** ERROR: PN5180 did not start up after reset!")
+            return False
 
         self.clear_irq_status(0xffffffff)  # Clear all flags
+        return True
 
     def get_irq_status(self):
-        irq_status = []
-        self.read_register(regs._IRQ_STATUS, irq_status)
-        byte_string = bytes(sum(irq_status, [])[::-1]) # Flatt list into one. Reverse list order and convert to byte string.
-        return int.from_bytes(byte_string, byteorder='big') # Byte string into integer.
+        return self.read_register(regs._IRQ_STATUS)
 
     def clear_irq_status(self, irq_mask: int):
         return self.write_register(regs._IRQ_CLEAR, irq_mask)
 
+    def wait_for_irq(self, mask: int, timeout=None):
+        '''Block until one of the IRQ_STATUS bits in 'mask' is set and return those bits,
+        0 after 'timeout' seconds (default irq_timeout).
+
+        IRQ_ENABLE is set to 'mask', so the IRQ line becomes active exactly for the awaited
+        events and the host sleeps on its rising edge instead of reading IRQ_STATUS over SPI
+        in a loop. Without an IRQ pin (irq_pin None) IRQ_STATUS is polled.'''
+
+        if timeout is None:
+            timeout = self.irq_timeout
+
+        if (self.metrics is None):
+            return self._wait_for_irq(mask, timeout)
+        started = time.perf_counter_ns()
+        status = self._wait_for_irq(mask, timeout)
+        self.metrics.irq(time.perf_counter_ns() - started, bool(status))
+        return status
+
+    def _wait_for_irq(self, mask, timeout):
+        if self._PN5180_IRQ is None:
+            deadline = time.monotonic() + timeout
+            pause = PN5180.IRQ_POLL_MIN
+            while True:
+                expired = (time.monotonic() > deadline)  # Before the read, a late read still counts
+                status = self.get_irq_status() & mask
+                if status or expired:
+                    return status
+                time.sleep(min(pause, max(deadline - time.monotonic(), 0)))
+                pause = min(pause * 2, PN5180.IRQ_POLL_MAX)
+
+        if (self._irq_enable != mask):
+            self.write_register(regs._IRQ_ENABLE, mask)
+            self._irq_enable = mask
+
+        if (not self._transport.wait_irq(timeout)):
+            return 0
+        return self.get_irq_status() & mask
+
+    def invalidate_shadow(self):
+        '''Forget all shadowed register values, e.g. after the chip reloaded them.'''
+        self._shadow.clear()
+
+    def _shadow_update(self, reg, value, known):
+        known &= ~PN5180.SHADOW_VOLATILE_BITS.get(reg, 0) & 0xffffffff
+        self._shadow[reg] = (value & known, known)
+
+    def _shadow_bits(self, reg, mask):
+        '''Value of the 'mask' bits of reg, None if not all of them are known.'''
+        value, known = self._shadow.get(reg, (0, 0))
+        if (mask & known) != mask:
+            return None
+        return value & mask
+
     def get_transceive_state(self):
         #print("Get Transceive state...\n")
 
-        rf_status = []
-        if (not self.read_register(regs._RF_STATUS, rf_status)):
-            print('Error reading RF_STATUS register.\n')
-            return PN5180_Transceive_Stat(0)
+        rf_status = self.read_register(regs._RF_STATUS)
 
         '''PN5180_Transceive_Stat:
             0 - idle
@@ -154,26 +413,39 @@ class PN5180:
             5 - receiving
             6 - loopback
             7 - reserved'''
-        
-        # Convert list to integer
-        rf_status = bytes(sum(rf_status, [])[::-1])
-        rf_status_int = int.from_bytes(rf_status, byteorder='big')
 
-        state = ((rf_status_int >> 24) & 0x07)
+        state = ((rf_status >> 24) & 0x07)
         #print("STATE----> ", state)
         return PN5180_Transceive_Stat(state)
-        
 
-    def write_register(self, reg: int, value: list):
+    def _register_command(self, cmd: int, reg: int, value: int):
+        '''Send a 6 byte register command (command, address, 32 bit value little endian).'''
+        struct.pack_into('<BBI', self._reg_frame, 0, cmd, reg, value & 0xffffffff)
+        return self.transceive_command(self._reg_frame)
+
+    def _shadow_command(self, cmd: int, reg: int, value: int):
+        '''_register_command(), the shadowed value of 'reg' is forgotten if it fails: the
+        chip may or may not have run the command.'''
+        try:
+            self._register_command(cmd, reg, value)
+        except PN5180Error:
+            self._shadow.pop(reg, None)
+            raise
+
+    def write_register(self, reg: int, value: int):
         '''WRITE_REGISTER - 0x00
         This command is used to write a 32-bit value (little endian) to a configuration register.
         The address of the register mus exist. If the condition is not fulfilled, an exception is
         raised.'''
 
-        cmd = [_PN5180_WRITE_REGISTER, reg]
-        value = list((value).to_bytes(4, byteorder='little'))
-        cmd += value  # Give list of bytes
-        self.transceive_command(cmd, [], 0)
+        shadow = self.register_shadow and reg in PN5180.SHADOW_REGS
+        if shadow and (value == self._shadow_bits(reg, 0xffffffff)):
+            self.shadow_saved += 1
+            return True
+
+        self._shadow_command(_PN5180_WRITE_REGISTER, reg, value)
+        if shadow:
+            self._shadow_update(reg, value, 0xffffffff)
         return True
 
     def write_register_with_or_mask(self, reg, mask):
@@ -183,11 +455,16 @@ class PN5180:
         is written back to the register.
         The address of the register must exist. If the condition is not fulfilled, an exception is raised.'''
 
-        buf = [_PN5180_WRITE_REGISTER_OR_MASK, reg]
-        mask = list(mask.to_bytes(4, byteorder='little'))
-        buf += mask
-        self.transceive_command(buf, [], 0)
-        return True      
+        shadow = self.register_shadow and reg in PN5180.SHADOW_REGS
+        if shadow and (mask == self._shadow_bits(reg, mask)):  # All bits already set
+            self.shadow_saved += 1
+            return True
+
+        self._shadow_command(_PN5180_WRITE_REGISTER_OR_MASK, reg, mask)
+        if shadow:
+            value, known = self._shadow.get(reg, (0, 0))
+            self._shadow_update(reg, value | mask, known | mask)
+        return True
 
     def write_register_with_and_mask(self, reg, mask):
         '''WRITE_REGISTER_AND_MASK - 0x02
@@ -196,27 +473,50 @@ class PN5180:
         is written back to the register.
         The address of the register must exist. If the condition is not fulfilled, an exception is raised.'''
 
-        buf = [_PN5180_WRITE_REGISTER_AND_MASK, reg]
-        mask = list(mask.to_bytes(4, byteorder='little'))
-        buf += mask
-        self.transceive_command(buf, [], 0)
+        shadow = self.register_shadow and reg in PN5180.SHADOW_REGS
+        cleared = ~mask & 0xffffffff
+        if shadow and (0 == self._shadow_bits(reg, cleared)):  # All bits already cleared
+            self.shadow_saved += 1
+            return True
+
+        self._shadow_command(_PN5180_WRITE_REGISTER_AND_MASK, reg, mask)
+        if shadow:
+            value, known = self._shadow.get(reg, (0, 0))
+            self._shadow_update(reg, value & mask, known | cleared)
         return True
 
 
-    def read_register(self, reg: int, value: list):
+    def read_register(self, reg: int):
         '''READ_REGISTER - 0x04
         This command is used to read the content of a configuration register. The content of the register
         is returnet in the 4 byte response. The address of the register must exist. If the condition is not
-        fulfielled, an exception is raised.'''
-        
-        cmd = [_PN5180_READ_REGISTER, reg]
-        self.transceive_command(cmd, value, 4)
-        return True
+        fulfielled, an exception is raised.
 
-    def transceive_command(self, send_buffer: list, recv_buffer: list, recv_buffer_len: int):
+        Returns the register value as int, raises PN5180Error if the command failed.'''
+
+        host_reg = self.register_shadow and reg in PN5180.SHADOW_HOST_REGS
+        if host_reg:
+            cached = self._shadow_bits(reg, 0xffffffff)
+            if (cached is not None):
+                self.shadow_saved += 1
+                return cached
+
+        self._reg_frame[0] = _PN5180_READ_REGISTER
+        self._reg_frame[1] = reg
+        self.transceive_command(memoryview(self._reg_frame)[:2], self._reg_value)
+        value = int.from_bytes(self._reg_value, byteorder='little')
+        if host_reg:
+            self._shadow_update(reg, value, 0xffffffff)
+        return value
+
+    def transceive_command(self, send_buffer, recv_buffer=None):
         '''A Host Interface Command consist of either 1 or 2 SPI frames depending whether the host wants to 
         write or read data from PN5180. An SPI Frame consist of multiple bytes.
 
+        send_buffer is any bytes-like object holding the command frame. If recv_buffer (a writable
+        bytes-like object, e.g. bytearray or memoryview) is given, the response frame is read into it,
+        len(recv_buffer) bytes long.
+
         All commands are packed into one SPI Frame. An SPI Frame consists of multiple bytes. 
 
         No NSS toggles allowed during sending of an SPI frame.
@@ -229,66 +529,182 @@ class PN5180:
           3. Wait until BUSY is high
           4. Deassert NSS
           5. Wait until BUSY is low
-        If there is a parameter error, the IRQ is set to ACTIVE and a GENERAL_ERROR_IRQ is set'''
-       
+        If there is a parameter error, the IRQ is set to ACTIVE and a GENERAL_ERROR_IRQ is set
+
+        Every BUSY edge has to come within command_timeout_us (COMMAND_TIMEOUT_US for slow
+        commands), else BusyTimeout is raised with NSS released. Returns True.'''
+
+        if (self.metrics is None):
+            return self._transceive(send_buffer, recv_buffer)
+        started = time.perf_counter_ns()
+        success = False
+        try:
+            success = self._transceive(send_buffer, recv_buffer)
+        finally:
+            self.metrics.command(send_buffer[0], time.perf_counter_ns() - started, success,
+                                 len(send_buffer), 0 if recv_buffer is None else len(recv_buffer))
+        return success
+
+    def _busy_timeout(self, send_buffer, what):
+        self._transport.set_nss(Transport.HIGH)  # Don't leave the bus selected
+        raise BusyTimeout("BUSY {}, command 0x{:02x}".format(what, send_buffer[0]))
+
+    def _transceive(self, send_buffer, recv_buffer):
+        timeout = PN5180.COMMAND_TIMEOUT_US.get(send_buffer[0], self.command_timeout_us) * 1000
+        safe = (self.handshake == PN5180.HANDSHAKE_SAFE)
+        # Frames with NSS driven by the SPI controller end with NSS high, BUSY may rise
+        # only after the transfer returned
+        framed = self._transport.frame_cs
+
         # 0.
-        started_waiting = time.time()
-        while (GPIO.LOW != GPIO.input(self._PN5180_BUSY)):  # Wait until busy is low
-            if (time.time() - started_waiting > self.command_timeout):
-                return False
+        if (not self._wait_busy(Transport.LOW, timeout)):  # Wait until busy is low
+            self._busy_timeout(send_buffer, "stuck high before the command")
         # 1.
-        GPIO.output(self._PN5180_NSS, GPIO.LOW)
-        time.sleep(.002)
+        self._transport.set_nss(Transport.LOW)
+        if safe: self._sleep(.002)
         # 2.
-        self._spi.writebytes(send_buffer)
+        self._transport.write_bytes(send_buffer)
         ###print("Write_SPI: ", send_buffer)
-        # 3.        
-        started_waiting = time.time()
-        while (GPIO.HIGH != GPIO.input(self._PN5180_BUSY)):  # Wait until busy is high
-            if (time.time() - started_waiting > self.command_timeout):
-                return False
-        
+        # 3.
+        if framed:
+            self._wait_busy_rise()
+        elif (not self._wait_busy(Transport.HIGH, timeout)):  # Wait until busy is high
+            self._busy_timeout(send_buffer, "did not rise")
         # 4.
-        GPIO.output(self._PN5180_NSS, GPIO.HIGH)
-        time.sleep(.001)
+        self._transport.set_nss(Transport.HIGH)
+        if safe: self._sleep(.001)
         # 5.
-        started_waiting = time.time()
-        while (GPIO.LOW != GPIO.input(self._PN5180_BUSY)):  # Wait until busy is low
-            if (time.time() - started_waiting > self.command_timeout):
-                return False
-        
+        if (not self._wait_busy(Transport.LOW, timeout)):  # Wait until busy is low
+            self._busy_timeout(send_buffer, "stuck high")
+
         # Check, if write-only
-        if (not recv_buffer) and (not recv_buffer_len):
+        if (recv_buffer is None) or (0 == len(recv_buffer)):
             return True
         #print("Receiving SPI frame...\n")
 
         # 1.
-        GPIO.output(self._PN5180_NSS, GPIO.LOW)
-        time.sleep(.002)
+        self._transport.set_nss(Transport.LOW)
+        if safe: self._sleep(.002)
         # 2.
-        data = self._spi.readbytes(recv_buffer_len)
-        ###print("Read_SPI: ", data)
-        recv_buffer.append(data)
-        #print("Type recv_buffer: ", type(recv_buffer))
-        #print("Type data: ", type(data))
-        #recv_buffer.append(self._spi.readbytes(recv_buffer_len))
+        self._transport.read_into(recv_buffer)
+        ###print("Read_SPI: ", recv_buffer)
         # 3.
-        started_waiting = time.time()
-        while (GPIO.HIGH != GPIO.input(self._PN5180_BUSY)):  # Wait until busy is high
-            if(time.time() - started_waiting > self.command_timeout):
-                return False
+        if framed:
+            self._wait_busy_rise()
+        elif (not self._wait_busy(Transport.HIGH, timeout)):  # Wait until busy is high
+            self._busy_timeout(send_buffer, "did not rise")
         # 4.
-        GPIO.output(self._PN5180_NSS, GPIO.HIGH)
-        time.sleep(.001)
+        self._transport.set_nss(Transport.HIGH)
+        if safe: self._sleep(.001)
         # 5.
-        started_waiting = time.time()
-        while (GPIO.LOW != GPIO.input(self._PN5180_BUSY)):  # Wait until busy is low
-            if(time.time() - started_waiting > self.command_timeout):
+        if (not self._wait_busy(Transport.LOW, timeout)):  # Wait until busy is low
+            self._busy_timeout(send_buffer, "stuck high")
+
+        return True
+
+    def _sleep(self, seconds):
+        '''Fixed delay of the safe handshake or of reset(), recorded as BUSY wait spent
+        sleeping, since the host waits for the chip in it as well.'''
+        if (self.metrics is None):
+            time.sleep(seconds)
+            return
+        started = time.monotonic_ns()
+        time.sleep(seconds)
+        slept = time.monotonic_ns() - started
+        self.metrics.busy(slept, slept)
+
+    def _wait_busy_rise(self):
+        '''After a frame with NSS driven by the SPI controller: BUSY rises when the frame
+        ended, possibly after the transfer returned. A rise not seen within
+        FRAMED_BUSY_RISE_NS was too short to be sampled, the command is done then.'''
+        self._wait_busy(Transport.HIGH, PN5180.FRAMED_BUSY_RISE_NS)
+
+    def _wait_busy(self, level: int, timeout_ns: int):
+        '''Wait until the BUSY line equals 'level', False if it did not within 'timeout_ns'.
+
+        BUSY edges of register commands come within microseconds, so the line is polled in a
+        tight loop first. The spin budget follows the average of the recent waits (twice the
+        average, between BUSY_SPIN_MIN_NS and BUSY_SPIN_MAX_NS); longer operations such as
+        EEPROM writes or LOAD_RF_CONFIG fall back to sleeps of growing length, so they don't
+        keep a core busy.'''
+
+        get_busy = self._transport.get_busy
+        if (level == get_busy()):
+            return True
+
+        started = time.monotonic_ns()
+        deadline = started + timeout_ns
+        spin_until = started + min(max(2 * self._busy_avg_ns, PN5180.BUSY_SPIN_MIN_NS), PN5180.BUSY_SPIN_MAX_NS)
+        pause = PN5180.BUSY_SLEEP_MIN
+        slept = 0
+        while (level != get_busy()):
+            now = time.monotonic_ns()
+            if (now > deadline):
+                if (self.metrics is not None):
+                    self.metrics.busy(now - started, slept)
                 return False
+            if (now > spin_until):
+                time.sleep(pause)
+                slept += int(pause * 1e9)
+                pause = min(2 * pause, PN5180.BUSY_SLEEP_MAX)
 
+        waited = time.monotonic_ns() - started
+        self._busy_avg_ns += (waited - self._busy_avg_ns) // 8
+        if (self.metrics is not None):
+            self.metrics.busy(waited, slept)
         return True
 
-    def read_eeprom(self, addr: int, buffer: list, len: int):
+    def tune_spi_speed(self, speeds=SPI_SPEEDS, rounds=3):
+        '''SPI clock self-test, run after reset() while no RF operation is going on.
+
+        The EEPROM is read at the current (safe) clock as reference. Then the clocks in
+        'speeds' are tried in increasing order: at each one the whole EEPROM is read and a
+        register is written and read back with bit patterns, 'rounds' times. The highest
+        clock below the first one that fails is kept; after a failure the chip is reset,
+        since a corrupted frame may have changed a register.
+
+        Returns the clock in Hz the transport runs at, None if the transport has no clock.
+        Raises PN5180Error if the reference could not be read at the current clock.'''
+
+        good = self._transport.get_speed()
+        if (good is None):
+            return None
+        reference = bytearray(255)
+        self.read_eeprom(0, reference)
+        shadow, self.register_shadow = self.register_shadow, False  # Really read the chip
+        eeprom = bytearray(255)
+        failed = False
+        try:
+            saved = self.read_register(PN5180._SPI_TEST_REG)
+            for speed in sorted(s for s in speeds if s > good):
+                self._transport.set_speed(speed)
+                for _ in range(rounds):
+                    try:
+                        self.read_eeprom(0, eeprom)
+                        failed = (eeprom != reference)
+                        for pattern in PN5180._SPI_TEST_PATTERNS:
+                            if (failed): break
+                            self.write_register(PN5180._SPI_TEST_REG, pattern)
+                            failed = (self.read_register(PN5180._SPI_TEST_REG) != pattern)
+                    except PN5180Error:    # A garbled frame, BUSY did not follow
+                        failed = True
+                    if (failed): break
+                if (failed): break
+                good = speed
+
+            self._transport.set_speed(good)
+            if (failed):
+                print("SPI clock {} Hz failed the read-back test, using {} Hz".format(speed, good))
+                self.reset()
+            else:
+                self.write_register(PN5180._SPI_TEST_REG, saved)
+        finally:
+            self._transport.set_speed(good)
+            self.register_shadow = shadow
+            self.invalidate_shadow()
+        return good
+
+    def read_eeprom(self, addr: int, buffer):
         '''READ_EEPROM - 0x07
         This command is used to read data from EEPROM memory area. The field 'Address'
         indicates the start address of the read operation. The field Length indicates the number
@@ -296,15 +712,34 @@ class PN5180:
         The data ise read in sequentially increasing order starting with the given address.
 
         EEpROM Address must be in the range from 0 to 254, inclusive. Read operation must not go
-        beyonf EEPROM address 254. If the confition is not fulfielled, an exceprion is raised.'''
+        beyonf EEPROM address 254. If the confition is not fulfielled, an exceprion is raised.
+
+        len(buffer) bytes are read into buffer (bytearray or memoryview), the whole EEPROM
+        (255 bytes from address 0) can be read with one command.'''
 
-        if ((addr > 254) or ((addr + len) > 254)):
+        length = len(buffer)
+        if ((addr > 254) or ((addr + length) > 255)):
             print("ERROR: Reading beyond addr 254!\n")
             return False
 
-        cmd = [_PN5180_READ_EEPROM, addr, len]        
-        self.transceive_command(cmd, buffer, len)
+        return self.transceive_command(bytes((_PN5180_READ_EEPROM, addr, length)), buffer)
 
+    def write_eeprom(self, addr: int, data):
+        '''WRITE_EEPROM - 0x06
+        This command is used to write data to EEPROM memory area. The field 'Address' indicates
+        the start address of the write operation. The length of the data is given by the frame.
+        The data is written in sequentially increasing order starting with the given address.
+
+        EEPROM Address must be in the range from 0 to 254, inclusive. Write operation must not go
+        beyond EEPROM address 254. If the condition is not fulfilled, an exception is raised.'''
+
+        if ((addr > 254) or ((addr + len(data)) > 255)):
+            print("ERROR: Writing beyond addr 254!\n")
+            return False
+
+        self.transceive_command(bytes((_PN5180_WRITE_EEPROM, addr)) + bytes(data))
+        if (self.device_info is not None):
+            self.device_info.eeprom[addr:addr + len(data)] = data
         return True
     
     def send_data(self, data, len, valid_bits):
@@ -327,32 +762,162 @@ class PN5180:
             print("ERROR: send_data with more than 260 bytes is not supported!\n")
             return False
 
-        buffer = [None] * (len + 2)
-        buffer[0] = _PN5180_SEND_DATA
-        buffer[1] = valid_bits # Number of valid bits of last byte are transmitted (0 = all bits are transmitted)
-        
-        for i in range(len):
-            buffer[i+2] = data[i]
-            
-        self.write_register_with_and_mask(regs._SYSTEM_CONFIG, 0xfffffff8) # Idle/StopCom Command
-        self.write_register_with_or_mask(regs._SYSTEM_CONFIG, 0x00000003)  # Transceive Command
-        
-        '''Transceive command; initiates a transceive cycle.
-        Note: Depending on the value of the Initiator bit, a transmission is started or the receiver is
-        enabled.
-        Note: The transceive command does not finish automatically. It stays in the transceive cycle
-        until stopped via the IDLE/StopCom command.'''
-
-        transceive_state = self.get_transceive_state()
+        frame = self._send_view[:len + 2]  # [0] is always _PN5180_SEND_DATA
+        frame[1] = valid_bits # Number of valid bits of last byte are transmitted (0 = all bits are transmitted)
+        frame[2:] = data[:len]
+
+        # With the register shadow the transceiver is only restarted when it is not armed: after a
+        # completed reception it is back in WaitTransmit and the Transceive command is still set.
+        transceive_state = None
+        if (self.register_shadow and (0x03 == self._shadow_bits(regs._SYSTEM_CONFIG, 0x07))):
+            transceive_state = self.get_transceive_state()
+            if (PN5180_Transceive_Stat.PN5180_TS_WaitTransmit == transceive_state):
+                self.shadow_saved += 2
 
         if (PN5180_Transceive_Stat.PN5180_TS_WaitTransmit != transceive_state):
-            print("*** ERROR: Transceiver not in state WaitTransmit!?\n")
-            return False
+            self.write_register_with_and_mask(regs._SYSTEM_CONFIG, 0xfffffff8) # Idle/StopCom Command
+            self.write_register_with_or_mask(regs._SYSTEM_CONFIG, 0x00000003)  # Transceive Command
+
+            '''Transceive command; initiates a transceive cycle.
+            Note: Depending on the value of the Initiator bit, a transmission is started or the receiver is
+            enabled.
+            Note: The transceive command does not finish automatically. It stays in the transceive cycle
+            until stopped via the IDLE/StopCom command.'''
+
+            transceive_state = self.get_transceive_state()
+
+        if (PN5180_Transceive_Stat.PN5180_TS_WaitTransmit != transceive_state):
+            raise TransceiveStateError("Transceiver in state {} instead of WaitTransmit".format(
+                None if transceive_state is None else transceive_state.name))
 
-        success = self.transceive_command(buffer, [], 0)
+        success = self.transceive_command(frame)
         return success
 
-    def read_data(self, len, buffer):
+    def wait_for_rx(self, timeout=None):
+        '''Wait until the reception started by send_data() is complete (RX_IRQ) and
+        acknowledge it. Returns False if no answer arrived within 'timeout' seconds
+        (default rx_timeout), e.g. because there is no tag in the field.
+
+        The reception buffer must not be read before, with the fast handshake the
+        host is quicker than the RF exchange.'''
+
+        if timeout is None:
+            timeout = self.rx_timeout
+
+        status = self.wait_for_irq(_RX_IRQ_STAT | _GENERAL_ERROR_IRQ_STAT, timeout)
+        if (status):
+            self.clear_irq_status(status)
+        return (0 != (status & _RX_IRQ_STAT))
+
+    def exchange(self, tx, valid_bits=0, timeout_us=None):
+        '''Send 'tx' and return the answer as bytes, one RF round trip.
+
+        send_data() arms the transceiver (once, see register_shadow) and sends, the host
+        sleeps until RX_IRQ, RX_STATUS gives the exact number of bytes and the error flags,
+        and READ_DATA fetches exactly that many bytes.
+        valid_bits : valid bits of the last byte of 'tx', 0 = all
+        timeout_us : answer timeout in us, default rx_timeout
+        Raises NoTag if no answer came, CollisionError on a collision and RxError on a CRC
+        or parity error.'''
+
+        timeout = self.rx_timeout if timeout_us is None else timeout_us / 1e6
+        if (not self.send_data(tx, len(tx), valid_bits)):
+            raise PN5180Error("SEND_DATA failed")
+        if (not self.wait_for_rx(timeout)):
+            raise NoTag("No answer within {:.0f} us".format(timeout * 1e6))
+        answer = bytearray(self.received_length())
+        if (answer and (not self.read_data(answer))):
+            raise PN5180Error("READ_DATA failed")
+        return bytes(answer)
+
+    def transmit(self, tx, valid_bits=0, timeout_us=None):
+        '''Send 'tx', a frame without an answer (e.g. HLTA), and return once it is on air
+        completely (TX_IRQ). Stopping the transceiver earlier, with the next send_data() or
+        any change of SYSTEM_CONFIG, cuts the frame off before the tag got it.
+        timeout_us : time the transmission may take in us, default rx_timeout
+        Raises PN5180Error if the transmission did not end in time.'''
+
+        timeout = self.rx_timeout if timeout_us is None else timeout_us / 1e6
+        self.clear_irq_status(_TX_IRQ_STAT)
+        self.send_data(tx, len(tx), valid_bits)
+        if (0 == self.wait_for_irq(_TX_IRQ_STAT, timeout)):
+            raise PN5180Error("Transmission did not end within {:.0f} us".format(timeout * 1e6))
+
+    def received_length(self):
+        '''Number of bytes of the reception that just ended (RX_STATUS), raises
+        CollisionError or RxError if RX_STATUS flags the answer.'''
+
+        status = self.read_register(regs._RX_STATUS)
+        if (status & _RX_COLLISION_DETECTED):
+            raise CollisionError("Collision in bit {}".format((status >> _RX_COLL_POS_SHIFT) & _RX_COLL_POS_MASK))
+        if (status & _RX_INTEGRITY_ERROR):
+            raise RxError("CRC or parity error")
+        return status & _RX_NUM_BYTES_RECEIVED
+
+    def run_batch(self, batch):
+        '''Run the steps of a Batch back to back, returns a BatchResult.
+
+        The steps go straight to the host interface: the frames are ready, the transceiver
+        state is not read before SEND_DATA and no result has to be tested in between. The
+        batch stops at the first step that fails: a BUSY timeout, or GENERAL_ERROR
+        (TransceiveStateError) or no answer (NoTag) in a wait_for_rx() step. rf_config and,
+        with register_shadow on, the register shadow are updated with what the batch did.'''
+
+        transceive = self.transceive_command
+        responses = []
+        index = 0
+        try:
+            for index, (frames, length, timeout) in enumerate(batch.steps):
+                if (not frames):
+                    status = self.wait_for_irq(_RX_IRQ_STAT | _GENERAL_ERROR_IRQ_STAT,
+                                               self.rx_timeout if timeout is None else timeout)
+                    if (status):
+                        self.clear_irq_status(status)
+                    responses.append(status)
+                    if (status & _GENERAL_ERROR_IRQ_STAT):
+                        raise TransceiveStateError("GENERAL_ERROR, the transceiver was not ready")
+                    if (0 == (status & _RX_IRQ_STAT)):
+                        raise NoTag("No answer")
+                    continue
+                if (length):
+                    response = bytearray(length)
+                    transceive(frames[0], response)
+                    responses.append(bytes(response))
+                    continue
+                for frame in frames:
+                    transceive(frame)
+                responses.append(None)
+        except PN5180Error as error:
+            self._batch_done(batch, index)
+            return BatchResult(False, responses, index, error)
+        self._batch_done(batch, len(batch.steps))
+        return BatchResult(True, responses, None, None)
+
+    def _batch_done(self, batch, steps):
+        '''Register shadow and rf_config after the first 'steps' steps of a batch.'''
+        for step, cmd, a, b in batch._effects:
+            if (step > steps):
+                break
+            if (step == steps):   # The failed step, it may have been run partly
+                if (cmd == _PN5180_LOAD_RF_CONFIG):
+                    self.invalidate_shadow()
+                    self.rf_config = None
+                else:
+                    self._shadow.pop(a, None)
+            elif (cmd == _PN5180_LOAD_RF_CONFIG):
+                self.invalidate_shadow()
+                tx, rx = self.rf_config or (None, None)
+                self.rf_config = (tx if a == 0xFF else a, rx if b == 0xFF else b)
+            elif (self.register_shadow and (a in PN5180.SHADOW_REGS)):
+                value, known = self._shadow.get(a, (0, 0))
+                if (cmd == _PN5180_WRITE_REGISTER):
+                    self._shadow_update(a, b, 0xffffffff)
+                elif (cmd == _PN5180_WRITE_REGISTER_OR_MASK):
+                    self._shadow_update(a, value | b, known | b)
+                else:
+                    self._shadow_update(a, value & b, known | (~b & 0xffffffff))
+
+    def read_data(self, buffer):
         '''READ_DATA - 0x0A
         This command reads data from the RF reception buffer, after a successful reception.
         The RX_STATUS register contains the information to verify if the reception had been 
@@ -360,19 +925,18 @@ class PN5180:
         nthe number of bytes to be read via the SPI interface.
         The RF data had been successfully received. In case the instruction is executed without
         preceding an RF data reception, no exception is raised but the data read back from the
-        reception buffer is invalid. If the confition is not fulfielled, and exception is raised'''
-        
-        if (len > 508):
+        reception buffer is invalid. If the confition is not fulfielled, and exception is raised
+
+        len(buffer) bytes are read into buffer (bytearray or memoryview), a memoryview slice
+        places the data directly where the caller needs it.'''
+
+        if (len(buffer) > 508):
             print("*** FATAL: Reading more than 508 bytes is not supported!")
             return False
 
-        cmd = [_PN5180_READ_DATA, 0x00]
-        success = self.transceive_command(cmd, buffer, len)
+        success = self.transceive_command(_READ_DATA_FRAME, buffer)
         return success
 
-    # def read_data(self, len):
-    #     pass
-
     def load_rf_config(self, tx_conf, rx_conf):
         '''LOAD_RF_CONFIG - 0x11
         Parameter 'Transmiter Configuration must be in the range from 0x0 - 0x1C, inclusive.
@@ -392,20 +956,150 @@ class PN5180:
         ->0D              ISO 15693 ASK100  26            8D                ISO 15693   26
           0E              ISO 15693 ASK10   26            8E                ISO 15693   53   '''
 
-        cmd = [_PN5180_LOAD_RF_CONFIG, tx_conf, rx_conf]
-        self.transceive_command(cmd, [], 0)
+        self.transceive_command(bytes((_PN5180_LOAD_RF_CONFIG, tx_conf, rx_conf)))
+        self.invalidate_shadow()  # The configuration registers were reloaded from EEPROM
+        tx, rx = self.rf_config or (None, None)
+        self.rf_config = (tx if tx_conf == 0xFF else tx_conf, rx if rx_conf == 0xFF else rx_conf)
 
         return True
 
     def set_rf_on(self):
         '''RF_ON - 0x16
         This command is ised to switch on the internal RF field. If enabled the TX_RFON_IRQ is set
-        after the field is switched on.'''
+        after the field is switched on.
+
+        Returns True, raises RfFieldError if the field did not turn on within rf_timeout_ms.'''
+
+        self.transceive_command(_RF_ON_FRAME)
+
+        # Wait for RF Field to set up
+        status = self.wait_for_irq(_TX_RFON_IRQ_STAT | _GENERAL_ERROR_IRQ_STAT, self.rf_timeout_ms / 1000)
+        if (status):
+            self.clear_irq_status(status)
+        if (0 == (_TX_RFON_IRQ_STAT & status)):
+            raise RfFieldError("RF field did not turn on, IRQ_STATUS 0x{:08x}".format(status))
+        return True
+
+    def set_rf_off(self):
+        '''RF_OFF - 0x17
+        This command is used to switch off the internal RF field. If enabled, the TX_RFOFF_IRQ
+        is set after the field is switched off. The tags in the field lose power.
+
+        Returns True, raises RfFieldError if the field did not turn off within rf_timeout_ms.'''
+
+        self.transceive_command(_RF_OFF_FRAME)
+        status = self.wait_for_irq(_TX_RFOFF_IRQ_STAT | _GENERAL_ERROR_IRQ_STAT, self.rf_timeout_ms / 1000)
+        if (status):
+            self.clear_irq_status(status)
+        if (0 == (_TX_RFOFF_IRQ_STAT & status)):
+            raise RfFieldError("RF field did not turn off, IRQ_STATUS 0x{:08x}".format(status))
+        return True
+
+    def mifare_authenticate(self, block: int, key, key_type: int, uid):
+        '''MFC_AUTHENTICATE - 0x0C
+        This command is used to perform a MIFARE Classic Authentication on an activated card.
+        It takes the key, card UID and the key type to authenticate at given block address. The
+        response contains one byte indicating the authentication status.
+        key      : 6 bytes
+        key_type : 0x60 (key A) or 0x61 (key B)
+        uid      : the 4 bytes of the UID used for the authentication (last cascade level)
+
+        On success the PN5180 sets MFC_CRYPTO_ON in SYSTEM_CONFIG, the following exchanges with
+        the card are encrypted by the chip. After a failed authentication the card is idle and
+        has to be activated again.'''
+
+        if ((6 != len(key)) or (4 != len(uid)) or (key_type not in (0x60, 0x61))):
+            print("ERROR: mifare_authenticate needs a 6 byte key, key type 0x60/0x61 and a 4 byte UID!\n")
+            return False
 
-        cmd = [_PN5180_RF_ON, 0x00]
-        self.transceive_command(cmd, [], 0)
+        frame = bytearray(13)
+        frame[0] = _PN5180_MFC_AUTHENTICATE
+        frame[1:7] = key
+        frame[7] = key_type
+        frame[8] = block
+        frame[9:13] = uid
+        status = bytearray(1)
+        self.transceive_command(frame, status)
+        return (0x00 == status[0])
 
-        while (0 == (_TX_RFON_IRQ_STAT & self.get_irq_status())):
-            pass  # Wait for RF Field to set up
-        self.clear_irq_status(_TX_RFON_IRQ_STAT)
+    # ------------------------------------
+    #       Low-Power Card Detection
+
+    def lpcd_calibrate(self, field_on_time=0xF0, threshold=0x03, mode=LPCD_SELF_CALIBRATION):
+        '''Set the LPCD parameters in the EEPROM.
+
+        field_on_time : LPCD_FIELD_ON_TIME, the field is on for (field_on_time * 8 + 62) us
+                        per detection cycle
+        threshold     : LPCD_THRESHOLD, AGC deviation from the reference value that counts
+                        as a card
+        mode          : LPCD_REFVAL_GPO_CONTROL, LPCD_SELF_CALIBRATION makes the chip measure
+                        the reference value itself when it enters LPCD, so there must be no
+                        card in the field at that moment
+
+        An EEPROM write keeps the chip busy for milliseconds and wears the cells, the
+        parameters are only written if they differ from the EEPROM content.'''
+
+        wanted = bytes((field_on_time, threshold, mode))
+        if (self.device_info is not None):
+            current = self.device_info.eeprom[_LPCD_FIELD_ON_TIME:_LPCD_FIELD_ON_TIME + 3]
+        else:
+            current = bytearray(3)
+            if (not self.read_eeprom(_LPCD_FIELD_ON_TIME, current)):
+                return False
+        if (current == wanted):
+            return True
+        return self.write_eeprom(_LPCD_FIELD_ON_TIME, wanted)
+
+    def switch_to_lpcd(self, wakeup_ms: int):
+        '''SWITCH_MODE - 0x0B, LPCD
+        This command switches the field off and puts the PN5180 into Low-Power Card Detection.
+        Every 'wakeup_ms' milliseconds (1 to 65535) the chip wakes up, switches the field on for
+        LPCD_FIELD_ON_TIME, compares the antenna AGC value with the reference and goes back to
+        sleep. When a card changes the AGC value the LPCD_IRQ is set and the chip is back in
+        normal mode, with the field off.
+
+        The IRQ line is the only way to notice the detection without waking the chip, so the
+        IRQ pin is required.'''
+
+        if self._PN5180_IRQ is None:
+            print("*** ERROR: LPCD requires the IRQ pin!")
+            return False
+        if ((wakeup_ms < 1) or (wakeup_ms > 0xFFFF)):
+            print("ERROR: LPCD wake-up period must be 1..65535 ms!\n")
+            return False
+
+        mask = _LPCD_IRQ_STAT | _GENERAL_ERROR_IRQ_STAT
+        self.clear_irq_status(0xffffffff)
+        if (self._irq_enable != mask):
+            self.write_register(regs._IRQ_ENABLE, mask)
+            self._irq_enable = mask
+        self.transceive_command(bytes((_PN5180_SWITCH_MODE, _SWITCH_MODE_LPCD,
+                                       wakeup_ms & 0xFF, (wakeup_ms >> 8) & 0xFF)))
+
+        self.rf_config = None     # The field is off, the Type A configuration must be loaded again
+        self.invalidate_shadow()
+        self.lpcd_active = True
         return True
+
+    def wait_for_lpcd(self, timeout=None):
+        '''Sleep on the IRQ line until the LPCD detected a card, no SPI traffic meanwhile.
+
+        Returns True after a detection (the chip is back in normal mode), False on an error
+        or after 'timeout' seconds (None waits forever). After a timeout the chip is still in
+        LPCD (lpcd_active), wait_for_lpcd() can be called again.'''
+
+        if (not self.lpcd_active):
+            return False
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = 1.0 if deadline is None else min(deadline - time.monotonic(), 1.0)
+            if (remaining <= 0):
+                return False
+            if self._transport.wait_irq(remaining):
+                break
+
+        self.lpcd_active = False
+        status = self.get_irq_status()
+        self.clear_irq_status(0xffffffff)
+        return (0 != (status & _LPCD_IRQ_STAT))
@@ -19,18 +19,13 @@
 # Lesser General Public License for more details.
 #
 
-import PN5180
-from Protocol import ISO14443, ISO15693
-import time
+from Protocol import ISO14443
+from Polling import TagPoller, TAG_ARRIVED
+from DeviceInfo import read_device_info
 import sys
 
-# PN5180 Pins Definition
-PN5180_SPI_BUS = 0
-PN5180_SPI_DEV = 0
-PN5180_NNS = 8
-PN5180_BUSY = 16
-PN5180_RST = 13
-PN5180_IRQ = 23
+# PN5180 Pins Definition, see Transport.py
+from Transport import PN5180_SPI_BUS, PN5180_SPI_DEV, PN5180_NNS, PN5180_BUSY, PN5180_RST, PN5180_IRQ
 
 nfc14443 = ISO14443(PN5180_SPI_BUS, PN5180_SPI_DEV, PN5180_NNS, PN5180_BUSY, PN5180_RST, PN5180_IRQ)
 #nfc14443 = ISO14443()
@@ -43,51 +38,31 @@ nfc14443.begin() # TODO: Check is this function is call
 print("\nPN5180 Hard-Reset...")
 nfc14443.reset() # TODO: Check is this function is call
 
-print("\n\nReading product version...")
-product_version = []
-nfc14443.read_eeprom(PN5180._PRODUCT_VERSION, product_version, 2)
-product_version = sum(product_version, [])[::-1]
-print("Product version = {}.{}".format(product_version[0], product_version[1]))
-#print("Product version = {}".format(product_version))
-
-if ((0xff == product_version[1]) or 0xff == product_version[0]):
+print("\n\nReading device info...")
+info = read_device_info(nfc14443)   # The whole EEPROM with one READ_EEPROM
+if (info is None):
     print("Initialization failed!?")
     print("Reset the system, please")
     sys.exit()  # Halt execute
+print("Product version = {}.{}".format(*info.product_version))
 
-print("\n\nReading firmware version...")
-firmware_version = []
-nfc14443.read_eeprom(PN5180._FIRMWARE_VERSION, firmware_version, 2)
-firmware_version = sum(firmware_version, [])[::-1]
-print("Firmware version = {}.{}".format(firmware_version[0], firmware_version[1]))
+if ((0xff == info.product_version[0]) or 0xff == info.product_version[1]):
+    print("Initialization failed!?")
+    print("Reset the system, please")
+    sys.exit()  # Halt execute
 
-print("\n\nReading EEPROM version...")
-eeprom_version = []
-nfc14443.read_eeprom(PN5180._EEPROM_VERSION, eeprom_version, 2)
-eeprom_version = sum(eeprom_version, [])[::-1]
-print("EEPROM version = {}.{}".format(eeprom_version[0], eeprom_version[1]))
+print("Firmware version = {}.{}".format(*info.firmware_version))
+print("EEPROM version = {}.{}".format(*info.eeprom_version))
 
 print("\n\nEnable RF field...")
-nfc14443.setup_rf()
-
-loop_cnt = 0
+poller = TagPoller(nfc14443, interval=0.05)  # RF field and configuration stay on
+poller.setup()
 
-while True:
-    print("-----")
-    loop_cnt += 1
-    uid = []
-    # Check for ISO14443 card
-    nfc14443.reset() # TODO: Check is this function is call
-    nfc14443.setup_rf()
-    if (nfc14443.is_card_present()):
-        
-        uid_length = nfc14443.read_card_serial(uid)
-        if (uid_length > 0):
-            print("ISO14443 card found, UID=")
-            for i in range(uid_length):
-                print(" 0" if uid[i] < 0x10 else " ")
-                print(uid[i]) # <-------------------------- TODO:Set print as HEX
-    print("-----")
-    time.sleep(1)
+def on_tag_event(event):
+    uid = " ".join("{:02X}".format(b) for b in event.uid)
+    if (event.kind == TAG_ARRIVED):
+        print("ISO14443 card found, UID=" + uid)
+    else:
+        print("ISO14443 card removed, UID=" + uid)
 
-    # 
+poller.run(on_tag_event)
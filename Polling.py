@@ -0,0 +1,162 @@
+# Name:         PN5180 Python Library
+# Description:  Continuous ISO14443A polling with presence tracking.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import time
+from collections import namedtuple
+
+from PN5180 import PN5180Error, NoTag, CollisionError
+from Recovery import RecoveryPolicy
+
+# Tag events emitted by the polling engine, 'reader' names the reader in a ReaderPool,
+# 'technology' the technology that found the tag (Scheduler.PollingScheduler)
+TAG_ARRIVED = 'arrived'
+TAG_DEPARTED = 'departed'
+TagEvent = namedtuple('TagEvent', ['kind', 'uid', 'timestamp', 'reader', 'technology'],
+                      defaults=(None, None))
+
+
+class TagPoller:
+    '''Polling engine for one ISO14443 reader.
+
+    The RF field and the Type A configuration stay on between cycles. A cycle without a
+    known tag is one activation (WUPA, anticollision, select, HLTA). While a tag is present
+    the cycle is a WUPA presence check only, the ATQA has to match the one of the tag; every
+    'verify_every' cycles the tag is activated again to verify its UID. A tag departs after
+    'misses' failed presence checks in a row, so a single lost frame does not produce a
+    departure/arrival pair.
+
+    interval : seconds from the start of one cycle to the start of the next, 0 polls
+               back to back (the cycle time is then given by the RF exchanges only).
+    lpcd_wakeup_ms : if set, the reader waits for a new tag in Low-Power Card Detection
+               (ISO14443.lpcd_activate) with this wake-up period instead of activation
+               cycles, the field is off while no tag is present. Needs the IRQ pin.
+
+    A cycle failing with a PN5180Error (e.g. BusyTimeout) takes the next step of
+    'recovery' (Recovery.RecoveryPolicy with setup()) instead of ending run().'''
+
+    LPCD_WAIT = 0.5  # Seconds a cycle waits in LPCD, so stop() is noticed
+
+    def __init__(self, reader, interval=0.05, misses=2, verify_every=20, lpcd_wakeup_ms=None):
+        self.reader = reader
+        self.interval = interval
+        self.misses = misses
+        self.verify_every = verify_every
+        self.lpcd_wakeup_ms = lpcd_wakeup_ms
+
+        self.uid = None           # UID of the tag in the field, None if there is none
+        self.cycles = 0
+        self._atqa = bytes(2)
+        self._missed = 0
+        self._since_verify = 0
+        self._buffer = bytearray(13)
+        self._probe = bytearray(2)
+        self._running = False
+        self.recovery = RecoveryPolicy(reader, setup=self.setup)
+
+    def setup(self):
+        '''Switch the field on once, the cycles keep it on.'''
+        return self.reader.setup_rf()
+
+    def _activate(self, lpcd=False):
+        if lpcd:
+            uid_length = self.reader.lpcd_activate(self._buffer, self.lpcd_wakeup_ms, TagPoller.LPCD_WAIT)
+            if (uid_length == 0):
+                return None
+            atqa, uid = bytes(self._buffer[0:2]), bytes(self._buffer[3:3 + uid_length])
+        else:
+            try:
+                tag = self.reader.activate_type_A(1)
+            except (NoTag, CollisionError):
+                return None
+            atqa, uid = tag.atqa, tag.uid
+        self.reader.mifare_halt()  # WUPA wakes it up in the next cycle
+        self._atqa = atqa
+        return uid
+
+    def poll_once(self):
+        '''Run one polling cycle, returns the list of TagEvents it caused.'''
+        self.cycles += 1
+        events = []
+
+        if (self.uid is None):
+            uid = self._activate(self.lpcd_wakeup_ms is not None)
+            if (uid is not None):
+                self.uid = uid
+                self._missed = 0
+                self._since_verify = 0
+                events.append(TagEvent(TAG_ARRIVED, uid, time.monotonic()))
+            return events
+
+        self._since_verify += 1
+        if (self._since_verify >= self.verify_every):
+            self._since_verify = 0
+            uid = self._activate()
+            present = (uid is not None)
+            if present and uid != self.uid:
+                now = time.monotonic()
+                events.append(TagEvent(TAG_DEPARTED, self.uid, now))
+                events.append(TagEvent(TAG_ARRIVED, uid, now))
+                self.uid = uid
+        else:
+            present = self.reader.wakeup_type_A(self._probe) and (self._probe == self._atqa)
+
+        if present:
+            self._missed = 0
+        else:
+            self._missed += 1
+            if (self._missed >= self.misses):
+                events.append(TagEvent(TAG_DEPARTED, self.uid, time.monotonic()))
+                self.uid = None
+        return events
+
+    def cycle(self):
+        '''poll_once(), a PN5180Error goes to the recovery policy (no events then).'''
+        try:
+            events = self.poll_once()
+        except PN5180Error as error:
+            self.recovery.failed(error)
+            return ()
+        self.recovery.succeeded()
+        return events
+
+    def run(self, callback, cycles=None, idle=None):
+        '''Poll until stop() is called (or 'cycles' cycles ran) and hand every event to
+        callback(event). idle(deadline), if given, is called between the cycles with the
+        time.monotonic() of the next one; it may use the reader until then, e.g. to run
+        queued commands.'''
+        self._running = True
+        next_cycle = time.monotonic()
+        while self._running and (cycles is None or cycles > 0):
+            for event in self.cycle():
+                callback(event)
+            if cycles is not None:
+                cycles -= 1
+            next_cycle += self.interval
+            if idle is not None:
+                idle(next_cycle)
+            delay = next_cycle - time.monotonic()
+            if (delay > 0):
+                time.sleep(delay)
+            else:
+                next_cycle = time.monotonic()  # Overrun, don't try to catch up
+
+    def stop(self):
+        self._running = False
+
+    def events(self):
+        '''Generator over the TagEvents of an endless polling loop.'''
+        next_cycle = time.monotonic()
+        while True:
+            yield from self.cycle()
+            next_cycle += self.interval
+            delay = next_cycle - time.monotonic()
+            if (delay > 0):
+                time.sleep(delay)
+            else:
+                next_cycle = time.monotonic()
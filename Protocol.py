@@ -7,131 +7,444 @@
 #       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
 #
 
-from PN5180 import PN5180, regs
+import time
+from collections import namedtuple
+
+from PN5180 import PN5180, Batch, regs, NoTag, CollisionError, RxError, _RX_NUM_BYTES_RECEIVED, _RX_INTEGRITY_ERROR, \
+    _RX_COLLISION_DETECTED, _RX_COLL_POS_SHIFT, _RX_COLL_POS_MASK, \
+    _RX_IRQ_STAT, _RX_SOF_DET_IRQ_STAT, _GENERAL_ERROR_IRQ_STAT
+
+_WUPA = bytes((0x52,))
+_HLTA = bytes((0x50, 0x00))
+
+# A Type A tag found by the anticollision
+TypeATag = namedtuple('TypeATag', ['uid', 'atqa', 'sak'])
+
+# ISO15693 tag found by the inventory, and its GET_SYSTEM_INFO answer
+VicinityTag = namedtuple('VicinityTag', ['uid', 'dsfid'])
+SystemInfo = namedtuple('SystemInfo', ['uid', 'dsfid', 'afi', 'blocks', 'block_size', 'ic_reference'])
+
+# ISO14443B tag answering WUPB, and FeliCa (NFC-F) tag answering POLLING
+TypeBTag = namedtuple('TypeBTag', ['pupi', 'application_data', 'protocol_info'])
+TypeFTag = namedtuple('TypeFTag', ['idm', 'pmm'])
+
+_WUPB = bytes((0x05, 0x00, 0x08))                           # APf, all AFIs, WUPB with 1 slot
+_FELICA_POLLING = bytes((0x06, 0x00, 0xFF, 0xFF, 0x00, 0x00))  # Any system code, 1 slot
+
+# An NDEF record, tnf is the type name format (1 well-known, 2 media type, 4 external, ...)
+NdefRecord = namedtuple('NdefRecord', ['tnf', 'type', 'id', 'payload'])
+
+
+def _type_A_request(request, load):
+    '''Precompiled start of the Type A activation: configuration (if 'load'), Crypto1 and
+    CRC off, REQA/WUPA and the ATQA, then the first ANTICOLLISION round of cascade level 1
+    (RX_STATUS and 5 bytes), which is all a single tag needs.
+    Returns the batch and the index of its ATQA step.'''
+    batch = Batch()
+    if load:
+        batch.load_rf_config(0x00, 0x80)
+    batch.write_register_with_and_mask(regs._SYSTEM_CONFIG, 0xFFFFFFBF)   # Crypto1 off
+    batch.write_register_with_and_mask(regs._CRC_RX_CONFIG, 0xFFFFFE3E)   # CRC, RX_BIT_ALIGN off
+    batch.write_register_with_and_mask(regs._CRC_TX_CONFIG, 0xFFFFFFFE)
+    batch.send_data(bytes((request,)), 0x07).wait_for_rx().read_data(2)
+    atqa_step = len(batch) - 1
+    batch.send_data(bytes((0x93, 0x20))).wait_for_rx().read_register(regs._RX_STATUS).read_data(5)
+    return batch, atqa_step
+
+# (request, load the configuration) -> (Batch, ATQA step)
+_TYPE_A_REQUEST = {(request, load): _type_A_request(request, load)
+                   for request in (0x26, 0x52) for load in (False, True)}
+
+# MIFARE Classic
+MIFARE_KEY_A = 0x60
+MIFARE_KEY_B = 0x61
+MIFARE_DEFAULT_KEYS = (bytes.fromhex('FFFFFFFFFFFF'), bytes.fromhex('A0A1A2A3A4A5'),
+                       bytes.fromhex('D3F7D3F7D3F7'), bytes.fromhex('000000000000'))
+_MIFARE_READ = 0x30
+_MIFARE_WRITE = 0xA0
+_MIFARE_ACK = 0x0A
+_MIFARE_SECTORS = {0x09: 5, 0x08: 16, 0x18: 40}   # SAK -> sectors (Mini, 1K, 4K)
 
 class ISO14443(PN5180):
-    def __init__(self, bus, device, nns_pin, busy_pin, rst_pin, irq_pin):
-        super().__init__(bus, device, nns_pin, busy_pin, rst_pin, irq_pin)
+    def __init__(self, bus, device, nns_pin, busy_pin, rst_pin, irq_pin, transport=None):
+        super().__init__(bus, device, nns_pin, busy_pin, rst_pin, irq_pin, transport=transport)
+        self._ac_frame = bytearray(7)      # REQA/WUPA, ANTICOLLISION and SELECT frames
+        self._ac_received = bytearray(5)   # ANTICOLLISION answer
+        self._mf_frame = bytearray(2)      # MIFARE READ/WRITE command
+        self.mifare_keys = {}              # UID -> {sector: (key type, key)} that worked
 
     def rx_bytes_received(self):
-        pass
+        '''Number of bytes in the reception buffer (RX_STATUS).'''
+        status = PN5180.read_register(self, regs._RX_STATUS)
+        return status & _RX_NUM_BYTES_RECEIVED
 
     # ------------------------------------
     #       Mifare Typa A Functions
 
     def mifare_activate_type_A(self, buffer, kind):
-        '''buffer : must be 10 byte array
+        '''buffer : must be a 10 byte bytearray (13 bytes for triple size UIDs), filled in place
         buffer[0-1] is ATQA
         buffer[2] is sak
         buffer[3-6] is 4 byte UID
         buffer[7-9] is remaining 3 bytes of UID 7 Byte UID tags
+        buffer[10-12] is remaining 3 bytes of UID 10 Byte UID tags
         kind : 0 we send REQA, 1 we send WUPA
-        
+
+        With several tags in the field the anticollision selects one of them, see
+        inventory_type_A() to read all.
+
         return value: the uid length:
          - zero if no tag was recognized
          - single Size UID (4 byte)
          - double Size UID (7 byte)
-         - triple Size UID (10 byte) - not yet supported'''
+         - triple Size UID (10 byte)'''
 
-        cmd = [None] * 7
-        uid_length = 0
-        # Load standard TypeA protocol
-        if (not PN5180.load_rf_config(self, 0x0, 0x80)): return 0
+        uid_length = self._activate_into(buffer, kind)
+        for i in range(uid_length):
+            print ("  Card Serial Number: 0x{:02x}".format(buffer[3 + i]))
+        return uid_length
+
+    def _activate_into(self, buffer, kind):
+        '''mifare_activate_type_A() without printing the UID.'''
+        try:
+            tag = self.activate_type_A(kind)
+        except (NoTag, CollisionError):
+            return 0
+
+        uid_length = len(tag.uid)
+        if ((3 + uid_length) > len(buffer)):
+            print("ERROR: buffer too small for a {} byte UID!\n".format(uid_length))
+            return 0
+        buffer[0:2] = tag.atqa
+        buffer[2] = tag.sak
+        buffer[3:3 + uid_length] = tag.uid
+        return uid_length
+
+    def activate_type_A(self, kind=1):
+        '''Activate one Type A tag, kind : 0 REQA, 1 WUPA.
+        Returns its TypeATag, raises NoTag if no tag answered, CollisionError if tags
+        answered but none could be selected and PN5180Error on a fault of the reader.'''
+
+        metrics = self.metrics
+        started = time.perf_counter_ns() if metrics else 0
+        request = 0x26 if kind == 0 else 0x52
+        # Configuration, request, ATQA and the first anticollision round in one batch
+        batch, atqa_step = _TYPE_A_REQUEST[request, (0x00, 0x80) != self.rf_config]
+        result = self.run_batch(batch)
+        if ((not result.ok) and (result.failed <= atqa_step)):
+            raise result.error
+        if metrics: started = metrics.phase('request', started)
+        atqa = bytearray(result.responses[atqa_step])
+        first = None
+        if (result.ok):
+            status = int.from_bytes(result.responses[-2], byteorder='little')
+            cl = bytearray(result.responses[-1])
+            if ((0 == (status & _RX_COLLISION_DETECTED)) and (5 == (status & _RX_NUM_BYTES_RECEIVED)) and
+                    ((cl[0] ^ cl[1] ^ cl[2] ^ cl[3]) == cl[4])):
+                first = cl
+        frame = self._ac_frame
+        frame[0] = request
+        tag = self._select_cascade(frame, atqa, metrics, started, first)
+        if (tag is None):
+            raise CollisionError("Type A activation failed after the ATQA {}".format(atqa.hex()))
+        return tag
+
+    def inventory_type_A(self, max_tags=16):
+        '''Read all Type A tags in the field in one pass.
+
+        Every tag the anticollision finds is selected and halted, so the following REQA is
+        only answered by the tags not read yet. The first round sends WUPA, tags halted
+        before (e.g. by the polling engine) are included. A tag found again (it missed the
+        HLTA) is halted again and not listed twice.
+
+        Returns a list of TypeATag(uid, atqa, sak), the tags are left in HALT state.'''
+
+        tags = []
+        if (not self._prepare_type_A()): return tags
+        uids = set()
+        request = 0x52
+        rounds = 2 * max_tags
+        while ((len(tags) < max_tags) and (rounds > 0)):
+            rounds -= 1
+            tag = self._activated(request)
+            if (tag is None):
+                break
+            if (tag.uid not in uids):
+                uids.add(tag.uid)
+                tags.append(tag)
+            self.mifare_halt()
+            if (not self._set_crc(False)): break
+            request = 0x26
+        return tags
+
+    def _prepare_type_A(self):
+        '''Type A configuration loaded, Crypto1 and CRC off, as needed for REQA/WUPA.'''
+        # Load standard TypeA protocol, unless it is still loaded
+        if ((0x00, 0x80) != self.rf_config):
+            if (not PN5180.load_rf_config(self, 0x0, 0x80)): return False
         # OFF Crypto
-        if (not PN5180.write_register_with_and_mask(self, regs._SYSTEM_CONFIG, 0xFFFFFFBF)): return 0
-        # Clear RX CRC
-        if (not PN5180.write_register_with_and_mask(self, regs._CRC_RX_CONFIG, 0xFFFFFFFE)): return 0
-        # Clear TX CRC
-        if (not PN5180.write_register_with_and_mask(self, regs._CRC_TX_CONFIG, 0xFFFFFFFE)): return 0
-        # Send REQA/WUPA, 7 bits in last byte
-        cmd[0] = 0x26 if kind == 2 else 0x52
-        if (not PN5180.send_data(self, cmd, 1, 0x07)): return 0
-        # READ 2 bytes ATQA into buffer
-        if (not PN5180.read_data(self, 2, buffer)): return 0
-        # Send Anti collision 1, 8 bits in last byte
-        cmd[0] = 0x93
-        cmd[1] = 0x20
-        if (not PN5180.send_data(self, cmd, 2, 0x00)): return 0
-        # Read 5 bytes, we will store at offset 2 for later usage
-        tmp = []
-        if (not PN5180.read_data(self, 5, tmp)): return 0
-        cmd[2] = tmp
-        cmd = list(self.flatten(cmd))
+        if (not PN5180.write_register_with_and_mask(self, regs._SYSTEM_CONFIG, 0xFFFFFFBF)): return False
+        # RX CRC and RX_BIT_ALIGN off, then TX CRC off
+        return (PN5180.write_register_with_and_mask(self, regs._CRC_RX_CONFIG, 0xFFFFFE3E) and
+                PN5180.write_register_with_and_mask(self, regs._CRC_TX_CONFIG, 0xFFFFFFFE))
+
+    def _set_crc(self, on):
+        '''Switch the RX and TX CRC calculation on or off.'''
+        if on:
+            return (PN5180.write_register_with_or_mask(self, regs._CRC_RX_CONFIG, 0x01) and
+                    PN5180.write_register_with_or_mask(self, regs._CRC_TX_CONFIG, 0x01))
+        return (PN5180.write_register_with_and_mask(self, regs._CRC_RX_CONFIG, 0xFFFFFFFE) and
+                PN5180.write_register_with_and_mask(self, regs._CRC_TX_CONFIG, 0xFFFFFFFE))
+
+    def _set_rx_bit_align(self, align):
+        '''RX_BIT_ALIGN (CRC_RX_CONFIG bits 6-8): bit position of the first received bit.'''
+        if (not PN5180.write_register_with_and_mask(self, regs._CRC_RX_CONFIG, 0xFFFFFE3F)): return False
+        if (align):
+            return PN5180.write_register_with_or_mask(self, regs._CRC_RX_CONFIG, align << 6)
+        return True
+
+    def _activate_one(self, request):
+        '''REQA/WUPA, then ANTICOLLISION and SELECT on every cascade level. CRC must be off.
+        Returns the TypeATag of the selected tag, raises NoTag if no tag answered the request
+        and CollisionError if the activation failed after it.'''
+
+        metrics = self.metrics  # Phase timing, started is the begin of the current phase
+        started = time.perf_counter_ns() if metrics else 0
+        frame = self._ac_frame
+        frame[0] = request
+        atqa = bytearray(2)
+        if not (PN5180.send_data(self, frame, 1, 0x07) and PN5180.wait_for_rx(self) and
+                PN5180.read_data(self, atqa)):
+            raise NoTag("No answer to REQA/WUPA")
+        if metrics: started = metrics.phase('request', started)
+        tag = self._select_cascade(frame, atqa, metrics, started)
+        if (tag is None):
+            raise CollisionError("Type A activation failed after the ATQA {}".format(atqa.hex()))
+        return tag
+
+    def _activated(self, request=0x52):
+        '''_activate_one(), None instead of NoTag/CollisionError.'''
+        try:
+            return self._activate_one(request)
+        except (NoTag, CollisionError):
+            return None
+
+    def _select_cascade(self, frame, atqa, metrics, started, first=None):
+        '''Anticollision and select on every cascade level, None on failure. 'first' is the
+        anticollision answer of cascade level 1 if it is known already.'''
+
+        uid = bytearray()
+        for sel in (0x93, 0x95, 0x97):
+            cl = first if ((sel == 0x93) and (first is not None)) else self._anticollision(sel)
+            if (cl is None): return None
+            if metrics: started = metrics.phase('anticollision', started)
+            # SELECT with the 4 bytes and the BCC of this cascade level
+            if (not self._set_crc(True)): return None
+            frame[0] = sel
+            frame[1] = 0x70
+            frame[2:7] = cl
+            try:
+                sak = PN5180.exchange(self, memoryview(frame)[:7])
+            except (NoTag, CollisionError, RxError):
+                return None
+            if (1 != len(sak)): return None
+            if metrics: started = metrics.phase('select', started)
+            if ((sak[0] & 0x04) == 0):  # UID complete
+                uid += cl[0:4]
+                return TypeATag(bytes(uid), bytes(atqa), sak[0])
+            # Cascade bit: first byte is the cascade tag 88(CT), the UID continues on the next level
+            if (cl[0] != 0x88): return None
+            uid += cl[1:4]
+            if (not self._set_crc(False)): return None
+        return None
+
+    def _anticollision(self, sel):
+        '''ANTICOLLISION loop of one cascade level, CRC must be off.
+        Returns the 4 UID bytes and the BCC of one tag (bytearray of 5), None on failure.
+
+        Every round sends the UID bits known so far (NVB gives their number) and the tags
+        matching them answer with the remaining bits. If answers collide, RX_STATUS gives the
+        position of the first collision: that bit is taken as 1 and the next round resolves
+        the tags below it. A single tag in the field needs one round.'''
+
+        frame = self._ac_frame
+        received = self._ac_received
+        cl = bytearray(5)
+        known = 0   # Number of valid UID bits in cl
+        align = 0   # RX_BIT_ALIGN currently set
+        aligned = False
+        try:
+            while True:
+                nbytes = known >> 3
+                nbits = known & 0x07
+                sent = nbytes + (1 if nbits else 0)
+                frame[0] = sel
+                frame[1] = ((2 + nbytes) << 4) | nbits
+                frame[2:2 + sent] = cl[0:sent]
+                if (nbits != align):
+                    # The answer continues the partly sent byte
+                    aligned = True
+                    if (not self._set_rx_bit_align(nbits)): return None
+                    align = nbits
+                if (not PN5180.send_data(self, frame, 2 + sent, nbits)): return None
+                if (not PN5180.wait_for_rx(self)): return None
+                status = PN5180.read_register(self, regs._RX_STATUS)
+                length = min(status & _RX_NUM_BYTES_RECEIVED, 5 - nbytes)
+                if (length):
+                    if (not PN5180.read_data(self, memoryview(received)[:length])): return None
+                    # Merge, the first received byte shares its low bits with the last sent byte
+                    received[0] = (received[0] & (0xFF << nbits) & 0xFF) | (cl[nbytes] & ((1 << nbits) - 1))
+                    cl[nbytes:nbytes + length] = received[0:length]
+                if (0 == (status & _RX_COLLISION_DETECTED)):
+                    break
+                pos = (nbytes << 3) + ((status >> _RX_COLL_POS_SHIFT) & _RX_COLL_POS_MASK)
+                if ((pos < known) or (pos >= 40)): return None
+                byte = pos >> 3
+                cl[byte] = (cl[byte] & ((1 << (pos & 0x07)) - 1)) | (1 << (pos & 0x07))
+                cl[byte + 1:5] = bytes(4 - byte)
+                known = pos + 1
+        finally:
+            # RX_BIT_ALIGN survives the next LOAD_RF_CONFIG-less REQA, clear it on every way out
+            if (aligned):
+                self._set_rx_bit_align(0)
+
+        if ((cl[0] ^ cl[1] ^ cl[2] ^ cl[3]) != cl[4]):
+            return None
+        return cl
+
+    def wakeup_type_A(self, atqa):
+        '''Presence check: send WUPA and read the ATQA into atqa (2 byte bytearray).
+
+        Unlike mifare_activate_type_A no anticollision is done. The tag is sent back to IDLE
+        afterwards (a frame without CRC is invalid in READY state), so the next WUPA or REQA
+        is answered again. Returns True if a tag answered.'''
+
+        if (not self._prepare_type_A()): return False
+        if (not PN5180.send_data(self, _WUPA, 1, 0x07)): return False
+        if (not PN5180.wait_for_rx(self)): return False
+        if (not PN5180.read_data(self, atqa)): return False
+        PN5180.transmit(self, _HLTA)  # No CRC, READY -> IDLE
+        return True
+
+    def mifare_block_read(self, block, buffer):
+        '''Read one 16 byte block into buffer (bytearray or memoryview of 16 bytes).
+        The sector of the block must be authenticated. Returns True on success.'''
+
+        self._mf_frame[0] = _MIFARE_READ
+        self._mf_frame[1] = block
+        # A NAK is 4 bits without CRC, only a complete 16 byte answer is valid
+        return (16 == self._exchange(self._mf_frame, buffer))
+
+    def mifare_block_write_16(self, block, data):
+        '''Write 16 bytes to one block, the sector of the block must be authenticated.
+        The card acknowledges both parts of the WRITE with a 4 bit ACK, sent without CRC.
+        Returns True on success.'''
+
+        if (16 != len(data)):
+            print("ERROR: mifare_block_write_16 needs 16 bytes!\n")
+            return False
+        # Clear RX CRC for the ACKs
+        if (not PN5180.write_register_with_and_mask(self, regs._CRC_RX_CONFIG, 0xFFFFFFFE)): return False
+        self._mf_frame[0] = _MIFARE_WRITE
+        self._mf_frame[1] = block
+        success = self._mifare_acked(self._mf_frame, 2) and self._mifare_acked(data, 16)
         # Enable RX CRC calculation
-        if (not PN5180.write_register_with_or_mask(self, regs._CRC_RX_CONFIG, 0x01)): return 0
-        # Enable TX CRC calculation
-        if (not PN5180.write_register_with_or_mask(self, regs._CRC_TX_CONFIG, 0x01)): return 0
-        # Send Select anti collision 1, the remaining bytes are already in offset 2 onwards
-        cmd[0] = 0x93
-        cmd[1] = 0x70
-        # print("CMD: --> ", cmd)
-        if (not PN5180.send_data(self, cmd, 7, 0x00)): return 0
-        # Read 1 byte SAK into buffer[2]
-        tmp = []
-        if (not PN5180.read_data(self, 1, tmp)): return 0
-        buffer[2] = tmp
-        buffer = list(self.flatten(buffer))
-        # Check if the tag is 4 Byte UID or 7 byte UID and requires anti collision 2
-        # If Bit 3 is 0 it is 4 Byte UID
-        if ((buffer[2] & 0x04) == 0):
-            # Take first 4 bytes of anti collision as UID store at offset 3 onwards. Job Done.
-            for i in range(4):
-                buffer[i + 3] = cmd[i + 2]
-                print ("  Card Serial Number: 0x{:02x}".format(buffer[i + 3]))
-            uid_length = 4
-        else:
-            # Take first 3 bytes of UID, Ignore first byte 88(CT)
-            if (cmd[2] != 0x88):
-                return 0
-            for i in range(3):
-                buffer[i + 3] = cmd[i + 3]
-                print ("  Card Serial Number: 0x{:02x}".format(buffer[i + 3]))
-            # Clear RX CRC
-            if (not PN5180.write_register_with_and_mask(self, regs._CRC_RX_CONFIG, 0xFFFFFFFE)): return 0
-            # Clear TX CRC
-            if (not PN5180.write_register_with_and_mask(self, regs._CRC_TX_CONFIG, 0xFFFFFFFE)): return 0
-            # Do anti collision 2
-            cmd[0] = 0x95
-            cmd[1] = 0x20
-            if (not PN5180.send_data(self, cmd, 2, 0x00)): return 0
-            # Read 5 bytes. We will sotre at offset 2 for later use
-            tmp = []
-            if (not PN5180.read_data(self, 5, tmp)): return 0
-            cmd[2] = tmp
-            cmd = list(self.flatten(cmd))
-            #   first 4 bytes belongs to last 4 UID bytes, we keep it
-            for i in range(4):
-                buffer[i + 6] = cmd[i + 2]
-                print ("  Card Serial Number: 0x{:02x}".format(buffer[i + 6]))
-            # Enable RX CRC calculation
-            if (not PN5180.write_register_with_or_mask(self, regs._CRC_RX_CONFIG, 0x01)): return 0
-            # Enable TX CRC calculation
-            if (not PN5180.write_register_with_or_mask(self, regs._CRC_TX_CONFIG, 0x01)): return 0
-            # Send Select anti collision 2
-            cmd[0] = 0x95
-            cmd[1] = 0x70
-            if (not PN5180.send_data(self, cmd, 7, 0x00)): return 0
-            # Read 1 byte SAK into buffer[2]
-            tmp = []
-            if (not PN5180.read_data(self, 1, tmp)): return 0
-            buffer[2] = tmp
-            buffer = list(self.flatten(buffer))
-            uid_length = 7
-        
-        return uid_length
+        PN5180.write_register_with_or_mask(self, regs._CRC_RX_CONFIG, 0x01)
+        return success
+
+    def _mifare_acked(self, data, length):
+        try:
+            ack = PN5180.exchange(self, memoryview(data)[:length])
+        except (NoTag, CollisionError, RxError):
+            return False
+        return (1 == len(ack)) and (_MIFARE_ACK == (ack[0] & 0x0F))
+
+    def _exchange(self, frame, buffer, timeout=None):
+        '''Send a frame and read the answer into buffer (bytearray or memoryview).
+        Returns the number of bytes read (at most len(buffer)), None if no answer arrived
+        within 'timeout' seconds (default rx_timeout) or it had a collision, CRC or parity error.'''
+
+        if (not PN5180.send_data(self, frame, len(frame), 0x00)): return None
+        if (not PN5180.wait_for_rx(self, timeout)): return None
+        try:
+            length = min(PN5180.received_length(self), len(buffer))
+        except (CollisionError, RxError):
+            return None
+        if (length and (not PN5180.read_data(self, memoryview(buffer)[:length]))): return None
+        return length
+
+    def mifare_sector_blocks(self, sector):
+        '''First block and number of blocks of a sector (sectors 32-39 of 4K cards have 16).'''
+        if (sector < 32):
+            return 4 * sector, 4
+        return 128 + 16 * (sector - 32), 16
+
+    def read_sectors(self, sectors, keys=MIFARE_DEFAULT_KEYS, key_types=(MIFARE_KEY_A, MIFARE_KEY_B)):
+        '''Read whole sectors of the MIFARE Classic card in the field.
+
+        The card is activated once. Each sector is authenticated once and all of its blocks
+        are read back to back. The keys that worked are kept per UID in mifare_keys and tried
+        first the next time, so a known card needs a single authentication per sector. A
+        failed authentication costs a new activation of the card (it goes idle).
 
-    def mifare_block_read():
-        pass
+        sectors : iterable of sector numbers, None reads all sectors of the card (Mini, 1K
+                  or 4K by its SAK)
 
-    def mifare_block_write_16():
-        pass
+        Returns {sector: bytes} of the sectors that could be read, the card is halted.'''
 
-    def mifare_halt():
-        cmd = [None] * 1
-        # Mifare Halt
-        cmd[0] = 0x50
-        cmd[1] = 0x00
-        PN5180.send_data(self, cmd, 2, 0x00)
+        return self._read_sectors(sectors, keys, key_types)[0]
+
+    def _read_sectors(self, sectors, keys, key_types):
+        '''read_sectors(), returns (result, sectors).'''
+        result = {}
+        if (not self._prepare_type_A()): return result, ()
+        tag = self._activated()
+        if (tag is None): return result, ()
+        if (sectors is None):
+            sectors = range(_MIFARE_SECTORS.get(tag.sak, 16))
+        auth_uid = tag.uid[-4:]   # UID bytes of the last cascade level
+        known = self.mifare_keys.setdefault(tag.uid, {})
+        candidates = [(key_type, key) for key_type in key_types for key in keys]
+
+        for sector in sectors:
+            first, count = self.mifare_sector_blocks(sector)
+            tried = ([known[sector]] if sector in known else []) + candidates
+            for key_type, key in tried:
+                if (PN5180.mifare_authenticate(self, first, key, key_type, auth_uid)):
+                    known[sector] = (key_type, key)
+                    break
+                known.pop(sector, None)
+                # The card is idle now, select it again for the next key
+                if (not self._prepare_type_A()): return result, sectors
+                again = self._activated()
+                if ((again is None) or (again.uid != tag.uid)):
+                    return result, sectors
+            else:
+                continue
+
+            data = bytearray(16 * count)
+            view = memoryview(data)
+            for i in range(count):
+                if (not self.mifare_block_read(first + i, view[16 * i:16 * i + 16])):
+                    break
+            else:
+                result[sector] = bytes(data)
+
+        self.mifare_halt()
+        return result, sectors
+
+    def dump(self, keys=MIFARE_DEFAULT_KEYS, key_types=(MIFARE_KEY_A, MIFARE_KEY_B)):
+        '''Memory of the whole MIFARE Classic card, None if a sector could not be read;
+        read_sectors() returns what was readable.'''
+
+        data, sectors = self._read_sectors(None, keys, key_types)
+        if ((not data) or (len(data) != len(sectors))):
+            return None
+        return b''.join(data[sector] for sector in sectors)
+
+    def mifare_halt(self):
+        # Mifare Halt, sent completely before the transceiver is touched again
+        PN5180.transmit(self, _HLTA)
         return True
 
     # ------------------------------------
@@ -153,16 +466,16 @@ class ISO14443(PN5180):
         return True
 
     def read_card_serial(self, buffer):
-        response = []
+        '''buffer : bytearray (or list) receiving the 7 UID bytes at offset 0
+        (10 bytes for triple size UIDs)'''
+        response = bytearray(13)
         uid_length = 0
         # Always return 10 bytes
         # Offset 0..1 id ATQA
         # Offset 2 is SAK.
         # UID 4 bytes : offset 3 to 6 is UID, offset 7 to 9 to Zero
         # UID 7 bytes : offset 3 to 9 is UID
-        
-        for i in range(10): response.append(0)
-        
+
         uid_length = self.mifare_activate_type_A(response, 1)
         # print("uid_length: -> ", uid_length)
         # print("response: -> ", response)
@@ -174,31 +487,694 @@ class ISO14443(PN5180):
         if ((response[3] == 0xFF) and (response[4] == 0xFF) and (response[5] == 0xFF) and (response[6] == 0xFF)):
             return 0
         
-        for i in range(7):
-            buffer[i] = response[i + 3]
+        uid_end = 3 + max(7, uid_length)
+        buffer[0:uid_end - 3] = response[3:uid_end]
         self.mifare_halt()
         
         return uid_length
 
+    def lpcd_activate(self, buffer, wakeup_ms=100, timeout=None):
+        '''Wait for a card in Low-Power Card Detection and activate it.
+
+        The field stays off while no card is around, the chip checks the antenna every
+        'wakeup_ms' milliseconds and the host sleeps on the IRQ line. On a detection the
+        Type A configuration is loaded, the field is switched on and the card is activated
+        like with mifare_activate_type_A(buffer, 1), without printing the UID. A detection
+        without a Type A card (e.g. metal near the antenna) goes back to LPCD.
+
+        Returns the UID length, 0 if no card was activated within 'timeout' seconds (None
+        waits forever). The chip stays in LPCD after a timeout, the next call continues.'''
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if (not self.lpcd_active):
+                if (not self.switch_to_lpcd(wakeup_ms)): return 0
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if (remaining is not None) and (remaining <= 0):
+                return 0
+            if (not self.wait_for_lpcd(remaining)):
+                if self.lpcd_active:  # Timeout, still waiting in LPCD
+                    return 0
+                continue
+            if (not self.setup_rf()): return 0
+            uid_length = self._activate_into(buffer, 1)
+            if (uid_length):
+                return uid_length
+
     def is_card_present(self):
-        buffer = []
+        buffer = bytearray(13)
         serial = self.read_card_serial(buffer)
         #print("serial: -> ", serial)
         return serial >= 4
-    
-    def flatten(self, list):
-        '''Helper function for flatten an irregulat list of lists.'''
-        for item in list:
-            try:
-                yield from self.flatten(item)
-            except TypeError:
-                yield item
     # ------------------------------------
 
 
+class ISO14443_4:
+    '''ISO14443-4 (ISO-DEP, T=CL) session with one card, on top of an ISO14443 reader.
+
+    activate() selects the card, sends RATS and switches both directions to the highest
+    bitrate the card and the reader (up to 848 kbit/s) have in common with PPS and the
+    matching LOAD_RF_CONFIG pair. transceive_apdu() splits the command into I-blocks of
+    the frame size of the card (FSC), collects chained answers, answers WTX requests and
+    repeats lost blocks. CID and NAD are not used.'''
+
+    # FSDI 8: frames of up to 256 bytes fit into the 508 byte reception buffer of the PN5180
+    FSDI = 8
+    FS = (16, 24, 32, 40, 48, 64, 96, 128, 256, 512, 1024, 2048, 4096)
+    MAX_FRAME = 262                 # send_data() takes 260 bytes, the chip adds the CRC
+    RETRIES = 2                     # R(NAK) after a lost or corrupted answer
+    BIT_TIME = 9440                 # ns, 128 / 13.56 MHz at 106 kbit/s
+    # LOAD_RF_CONFIG pairs of ISO14443A at 106, 212, 424 and 848 kbit/s
+    RF_CONFIGS = ((0x00, 0x80), (0x01, 0x81), (0x02, 0x82), (0x03, 0x83))
+
+    def __init__(self, reader, max_bitrate=3):
+        '''max_bitrate : highest bitrate to negotiate, 0 (106 kbit/s) to 3 (848 kbit/s)'''
+        self.reader = reader
+        self.max_bitrate = max_bitrate
+        self.tag = None           # TypeATag of the activated card
+        self.ats = None           # None while no session is active
+        self.fsc = 32
+        self.fwt = 0.0048         # Frame waiting time (s)
+        self.bitrate = (0, 0)     # (PCD -> PICC, PICC -> PCD), 0..3 for 106..848 kbit/s
+        self._block_number = 0
+        self._received = bytearray(508)
+        self._received_view = memoryview(self._received)
+
+    def activate(self):
+        '''Activate a card (anticollision, select), send RATS and PPS.
+        Returns the ATS (bytes), None if no ISO14443-4 card could be activated.'''
+
+        reader = self.reader
+        self.ats = None
+        if (not reader._prepare_type_A()): return None
+        tag = reader._activated()
+        if ((tag is None) or (0 == (tag.sak & 0x20))):
+            return None
+        self.tag = tag
+
+        # RATS, CID 0; the activation frame waiting time is 4.8 ms
+        ats = self._exchange(bytes((0xE0, self.FSDI << 4)), 0.0048)
+        if ((ats is None) or (0 == len(ats)) or (ats[0] != len(ats))):
+            return None
+        ats = bytes(ats)
+
+        t0 = ats[1] if (len(ats) > 1) else 0x02
+        ta, tb, i = 0x00, 0x40, 2
+        if (t0 & 0x10):
+            ta, i = ats[i], i + 1
+        if (t0 & 0x20):
+            tb, i = ats[i], i + 1
+        self.fsc = self.FS[min(t0 & 0x0F, 12)]
+        fwi = 4 if ((tb >> 4) == 15) else (tb >> 4)
+        self.fwt = 302.06e-6 * (1 << fwi)
+        sfgi = tb & 0x0F
+        if (0 < sfgi < 15):
+            time.sleep(302.06e-6 * (1 << sfgi))  # Start-up frame guard time
+
+        # Bitrates: TA bits 4-6 PICC -> PCD (DS), bits 0-2 PCD -> PICC (DR), 212/424/848
+        ds, dr = (ta >> 4) & 0x07, ta & 0x07
+        if (ta & 0x80):  # Same bitrate in both directions only
+            ds = dr = ds & dr
+        dri, dsi = self._highest(dr), self._highest(ds)
+        self.bitrate = (0, 0)
+        if (dri or dsi):
+            pps = self._exchange(bytes((0xD0, 0x11, (dsi << 2) | dri)), self.fwt)
+            if ((pps is not None) and (1 == len(pps)) and (0xD0 == pps[0])):
+                if (not PN5180.load_rf_config(reader, self.RF_CONFIGS[dri][0], self.RF_CONFIGS[dsi][1])):
+                    return None
+                if (not reader._set_crc(True)): return None
+                self.bitrate = (dri, dsi)
+
+        self._block_number = 0
+        self.ats = ats
+        return ats
+
+    def _highest(self, mask):
+        for d in (3, 2, 1):
+            if ((d <= self.max_bitrate) and (mask & (1 << (d - 1)))):
+                return d
+        return 0
+
+    def _exchange(self, frame, timeout):
+        '''Send one frame (CRC on), returns a memoryview of the answer or None.
+        'timeout' is the frame waiting time, the air time of the frame and of the longest
+        possible answer (9 bit times per byte) is added.'''
+        reader = self.reader
+        timeout += ((len(frame) + 2) * 9 * (self.BIT_TIME >> self.bitrate[0]) +
+                    self.FS[self.FSDI] * 9 * (self.BIT_TIME >> self.bitrate[1])) * 1e-9
+        length = reader._exchange(frame, self._received_view, timeout + reader.rx_timeout)
+        if (length is None): return None
+        return self._received_view[:length]
+
+    def _transceive_block(self, block):
+        '''Send a block and return the answer block, after WTX and retransmissions.'''
+        frame = block
+        wtxm = 1
+        retries = self.RETRIES
+        while True:
+            answer = self._exchange(frame, self.fwt * wtxm)
+            wtxm = 1
+            if ((answer is None) or (0 == len(answer))):
+                if (0 == retries):
+                    return None
+                retries -= 1
+                frame = bytes((0xB2 | self._block_number,))  # R(NAK)
+                continue
+            pcb = answer[0]
+            if (((pcb & 0xF7) == 0xF2) and (len(answer) >= 2)):  # S(WTX) request
+                wtxm = answer[1] & 0x3F
+                frame = bytes((0xF2, wtxm))
+                continue
+            if ((frame is not block) and ((pcb & 0xF6) == 0xA2) and ((block[0] & 0xE2) == 0x02)):
+                # R(ACK) to our R(NAK): the card missed the I-block, send it again
+                frame = block
+                continue
+            return answer
+
+    def transceive_apdu(self, apdu):
+        '''Send a command APDU (bytes) and return the response APDU (bytes, including
+        SW1 SW2). Returns None if the exchange failed.'''
+
+        if (self.ats is None):
+            print("ERROR: No ISO14443-4 session, call activate() first!\n")
+            return None
+
+        size = min(self.fsc, self.MAX_FRAME) - 3  # PCB and CRC
+        offset = 0
+        while True:
+            inf = apdu[offset:offset + size]
+            offset += len(inf)
+            chaining = (offset < len(apdu))
+            pcb = 0x02 | self._block_number | (0x10 if chaining else 0x00)
+            answer = self._transceive_block(bytes((pcb,)) + bytes(inf))
+            if (answer is None): return None
+            if (not chaining):
+                break
+            if (((answer[0] & 0xF6) != 0xA2) or ((answer[0] & 0x01) != self._block_number)):
+                return None  # Expected R(ACK) of the chained block
+            self._block_number ^= 1
+
+        response = bytearray()
+        while True:
+            if ((answer[0] & 0xE2) != 0x02):
+                return None  # Expected an I-block
+            self._block_number ^= 1
+            response += answer[1:]
+            if (0 == (answer[0] & 0x10)):
+                return bytes(response)
+            answer = self._transceive_block(bytes((0xA2 | self._block_number,)))  # R(ACK)
+            if (answer is None): return None
+
+    def deselect(self):
+        '''S(DESELECT), the card goes to HALT. The next activation starts at 106 kbit/s.'''
+        if (self.ats is None):
+            return True
+        self.ats = None
+        answer = self._transceive_block(bytes((0xC2,)))
+        return (answer is not None) and (answer[0] & 0xF7) == 0xC2
+
+
+class NTAG:
+    '''NTAG21x and MIFARE Ultralight memory access on top of an ISO14443 reader.
+
+    activate() selects the tag and identifies it with GET_VERSION (tags without it are taken
+    as a MIFARE Ultralight with 16 pages). Memory is read with FAST_READ, up to 127 pages
+    (508 bytes, the size of the reception buffer) per RF exchange, and written page by page
+    with WRITE; pages already holding the data are skipped.'''
+
+    # GET_VERSION (product type, storage size) -> (name, number of pages, last user page)
+    VERSIONS = {
+        (0x04, 0x0F): ('NTAG213', 45, 39),
+        (0x04, 0x11): ('NTAG215', 135, 129),
+        (0x04, 0x13): ('NTAG216', 231, 225),
+        (0x03, 0x0B): ('MF0UL11', 20, 15),
+        (0x03, 0x0E): ('MF0UL21', 41, 35),
+    }
+    FAST_READ_PAGES = 127           # 508 bytes
+    BYTE_TIME = 85e-6               # 9 bits at 106 kbit/s
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.uid = None
+        self.version = None       # GET_VERSION answer, None for tags without the command
+        self.name = None
+        self.pages = 16
+        self.user_end = 15        # Last page of the user memory
+        self._frame = bytearray(6)
+        self._ack = bytearray(1)
+
+    def activate(self):
+        '''Select the tag and identify it. Returns True if an NTAG/Ultralight was found.'''
+        reader = self.reader
+        if (not reader._prepare_type_A()): return False
+        tag = reader._activated()
+        if ((tag is None) or (0x00 != tag.sak) or (7 != len(tag.uid))):
+            return False
+        self.uid = tag.uid
+
+        version = self.get_version()
+        if (version is None):
+            # MIFARE Ultralight (C) doesn't know GET_VERSION and went idle
+            if (not reader._prepare_type_A()): return False
+            tag = reader._activated()
+            if ((tag is None) or (tag.uid != self.uid)):
+                return False
+            self.name, self.pages, self.user_end = 'MF0ICU', 16, 15
+        else:
+            self.name, self.pages, self.user_end = self.VERSIONS.get(
+                (version[2], version[6]), ('NTAG/Ultralight', 16, 15))
+        self.version = version
+        return True
+
+    def get_version(self):
+        '''GET_VERSION (0x60), returns the 8 byte version or None.'''
+        answer = bytearray(8)
+        if (8 != self.reader._exchange(bytes((0x60,)), answer)):
+            return None
+        return bytes(answer)
+
+    def read_pages(self, start, count):
+        '''Read 'count' pages (4 bytes each) from page 'start'. Returns bytes or None.
+
+        FAST_READ (0x3A) reads up to 127 pages per exchange. Tags without GET_VERSION don't
+        support it, for them READ (0x30, 4 pages) is used.'''
+
+        data = bytearray(4 * count)
+        view = memoryview(data)
+        page = start
+        while (page < start + count):
+            if (self.version is not None):
+                n = min(start + count - page, self.FAST_READ_PAGES)
+                frame = bytes((0x3A, page, page + n - 1))
+            else:
+                n = min(start + count - page, 4)
+                frame = bytes((0x30, page))
+            offset = 4 * (page - start)
+            timeout = 4 * n * self.BYTE_TIME + self.reader.rx_timeout
+            if ((4 * n) != self.reader._exchange(frame, view[offset:offset + 4 * n], timeout)):
+                return None
+            page += n
+        return bytes(data)
+
+    def read_user_memory(self):
+        return self.read_pages(4, self.user_end - 3)
+
+    def write_page(self, page, data):
+        '''WRITE (0xA2) of one page, 'data' has 4 bytes. Returns True on ACK.'''
+        reader = self.reader
+        frame = self._frame
+        frame[0] = 0xA2
+        frame[1] = page
+        frame[2:6] = data
+        # Clear RX CRC for the ACK
+        if (not PN5180.write_register_with_and_mask(reader, regs._CRC_RX_CONFIG, 0xFFFFFFFE)): return False
+        success = reader._mifare_acked(frame, 6)
+        PN5180.write_register_with_or_mask(reader, regs._CRC_RX_CONFIG, 0x01)
+        return success
+
+    def compatibility_write(self, page, data):
+        '''COMPATIBILITY_WRITE (0xA0) of one page, the MIFARE Classic WRITE sequence with
+        16 bytes of which only the first 4 are written.'''
+        return self.reader.mifare_block_write_16(page, bytes(data) + bytes(12))
+
+    def write_pages(self, start, data):
+        '''Write 'data' (padded to whole pages) from page 'start'. The pages are read first
+        with FAST_READ, only the ones that change are written. Returns True on success.'''
+        if (len(data) % 4):
+            data = bytes(data) + bytes(4 - len(data) % 4)
+        count = len(data) // 4
+        current = self.read_pages(start, count)
+        for i in range(count):
+            chunk = data[4 * i:4 * i + 4]
+            if ((current is not None) and (current[4 * i:4 * i + 4] == chunk)):
+                continue
+            if (not self.write_page(start + i, chunk)):
+                return False
+        return True
+
+    def read_ndef(self):
+        '''The NDEF message of the tag (bytes), None if there is none.
+
+        The first exchange reads the capability container and the first 60 bytes of the
+        user memory; if the NDEF TLV is longer, the rest is read with as few FAST_READs as
+        possible. Use ndef_records() to walk the records.'''
+
+        first = min(16, self.user_end - 2)
+        head = self.read_pages(3, first)
+        if ((head is None) or (0xE1 != head[0])):
+            return None   # No NDEF capability container
+        data = bytearray(head[4:])    # User memory from page 4 on
+        limit = 4 * (self.user_end - 3)
+
+        def need(end):
+            '''Read on until 'data' holds at least 'end' bytes.'''
+            if (end <= len(data)): return True
+            if (end > limit): return False
+            rest = self.read_pages(4 + len(data) // 4, (end - len(data) + 3) // 4)
+            if (rest is None): return False
+            data.extend(rest)
+            return True
+
+        pos = 0
+        while need(pos + 1):
+            t = data[pos]
+            if (0x00 == t):       # NULL TLV
+                pos += 1
+                continue
+            if (0xFE == t):       # Terminator TLV
+                return None
+            if (not need(pos + 2)): return None
+            if (0xFF == data[pos + 1]):
+                if (not need(pos + 4)): return None
+                length = (data[pos + 2] << 8) | data[pos + 3]
+                value = pos + 4
+            else:
+                length = data[pos + 1]
+                value = pos + 2
+            if (0x03 == t):       # NDEF Message TLV
+                if (not need(value + length)): return None
+                return bytes(data[value:value + length])
+            pos = value + length  # Lock/memory control TLV
+        return None
+
+    def write_ndef(self, message):
+        '''Write an NDEF message as NDEF TLV followed by a Terminator TLV from page 4.'''
+        if (len(message) < 0xFF):
+            tlv = bytes((0x03, len(message))) + bytes(message) + b'\xfe'
+        else:
+            tlv = bytes((0x03, 0xFF, len(message) >> 8, len(message) & 0xFF)) + bytes(message) + b'\xfe'
+        if (len(tlv) > 4 * (self.user_end - 3)):
+            print("ERROR: NDEF message does not fit into the user memory!\n")
+            return False
+        return self.write_pages(4, tlv)
+
+
+def ndef_records(message):
+    '''Generator over the records of an NDEF message, yields NdefRecord(tnf, type, id,
+    payload). Payloads are memoryview slices of 'message', nothing is copied.'''
+    view = memoryview(message)
+    pos = 0
+    while (pos < len(view)):
+        header = view[pos]
+        pos += 1
+        type_length = view[pos]
+        pos += 1
+        if (header & 0x10):       # SR, 1 byte payload length
+            payload_length = view[pos]
+            pos += 1
+        else:
+            payload_length = int.from_bytes(view[pos:pos + 4], byteorder='big')
+            pos += 4
+        id_length = 0
+        if (header & 0x08):       # IL
+            id_length = view[pos]
+            pos += 1
+        record_type = view[pos:pos + type_length]
+        pos += type_length
+        record_id = view[pos:pos + id_length]
+        pos += id_length
+        payload = view[pos:pos + payload_length]
+        pos += payload_length
+        yield NdefRecord(header & 0x07, record_type, record_id, payload)
+        if (header & 0x40):       # ME, last record
+            return
+
+
+def ndef_message(records):
+    '''Encode NdefRecord tuples into an NDEF message.'''
+    records = list(records)
+    message = bytearray()
+    for i, (tnf, record_type, record_id, payload) in enumerate(records):
+        header = tnf & 0x07
+        if (0 == i): header |= 0x80                    # MB
+        if (len(records) - 1 == i): header |= 0x40     # ME
+        if (len(payload) < 256): header |= 0x10        # SR
+        if (record_id): header |= 0x08                 # IL
+        message += bytes((header, len(record_type)))
+        if (header & 0x10):
+            message.append(len(payload))
+        else:
+            message += len(payload).to_bytes(4, byteorder='big')
+        if (record_id):
+            message.append(len(record_id))
+        message += record_type
+        message += record_id
+        message += payload
+    return bytes(message)
+
+
 class ISO15693(PN5180):
-    def __init__(self):
-        pass
+    '''ISO15693 (vicinity) reader, 26 kbit/s ASK100 (RF configuration 0x0D/0x8D).
+
+    UIDs are handled as transmitted, 8 bytes LSB first (uid[7] is 0xE0). Commands are sent
+    addressed if a UID is given, in selected mode after select(), non-addressed otherwise.'''
+
+    BIT_TIME = 37.76e-6     # 1 out of 4 coding / high data rate answers, per bit
+    T1 = 320.9e-6           # Request EOF to answer SOF
+
+    def __init__(self, bus, device, nns_pin, busy_pin, rst_pin, irq_pin, transport=None):
+        super().__init__(bus, device, nns_pin, busy_pin, rst_pin, irq_pin, protocol='ISO15693',
+                         transport=transport)
+        self.slot_timeout = .001    # Seconds to wait for the SOF of an answer in a slot
+        self.write_timeout = .02    # Seconds a tag may take to program its EEPROM
+        self.max_blocks = 64        # Blocks per READ_MULTIPLE_BLOCKS
+        self.block_size = 4         # Updated by get_system_information()
+        self.selected = None        # UID of the tag in selected mode
+        self.error = None           # Error code of the last error response
+        self._response = bytearray(508)
+        self._response_view = memoryview(self._response)
+
+    def setup_rf(self):
+        if (PN5180.load_rf_config(self, 0x0D, 0x8D)):  # ISO15693 Parameters
+            print("Set Protocol ISO15693 - Done.")
+        else:
+            return False
+
+        if (PN5180.set_rf_on(self)):
+            print("RF Field is turned on.")
+        else:
+            return False
+
+        return True
+
+    def _prepare(self):
+        if ((0x0D, 0x8D) != self.rf_config):
+            return PN5180.load_rf_config(self, 0x0D, 0x8D)
+        return True
+
+    def _wait_answer(self, length, sent=0):
+        '''Wait for the answer of a tag, at most 'length' bytes long, to a request of 'sent'
+        bytes. Returns the IRQ status, 0 if no answer started within slot_timeout after the
+        request was transmitted.'''
+        mask = _RX_IRQ_STAT | _RX_SOF_DET_IRQ_STAT | _GENERAL_ERROR_IRQ_STAT
+        status = self.wait_for_irq(mask, self.slot_timeout + self._air_time(sent))
+        if (status and (0 == (status & (_RX_IRQ_STAT | _GENERAL_ERROR_IRQ_STAT)))):
+            # SOF seen, the frame follows
+            self.clear_irq_status(status)
+            status = self.wait_for_irq(mask, (length + 4) * 8 * self.BIT_TIME + self.rx_timeout)
+        if (status):
+            self.clear_irq_status(status)
+        return status
+
+    def _air_time(self, length):
+        '''Seconds to transmit a frame of 'length' bytes with SOF, CRC and EOF.'''
+        return ((length + 2) * 8 + 4) * self.BIT_TIME if length else 0
+
+    def inventory(self, max_rounds=1000):
+        '''All tags in the field: 16 slot INVENTORY, repeated with a 4 bit longer mask for
+        every slot with a collision.
+
+        Each slot after the first is started with an EOF only (TX_CONFIG without SOF and
+        data), a slot without SOF is left after slot_timeout. Returns a list of
+        VicinityTag(uid, dsfid).'''
+
+        tags = {}
+        if (not self._prepare()): return []
+        tx_config = self.read_register(regs._TX_CONFIG)
+        masks = [(0, 0)]
+        while (masks and (max_rounds > 0)):
+            max_rounds -= 1
+            mask_length, mask = masks.pop()
+            collisions = self._inventory_round(mask_length, mask, tx_config, tags)
+            if (collisions is None):
+                break
+            if (mask_length < 60):
+                masks.extend((mask_length + 4, mask | (slot << mask_length)) for slot in collisions)
+        return list(tags.values())
+
+    def _inventory_round(self, mask_length, mask, tx_config, tags):
+        '''One 16 slot INVENTORY, adds the tags found to 'tags', returns the slots with a
+        collision (None on error).'''
+        # High data rate, inventory, 16 slots, INVENTORY, mask
+        frame = bytes((0x06, 0x01, mask_length)) + mask.to_bytes((mask_length + 7) // 8, byteorder='little')
+        collisions = []
+        eof = b''
+        if (not PN5180.send_data(self, frame, len(frame), 0x00)): return None
+        for slot in range(16):
+            if (slot):
+                if (not PN5180.send_data(self, eof, 0, 0x00)): break
+            status = self._wait_answer(10, 0 if slot else len(frame))
+            if (slot == 0):
+                # The following slots are started with EOF only: no SOF, no data
+                PN5180.write_register_with_and_mask(self, regs._TX_CONFIG, 0xFFFFFB3F)
+            if (0 == (status & _RX_IRQ_STAT)):
+                continue
+            rx_status = self.read_register(regs._RX_STATUS)
+            if (rx_status & (_RX_COLLISION_DETECTED | _RX_INTEGRITY_ERROR)):
+                collisions.append(slot)
+                continue
+            answer = self._response_view[:10]
+            if ((10 == (rx_status & _RX_NUM_BYTES_RECEIVED)) and PN5180.read_data(self, answer) and
+                    (0 == (answer[0] & 0x01))):
+                uid = bytes(answer[2:10])
+                tags[uid] = VicinityTag(uid, answer[1])
+        self.write_register(regs._TX_CONFIG, tx_config)
+        return collisions
+
+    def _request(self, cmd, params=b'', uid=None, length=1, timeout=None):
+        '''Send a request and return its answer without the flags byte (memoryview), None if
+        there was none or it was an error response (error code in self.error).
+        'length' is the expected answer length, it sizes the timeout.'''
+        if (not self._prepare()): return None
+        flags = 0x02                # High data rate
+        if (uid is not None):
+            flags |= 0x20           # Addressed
+            frame = bytes((flags, cmd)) + bytes(uid) + bytes(params)
+        else:
+            if (self.selected is not None):
+                flags |= 0x10       # Selected
+            frame = bytes((flags, cmd)) + bytes(params)
+        if (timeout is None):
+            timeout = self.T1 + self._air_time(length)
+        timeout += self._air_time(len(frame))
+        self.error = None
+        if (not PN5180.send_data(self, frame, len(frame), 0x00)): return None
+        if (not PN5180.wait_for_rx(self, timeout + self.rx_timeout)): return None
+        try:
+            received = min(PN5180.received_length(self), len(self._response))
+        except (CollisionError, RxError):
+            return None
+        answer = self._response_view[:received]
+        if ((0 == received) or (not PN5180.read_data(self, answer))): return None
+        if (answer[0] & 0x01):
+            self.error = answer[1] if (received > 1) else 0
+            return None
+        return answer[1:]
+
+    def get_system_information(self, uid=None):
+        '''GET_SYSTEM_INFO (0x2B), returns SystemInfo(uid, dsfid, afi, blocks, block_size,
+        ic_reference) or None. block_size is remembered for the block commands.'''
+        answer = self._request(0x2B, uid=uid, length=15)
+        if ((answer is None) or (len(answer) < 9)): return None
+        info = answer[0]
+        uid, pos = bytes(answer[1:9]), 9
+        dsfid = afi = blocks = block_size = ic_reference = None
+        if ((info & 0x01) and (pos < len(answer))):
+            dsfid, pos = answer[pos], pos + 1
+        if ((info & 0x02) and (pos < len(answer))):
+            afi, pos = answer[pos], pos + 1
+        if ((info & 0x04) and (pos + 1 < len(answer))):
+            blocks, block_size, pos = answer[pos] + 1, (answer[pos + 1] & 0x1F) + 1, pos + 2
+            self.block_size = block_size
+        if ((info & 0x08) and (pos < len(answer))):
+            ic_reference = answer[pos]
+        return SystemInfo(uid, dsfid, afi, blocks, block_size, ic_reference)
+
+    def select(self, uid):
+        '''SELECT (0x25), the following commands without UID go to this tag (selected mode).'''
+        if (self._request(0x25, uid=uid) is None): return False
+        self.selected = bytes(uid)
+        return True
+
+    def reset_to_ready(self, uid=None):
+        '''RESET_TO_READY (0x26), ends the selected mode.'''
+        success = (self._request(0x26, uid=uid) is not None)
+        self.selected = None
+        return success
+
+    def stay_quiet(self, uid):
+        '''STAY_QUIET (0x02), the tag ignores inventories until RESET_TO_READY or power off.
+        The tag does not answer, returns once the request is on air completely.'''
+        frame = bytes((0x22, 0x02)) + bytes(uid)
+        if (not self._prepare()): return False
+        PN5180.transmit(self, frame, 0x00, (self._air_time(len(frame)) + self.rx_timeout) * 1e6)
+        return True
+
+    def read_single_block(self, block, uid=None):
+        answer = self._request(0x20, bytes((block,)), uid, 1 + self.block_size)
+        return None if (answer is None) else bytes(answer)
+
+    def write_single_block(self, block, data, uid=None):
+        return (self._request(0x21, bytes((block,)) + bytes(data), uid, timeout=self.write_timeout) is not None)
+
+    def read_multiple_blocks(self, first, count, uid=None):
+        '''READ_MULTIPLE_BLOCKS (0x23) of 'count' blocks, in requests of up to max_blocks
+        blocks (and 507 bytes). Returns bytes or None.'''
+        per_request = max(1, min(self.max_blocks, 507 // self.block_size, 256))
+        data = bytearray()
+        while (count > 0):
+            n = min(count, per_request)
+            answer = self._request(0x23, bytes((first, n - 1)), uid, 1 + n * self.block_size)
+            if ((answer is None) or (len(answer) != n * self.block_size)):
+                return None
+            data += answer
+            first += n
+            count -= n
+        return bytes(data)
+
+    def write_multiple_blocks(self, first, data, uid=None):
+        '''WRITE_MULTIPLE_BLOCKS (0x24) of len(data) // block_size blocks from 'first'.
+        Tags without the command (error 0x01) are written block by block.'''
+        size = self.block_size
+        if (len(data) % size):
+            print("ERROR: data must be a multiple of the block size!\n")
+            return False
+        per_request = max(1, min(self.max_blocks, 250 // size))
+        for offset in range(0, len(data), per_request * size):
+            chunk = data[offset:offset + per_request * size]
+            block = first + offset // size
+            params = bytes((block, len(chunk) // size - 1)) + bytes(chunk)
+            if (self._request(0x24, params, uid, timeout=self.write_timeout) is not None):
+                continue
+            if (0x01 != self.error):
+                return False
+            for i in range(0, len(chunk), size):
+                if (not self.write_single_block(block + i // size, chunk[i:i + size], uid)):
+                    return False
+        return True
+
+
+class MultiProtocol(ISO14443, ISO15693):
+    '''ISO14443A and ISO15693 on one chip, plus the ISO14443B and FeliCa probes.
+
+    All protocols share one PN5180 state (loaded RF configuration, register shadow, IRQ
+    enable), each method loads the RF configuration it needs only if it is not loaded yet.
+    setup_rf() switches on the field with the Type A configuration.'''
+
+    def __init__(self, bus, device, nns_pin, busy_pin, rst_pin, irq_pin, transport=None):
+        super().__init__(bus, device, nns_pin, busy_pin, rst_pin, irq_pin, transport=transport)
+        self.probe_timeout = .003   # Seconds to wait for the ATQB (FeliCa: +2 ms answer time)
+        self._probe_answer = bytearray(18)
+
+    def _load(self, tx_conf, rx_conf):
+        if ((tx_conf, rx_conf) != self.rf_config):
+            return PN5180.load_rf_config(self, tx_conf, rx_conf)
+        return True
+
+    def wakeup_type_B(self):
+        '''WUPB with one slot at 106 kbit/s (RF configuration 0x04/0x84).
+        Returns the TypeBTag of the tag that answered, None if there was no valid ATQB.'''
+        if (not self._load(0x04, 0x84)): return None
+        answer = self._probe_answer
+        if (12 != self._exchange(_WUPB, answer, self.probe_timeout)) or (0x50 != answer[0]):
+            return None
+        return TypeBTag(bytes(answer[1:5]), bytes(answer[5:9]), bytes(answer[9:12]))
 
-    def run(self):
-        print("Hello ISO15693")
+    def poll_type_F(self):
+        '''FeliCa POLLING for any system code at 212 kbit/s (RF configuration 0x08/0x88).
+        Returns the TypeFTag of the tag that answered, None if there was no valid answer.'''
+        if (not self._load(0x08, 0x88)): return None
+        answer = self._probe_answer
+        if (18 != self._exchange(_FELICA_POLLING, answer, self.probe_timeout + .002)) or (answer[0:2] != b'\x12\x01'):
+            return None
+        return TypeFTag(bytes(answer[2:10]), bytes(answer[10:18]))
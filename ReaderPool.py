@@ -0,0 +1,179 @@
+# Name:         PN5180 Python Library
+# Description:  Several PN5180 readers polled in parallel, one merged event stream.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from Polling import TagPoller
+from Protocol import ISO14443
+from Transport import GPIO, RPiTransport, SharedBusTransport
+
+
+class CommandQueue:
+    '''Commands waiting for one reader: a FIFO per client, the clients are served round
+    robin, so a client queueing many commands does not hold up the others.'''
+
+    def __init__(self):
+        self._clients = OrderedDict()   # client -> deque of (Future, command)
+        self._ready = threading.Condition()
+
+    def __len__(self):
+        with self._ready:
+            return sum(len(jobs) for jobs in self._clients.values())
+
+    def put(self, client, command):
+        future = Future()
+        with self._ready:
+            self._clients.setdefault(client, deque()).append((future, command))
+            self._ready.notify()
+        return future
+
+    def _take(self):
+        with self._ready:
+            if (not self._clients):
+                return None
+            client, jobs = self._clients.popitem(last=False)
+            job = jobs.popleft()
+            if jobs:
+                self._clients[client] = jobs   # Back to the end of the round
+            return job
+
+    def serve(self, reader, deadline):
+        '''Run queued commands as command(reader) until time.monotonic() reaches
+        'deadline', waiting for commands meanwhile. One command runs even after the
+        deadline, so commands get through while the polling overruns.'''
+        while True:
+            job = self._take()
+            if (job is not None):
+                future, command = job
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(command(reader))
+                    except Exception as error:
+                        future.set_exception(error)
+            with self._ready:
+                remaining = deadline - time.monotonic()
+                if (remaining <= 0):
+                    return
+                if (not self._clients):
+                    self._ready.wait(remaining)
+
+
+class ReaderPool:
+    '''Drives several ISO14443 readers, each one polled by its own thread.
+
+    Readers on different SPI buses run fully in parallel. Readers on the same bus share a
+    bus lock that is held for one SPI frame only, so while one chip executes a command or
+    waits for a tag, the others on the bus are served. The events of all readers end up in
+    one queue; TagEvent.reader is the name the reader was added with.
+
+    submit() queues a command for a reader, it runs on the polling thread of the reader
+    between two cycles, so it never competes with the polling for the chip.'''
+
+    def __init__(self, interval=0.05, misses=2, lpcd_wakeup_ms=None):
+        self.interval = interval
+        self.misses = misses
+        self.lpcd_wakeup_ms = lpcd_wakeup_ms   # see Polling.TagPoller
+        self.readers = {}         # name -> ISO14443
+        self.pollers = {}         # name -> TagPoller
+        self.commands = {}        # name -> CommandQueue
+        self._bus_locks = {}      # bus -> threading.Lock
+        self._gpio = False        # Readers wired to the Raspberry Pi GPIOs were opened
+        self._threads = []
+        self._events = queue.Queue()
+
+    def add_reader(self, name, reader, bus=None):
+        '''Add an ISO14443 object. Readers with the same 'bus' (any hashable, e.g. the SPI bus
+        number) are serialized per SPI frame, bus=None gives the reader a bus of its own.'''
+        if name in self.readers:
+            raise ValueError("Reader '{}' already added".format(name))
+        if bus is not None:
+            lock = self._bus_locks.setdefault(bus, threading.Lock())
+            reader._transport = SharedBusTransport(reader._transport, lock)
+        self.readers[name] = reader
+        self.pollers[name] = TagPoller(reader, interval=self.interval, misses=self.misses,
+                                       lpcd_wakeup_ms=self.lpcd_wakeup_ms)
+        self.commands[name] = CommandQueue()
+        return reader
+
+    def open(self, name, bus, device, nss_pin, busy_pin, rst_pin, irq_pin, spi_profile=None):
+        '''Add a reader wired to the Raspberry Pi, the pins are BCM numbers.
+        spi_profile : Transport.SpiProfile, default GPIO driven NSS at 50 kHz.'''
+        transport = RPiTransport(bus, device, nss_pin, busy_pin, rst_pin, irq_pin, profile=spi_profile)
+        self._gpio = True
+        reader = ISO14443(bus, device, nss_pin, busy_pin, rst_pin, irq_pin, transport=transport)
+        return self.add_reader(name, reader, bus=bus)
+
+    def begin(self):
+        '''Initialize, reset and switch on the field of every reader.
+        Returns the names of the readers that failed.
+
+        The signal lines of all readers are set up first: on a shared bus an NSS line left
+        floating could select its chip while another one is talking.'''
+        if self._gpio:
+            GPIO.setmode(GPIO.BCM)
+        for reader in self.readers.values():
+            reader.begin()
+        failed = []
+        for name, reader in self.readers.items():
+            if not (reader.reset() and self.pollers[name].setup()):
+                failed.append(name)
+        return failed
+
+    def _poll(self, name, poller):
+        def publish(event):
+            self._events.put(event._replace(reader=name))
+        reader, commands = self.readers[name], self.commands[name]
+        poller.run(publish, idle=lambda deadline: commands.serve(reader, deadline))
+
+    def submit(self, name, command, client=None):
+        '''Queue command(reader) for the reader 'name', returns a concurrent.futures.Future
+        of its result. The commands of different 'client's are served round robin.'''
+        if name not in self.readers:
+            raise KeyError("Unknown reader '{}'".format(name))
+        return self.commands[name].put(client, command)
+
+    def start(self):
+        '''Start one polling thread per reader.'''
+        for name, poller in self.pollers.items():
+            thread = threading.Thread(target=self._poll, args=(name, poller),
+                                      name='PN5180-' + str(name), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        '''Stop the polling threads and wait until they are done.'''
+        for thread, poller in zip(self._threads, self.pollers.values()):
+            while thread.is_alive():  # stop() may come before the thread entered run()
+                poller.stop()
+                thread.join(0.1)
+        self._threads = []
+
+    def close(self):
+        self.stop()
+        for reader in self.readers.values():
+            reader.close()
+
+    def get_event(self, timeout=None):
+        '''Next TagEvent of any reader, None if there was none within 'timeout' seconds.'''
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def events(self, timeout=None):
+        '''Generator over the merged TagEvents, ends after 'timeout' seconds without one.'''
+        while True:
+            event = self.get_event(timeout)
+            if event is None:
+                return
+            yield event
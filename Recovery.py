@@ -0,0 +1,73 @@
+# Name:         PN5180 Python Library
+# Description:  Escalating recovery of a PN5180 reader after errors.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+from PN5180 import PN5180Error, NoTag
+
+
+class RecoveryPolicy:
+    '''What a reader does after a PN5180Error, escalating with the failures in a row.
+
+    steps : the action after the 1st, 2nd, ... failure in a row, the last one repeats
+      RETRY      : nothing, the operation is tried again
+      RF_RESET   : field off, then setup() (field on), the tags lose power and restart
+      HARD_RESET : reset() through RESET_N, then setup(); clears a wedged host interface
+    setup : brings the RF back after a reset, default reader.setup_rf
+
+    With the millisecond deadlines of the host interface (PN5180.command_timeout_us,
+    reset_timeout_ms) a wedged reader is back within a few milliseconds.'''
+
+    RETRY = 'retry'
+    RF_RESET = 'rf_reset'
+    HARD_RESET = 'hard_reset'
+
+    def __init__(self, reader, setup=None, steps=(RETRY, RF_RESET, HARD_RESET)):
+        self.reader = reader
+        self.setup = setup or reader.setup_rf
+        self.steps = tuple(steps)
+        self.failures = 0         # Failures in a row
+        self.last_error = None
+        self.actions = {step: 0 for step in self.steps}
+
+    def failed(self, error):
+        '''Take the next recovery step after 'error'. Returns True if the step succeeded.'''
+        step = self.steps[min(self.failures, len(self.steps) - 1)]
+        self.failures += 1
+        self.last_error = error
+        self.actions[step] += 1
+        try:
+            if (step == RecoveryPolicy.RF_RESET):
+                self.reader.set_rf_off()
+                return bool(self.setup())
+            if (step == RecoveryPolicy.HARD_RESET):
+                return bool(self.reader.reset() and self.setup())
+        except PN5180Error as error:
+            self.last_error = error
+            return False
+        return True
+
+    def succeeded(self):
+        self.failures = 0
+
+    def call(self, operation, *args, **kwargs):
+        '''operation(*args, **kwargs), retried after each recovery step. NoTag is no
+        failure of the reader and raised at once, like the error of the last retry.'''
+        while True:
+            try:
+                result = operation(*args, **kwargs)
+            except NoTag:
+                self.succeeded()
+                raise
+            except PN5180Error as error:
+                if (self.failures >= len(self.steps)):
+                    self.failures = 0
+                    raise
+                self.failed(error)
+                continue
+            self.succeeded()
+            return result
@@ -0,0 +1,117 @@
+# Name:         PN5180 Python Library
+# Description:  Multi-protocol polling with a schedule adapted to the tags seen.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import time
+
+from Polling import TagPoller, TagEvent, TAG_ARRIVED, TAG_DEPARTED
+
+
+class Technology:
+    '''A technology the scheduler polls.
+
+    rf_config : (tx, rx) RF configuration its poll function loads
+    poll      : poll(reader) -> list of the UIDs (bytes) in the field'''
+
+    def __init__(self, name, rf_config, poll):
+        self.name = name
+        self.rf_config = rf_config
+        self.poll = poll
+
+    def __repr__(self):
+        return "Technology('{}')".format(self.name)
+
+
+def _one(tag, field):
+    return [] if tag is None else [getattr(tag, field)]
+
+
+TYPE_A = Technology('ISO14443A', (0x00, 0x80), lambda reader: [tag.uid for tag in reader.inventory_type_A()])
+ISO15693 = Technology('ISO15693', (0x0D, 0x8D), lambda reader: [tag.uid for tag in reader.inventory()])
+TYPE_B = Technology('ISO14443B', (0x04, 0x84), lambda reader: _one(reader.wakeup_type_B(), 'pupi'))
+FELICA = Technology('FeliCa', (0x08, 0x88), lambda reader: _one(reader.poll_type_F(), 'idm'))
+
+
+class PollingScheduler(TagPoller):
+    '''Polls several technologies with one reader (Protocol.MultiProtocol).
+
+    Every technology keeps a hit rate, the moving average of the polls that found a tag
+    (weight 'alpha' for the latest poll). Its share of the cycles is min_share plus the
+    rest in proportion to its hit rate relative to the best one: the technology seen most
+    is polled every cycle, one never seen every 1/min_share cycles. Before the first hit
+    all technologies are polled every cycle. The technologies of a cycle are polled
+    starting with the one whose RF configuration is still loaded, then by falling hit rate,
+    so LOAD_RF_CONFIG is only sent on a change.
+
+    A tag departs after 'misses' polls of its technology without it. The events are
+    Polling.TagEvents with 'technology' set to the Technology name; run(), stop() and
+    events() work as for TagPoller.'''
+
+    def __init__(self, reader, technologies=(TYPE_A, ISO15693), interval=0.05, misses=2,
+                 min_share=0.25, alpha=0.05):
+        super().__init__(reader, interval=interval, misses=misses)
+        self.technologies = list(technologies)
+        self.min_share = min_share
+        self.alpha = alpha
+        self.hit_rate = {tech.name: 0.0 for tech in self.technologies}
+        self.polls = {tech.name: 0 for tech in self.technologies}
+        self.switches = 0         # RF configuration changes
+        self._credit = {tech.name: 1.0 for tech in self.technologies}
+        self._present = {tech.name: {} for tech in self.technologies}  # name -> {uid: misses}
+
+    @property
+    def tags(self):
+        '''{uid: technology name} of the tags in the field.'''
+        return {uid: name for name, present in self._present.items() for uid in present}
+
+    def setup(self):
+        '''Switch the field on with the configuration of the first technology.'''
+        return (self.reader.load_rf_config(*self.technologies[0].rf_config) and
+                self.reader.set_rf_on())
+
+    def schedule(self):
+        '''The technologies to poll in the next cycle, in polling order.'''
+        due = []
+        top = max(self.hit_rate.values())
+        for tech in self.technologies:
+            share = 1.0
+            if (top > 0):
+                share = self.min_share + (1 - self.min_share) * self.hit_rate[tech.name] / top
+            credit = self._credit[tech.name] + share
+            if (credit >= 1):
+                credit -= 1
+                due.append(tech)
+            self._credit[tech.name] = credit
+        loaded = self.reader.rf_config
+        due.sort(key=lambda tech: (tech.rf_config != loaded, -self.hit_rate[tech.name]))
+        return due
+
+    def poll_once(self):
+        '''Run one polling cycle, returns the list of TagEvents it caused.'''
+        self.cycles += 1
+        events = []
+        for tech in self.schedule():
+            if (tech.rf_config != self.reader.rf_config):
+                self.switches += 1
+            uids = tech.poll(self.reader)
+            self.polls[tech.name] += 1
+            rate = self.hit_rate[tech.name]
+            self.hit_rate[tech.name] = rate + self.alpha * ((1.0 if uids else 0.0) - rate)
+
+            present = self._present[tech.name]
+            now = time.monotonic()
+            for uid in uids:
+                if (uid not in present):
+                    events.append(TagEvent(TAG_ARRIVED, uid, now, technology=tech.name))
+                present[uid] = 0
+            for uid in [uid for uid in present if uid not in uids]:
+                present[uid] += 1
+                if (present[uid] >= self.misses):
+                    del present[uid]
+                    events.append(TagEvent(TAG_DEPARTED, uid, now, technology=tech.name))
+        return events
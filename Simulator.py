@@ -0,0 +1,1030 @@
+# Name:         PN5180 Python Library
+# Description:  Software model of the PN5180 and of the tags in its field.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import time
+import heapq
+from collections import Counter
+
+import PN5180
+from PN5180 import regs, PN5180_Transceive_Stat
+from Transport import Transport
+
+
+def crc_a(data):
+    '''ISO14443-3 CRC_A (initial value 0x6363), returned LSB first.'''
+    crc = 0x6363
+    for b in data:
+        b ^= crc & 0xFF
+        b = (b ^ (b << 4)) & 0xFF
+        crc = (crc >> 8) ^ (b << 8) ^ (b << 3) ^ (b >> 4)
+    return bytes([crc & 0xFF, (crc >> 8) & 0xFF])
+
+
+def to_bits(data, nbits=None):
+    '''Bytes into a list of bits, LSB of the first byte first (air order).'''
+    if nbits is None:
+        nbits = len(data) * 8
+    return [(data[i >> 3] >> (i & 7)) & 1 for i in range(nbits)]
+
+
+def from_bits(bits, offset=0):
+    '''List of bits into bytes, the first bit is placed at bit position 'offset' of byte 0.'''
+    out = bytearray((offset + len(bits) + 7) // 8)
+    for i, bit in enumerate(bits, offset):
+        out[i >> 3] |= bit << (i & 7)
+    return bytes(out)
+
+
+class ISO14443ATag:
+    '''Scriptable ISO14443A PICC.
+
+    Answers REQA/WUPA, ANTICOLLISION/SELECT on every cascade level needed by its
+    4, 7 or 10 byte UID (bit oriented, so several tags in the field really collide)
+    and HLTA. Commands received in ACTIVE state are handed to command(), which
+    subclasses override to model the tag memory.'''
+
+    IDLE, READY, ACTIVE, HALT = range(4)
+
+    def __init__(self, uid, sak=0x08, atqa=None):
+        self.uid = bytes(uid)
+        if len(self.uid) not in (4, 7, 10):
+            raise ValueError("UID must be 4, 7 or 10 bytes long")
+        self.sak = sak
+        if atqa is None:
+            # UID size bits b7-b8: 00 single, 01 double, 10 triple
+            atqa = bytes([{4: 0x04, 7: 0x44, 10: 0x84}[len(self.uid)], 0x00])
+        self.atqa = bytes(atqa)
+        self.state = self.IDLE
+        self._level = 0
+
+    def cascade_levels(self):
+        '''The 4 UID bytes of each cascade level (CT 0x88 prepended where needed).'''
+        u = self.uid
+        if len(u) == 4:
+            return [u]
+        if len(u) == 7:
+            return [b'\x88' + u[0:3], u[3:7]]
+        return [b'\x88' + u[0:3], b'\x88' + u[3:6], u[6:10]]
+
+    def power_off(self):
+        self.state = self.IDLE
+        self._level = 0
+
+    def receive(self, bits, crc):
+        '''Process one frame. 'bits' is the frame in air order without CRC, 'crc' tells if
+        a valid CRC_A followed it. Returns (response bytes, number of valid bits, with CRC)
+        or None if the tag keeps silent.'''
+        if len(bits) == 7 and not crc:
+            cmd = from_bits(bits)[0]
+            if cmd == 0x26 and self.state == self.IDLE or \
+               cmd == 0x52 and self.state in (self.IDLE, self.HALT):
+                self.state = self.READY
+                self._level = 0
+                return (self.atqa, 16, False)
+            if cmd in (0x26, 0x52) and self.state in (self.READY, self.ACTIVE):
+                self.state = self.IDLE
+            return None
+
+        data = from_bits(bits)
+        if self.state == self.READY and len(bits) >= 16 and data[0] in (0x93, 0x95, 0x97):
+            return self._select(data, bits, crc)
+
+        if self.state == self.ACTIVE and len(bits) % 8 == 0:
+            if crc and data == b'\x50\x00':  # HLTA
+                self.state = self.HALT
+                return None
+            response = self.command(data, crc)
+            if response is None or isinstance(response, tuple):
+                return response
+            return (bytes(response), len(response) * 8, True)
+
+        # Unexpected frame, back to IDLE
+        if self.state != self.HALT:
+            self.state = self.IDLE
+        return None
+
+    def _select(self, data, bits, crc):
+        levels = self.cascade_levels()
+        level = (data[0] - 0x93) >> 1
+        if level != self._level or level >= len(levels):
+            self.state = self.IDLE
+            return None
+
+        cl = levels[level]
+        cl_bits = to_bits(cl + bytes([cl[0] ^ cl[1] ^ cl[2] ^ cl[3]]))
+        nvb = data[1]
+        known = ((nvb >> 4) - 2) * 8 + (nvb & 0x0F)
+        if nvb == 0x70:
+            # SELECT
+            if not crc or bits[16:56] != cl_bits:
+                return None
+            self._level += 1
+            if self._level == len(levels):
+                self.state = self.ACTIVE
+                return (bytes([self.sak]), 8, True)
+            return (bytes([0x04]), 8, True)  # cascade bit, UID not complete
+
+        # ANTICOLLISION, answer with the bits that were not sent yet
+        if crc or known > 40 or len(bits) != 16 + known or bits[16:] != cl_bits[:known]:
+            return None
+        return (cl_bits[known:], 40 - known, None)
+
+    def command(self, data, crc):
+        '''Command in ACTIVE state, returns the response (sent with CRC_A), a tuple like
+        receive() or None.'''
+        return None
+
+
+class ISO14443_4Tag(ISO14443ATag):
+    '''ISO14443-4 (ISO-DEP) card: RATS/ATS, PPS, I-block chaining in both directions, WTX
+    and DESELECT, without CID and NAD. Complete APDUs are handed to apdu().
+
+    fsci       : frame size of the card (ATS T0), 8 is 256 bytes
+    ta         : bitrates of the card (ATS TA), 0x77 is up to 848 kbit/s in both directions
+    fwi        : frame waiting time integer (ATS TB)
+    wtx_rounds : WTX requests sent before each APDU answer
+    responses  : {APDU: response}, other APDUs are echoed followed by 90 00'''
+
+    FS = (16, 24, 32, 40, 48, 64, 96, 128, 256, 512, 1024, 2048, 4096)
+
+    def __init__(self, uid, fsci=8, ta=0x77, fwi=4, wtx_rounds=0, responses=None):
+        super().__init__(uid, sak=0x20)
+        self.ats = bytes((5, 0x70 | fsci, ta, fwi << 4, 0x00))
+        self.fsc = self.FS[fsci]
+        self.wtx_rounds = wtx_rounds
+        self.responses = dict(responses or {})
+        self.apdus = []           # APDUs received
+        self._reset_protocol()
+
+    def _reset_protocol(self):
+        self.rates = (0, 0)       # (PCD -> PICC, PICC -> PCD) as set by PPS
+        self.fsd = 256
+        self._protocol = False
+        self._pps_allowed = False
+        self._received = bytearray()
+        self._pending = []        # Chained answer blocks not sent yet
+        self._last = None
+        self._wtx = 0
+
+    def power_off(self):
+        super().power_off()
+        self._reset_protocol()
+
+    def apdu(self, data):
+        if bytes(data) in self.responses:
+            return self.responses[bytes(data)]
+        return bytes(data) + b'\x90\x00'
+
+    def _answer_block(self, block_number):
+        inf = self._pending.pop(0)
+        pcb = 0x02 | block_number | (0x10 if self._pending else 0)
+        self._last = bytes((pcb,)) + inf
+        return self._last
+
+    def command(self, data, crc):
+        if not crc or not data:
+            return None
+        pcb = data[0]
+        if not self._protocol:
+            if pcb == 0xE0 and len(data) == 2:  # RATS
+                self.fsd = self.FS[min(data[1] >> 4, 12)]
+                self._protocol = True
+                self._pps_allowed = True
+                return self.ats
+            return None
+
+        pps, self._pps_allowed = self._pps_allowed, False
+        if pps and (pcb & 0xF0) == 0xD0 and len(data) == 3 and data[1] == 0x11:
+            self.rates = (data[2] & 0x03, (data[2] >> 2) & 0x03)  # Effective after this answer
+            return bytes((pcb,))
+        if pcb == 0xC2:  # S(DESELECT)
+            self.state = self.HALT
+            self._reset_protocol()
+            return bytes((0xC2,))
+        if pcb == 0xF2 and self._wtx:  # S(WTX) response
+            self._wtx -= 1
+            if self._wtx:
+                return bytes((0xF2, 0x01))
+            return self._answer_block(self._block_number)
+        if (pcb & 0xE2) == 0x02:  # I-block
+            self._block_number = pcb & 0x01
+            self._received += data[1:]
+            if pcb & 0x10:
+                self._last = bytes((0xA2 | (pcb & 0x01),))  # R(ACK)
+                return self._last
+            apdu, self._received = bytes(self._received), bytearray()
+            self.apdus.append(apdu)
+            answer = self.apdu(apdu)
+            size = self.fsd - 3
+            self._pending = [answer[i:i + size] for i in range(0, len(answer), size)] or [b'']
+            self._wtx = self.wtx_rounds
+            if self._wtx:
+                return bytes((0xF2, 0x01))
+            return self._answer_block(self._block_number)
+        if (pcb & 0xE6) == 0xA2:  # R-block
+            if pcb & 0x10:  # R(NAK), send the last block again
+                return self._last
+            if self._pending:
+                self._block_number = pcb & 0x01
+                return self._answer_block(self._block_number)
+            return self._last
+        return None
+
+
+class NtagTag(ISO14443ATag):
+    '''NTAG213/215/216 or MIFARE Ultralight (model 'MF0ICU', without GET_VERSION and
+    FAST_READ). The user memory starts with an empty NDEF TLV.'''
+
+    ACK = ([0, 1, 0, 1], 4, False)
+    NAK = ([0, 0, 0, 0], 4, False)
+    MODELS = {
+        # model: (pages, GET_VERSION, capability container size byte)
+        'NTAG213': (45, bytes.fromhex('0004040201000F03'), 0x12),
+        'NTAG215': (135, bytes.fromhex('0004040201001103'), 0x3E),
+        'NTAG216': (231, bytes.fromhex('0004040201001303'), 0x6D),
+        'MF0ICU': (16, None, 0x06),
+    }
+
+    def __init__(self, uid, model='NTAG215'):
+        super().__init__(uid, sak=0x00, atqa=bytes([0x44, 0x00]))
+        pages, self.version, size = self.MODELS[model]
+        self.memory = bytearray(4 * pages)
+        u = self.uid
+        self.memory[0:12] = bytes([u[0], u[1], u[2], 0x88 ^ u[0] ^ u[1] ^ u[2],
+                                   u[3], u[4], u[5], u[6], u[3] ^ u[4] ^ u[5] ^ u[6], 0x48, 0, 0])
+        self.memory[12:16] = bytes([0xE1, 0x10, size, 0x00])
+        self.memory[16:19] = bytes([0x03, 0x00, 0xFE])
+        self._compat_page = None
+        self.user_end = pages - 6 if self.version is not None else pages - 1
+
+    def power_off(self):
+        super().power_off()
+        self._compat_page = None
+
+    def command(self, data, crc):
+        pages = len(self.memory) // 4
+        if self._compat_page is not None:
+            page, self._compat_page = self._compat_page, None
+            if not crc or len(data) != 16:
+                return self.NAK
+            self.memory[4 * page:4 * page + 4] = data[0:4]
+            return self.ACK
+        if not crc:
+            return None
+        if data[0] == 0x60 and len(data) == 1 and self.version is not None:
+            return self.version
+        if data[0] == 0x30 and len(data) == 2 and data[1] < pages:
+            return bytes(self.memory[(4 * data[1] + i) % len(self.memory)] for i in range(16))
+        if data[0] == 0x3A and len(data) == 3 and self.version is not None and data[1] <= data[2] < pages:
+            return bytes(self.memory[4 * data[1]:4 * data[2] + 4])
+        if data[0] == 0xA2 and len(data) == 6 and 4 <= data[1] <= self.user_end:
+            self.memory[4 * data[1]:4 * data[1] + 4] = data[2:6]
+            return self.ACK
+        if data[0] == 0xA0 and len(data) == 2 and 4 <= data[1] <= self.user_end:
+            self._compat_page = data[1]
+            return self.ACK
+        self.state = self.IDLE
+        return self.NAK
+
+
+class MifareClassicTag(ISO14443ATag):
+    '''MIFARE Classic Mini/1K/4K card. Crypto1 is not modelled: the authentication is
+    checked against the keys in the sector trailers and the traffic stays plain.'''
+
+    ACK = ([0, 1, 0, 1], 4, False)   # 0x0A, 4 bits
+    NAK = ([0, 0, 0, 0], 4, False)
+
+    def __init__(self, uid, size=1024, key_a=b'\xff' * 6, key_b=b'\xff' * 6):
+        sak = {320: 0x09, 1024: 0x08, 4096: 0x18}[size]
+        super().__init__(uid, sak=sak)
+        self.memory = bytearray(size)
+        self.memory[0:4] = self.uid[0:4]
+        for sector in range(self.sectors()):
+            trailer = self.trailer(sector)
+            self.memory[trailer:trailer + 16] = bytes(key_a) + bytes.fromhex('ff078069') + bytes(key_b)
+        self.auth_sector = None
+        self._write_block = None
+
+    def sectors(self):
+        return len(self.memory) // 64 if len(self.memory) <= 2048 else 32 + (len(self.memory) - 2048) // 256
+
+    def sector_of(self, block):
+        return block // 4 if block < 128 else 32 + (block - 128) // 16
+
+    def trailer(self, sector):
+        '''Byte offset of the sector trailer.'''
+        if sector < 32:
+            return (4 * sector + 3) * 16
+        return (128 + 16 * (sector - 32) + 15) * 16
+
+    def power_off(self):
+        super().power_off()
+        self.auth_sector = None
+        self._write_block = None
+
+    def authenticate(self, key_type, block, key):
+        '''MFC_AUTHENTICATE of the reader, the card goes idle if the key is wrong.'''
+        sector = self.sector_of(block)
+        trailer = self.trailer(sector)
+        stored = self.memory[trailer:trailer + 6] if key_type == 0x60 else self.memory[trailer + 10:trailer + 16]
+        if self.state != self.ACTIVE or sector >= self.sectors() or bytes(key) != stored:
+            self.state = self.IDLE
+            self.auth_sector = None
+            return False
+        self.auth_sector = sector
+        return True
+
+    def command(self, data, crc):
+        if self._write_block is not None:
+            block, self._write_block = self._write_block, None
+            if not crc or len(data) != 16:
+                return self.NAK
+            self.memory[block * 16:block * 16 + 16] = data
+            return self.ACK
+        if self.auth_sector is None or not crc or len(data) != 2 or self.sector_of(data[1]) != self.auth_sector:
+            self.state = self.IDLE
+            return self.NAK
+        if data[0] == 0x30:
+            block = bytearray(self.memory[data[1] * 16:data[1] * 16 + 16])
+            if self.trailer(self.auth_sector) == data[1] * 16:
+                block[0:6] = bytes(6)  # Key A is never readable
+            return block
+        if data[0] == 0xA0:
+            self._write_block = data[1]
+            return self.ACK
+        self.state = self.IDLE
+        return self.NAK
+
+
+class ISO15693Tag:
+    '''Scriptable ISO15693 VICC.
+
+    uid is given as transmitted, LSB first (uid[7] is 0xE0). Answers INVENTORY (1 and 16
+    slots, with mask), STAY_QUIET, SELECT, RESET_TO_READY, GET_SYSTEM_INFO and the single and
+    multiple block reads and writes. write_multiple=False models tags without
+    WRITE_MULTIPLE_BLOCKS (e.g. ICODE SLIX).'''
+
+    READY, SELECTED, QUIET = range(3)
+
+    def __init__(self, uid, blocks=28, block_size=4, dsfid=0x00, afi=0x00, write_multiple=True):
+        self.uid = bytes(uid)
+        if len(self.uid) != 8:
+            raise ValueError("UID must be 8 bytes long")
+        self.blocks = blocks
+        self.block_size = block_size
+        self.dsfid = dsfid
+        self.afi = afi
+        self.write_multiple = write_multiple
+        self.memory = bytearray(blocks * block_size)
+        self.state = self.READY
+
+    def power_off(self):
+        self.state = self.READY
+
+    def inventory_slot(self, mask_length, mask, one_slot):
+        '''Slot of the answer to an INVENTORY, None if the tag keeps silent.'''
+        if self.state == self.QUIET:
+            return None
+        uid = int.from_bytes(self.uid, byteorder='little')
+        if (uid ^ mask) & ((1 << mask_length) - 1):
+            return None
+        return 0 if one_slot else (uid >> mask_length) & 0x0F
+
+    def inventory_response(self):
+        return bytes((0x00, self.dsfid)) + self.uid
+
+    def request(self, cmd, params):
+        '''Addressed, selected or non-addressed command, returns the response or None.'''
+        if cmd == 0x02:  # STAY_QUIET
+            self.state = self.QUIET
+            return None
+        if cmd == 0x25:  # SELECT
+            self.state = self.SELECTED
+            return b'\x00'
+        if cmd == 0x26:  # RESET_TO_READY
+            self.state = self.READY
+            return b'\x00'
+        if cmd == 0x2B:  # GET_SYSTEM_INFO
+            return bytes((0x00, 0x0F)) + self.uid + bytes((self.dsfid, self.afi, self.blocks - 1,
+                                                          self.block_size - 1, 0x01))
+        if cmd in (0x20, 0x21, 0x23, 0x24) and params:
+            first = params[0]
+            count = 1 if cmd in (0x20, 0x21) else params[1] + 1 if len(params) > 1 else 0
+            data = params[1:] if cmd == 0x21 else params[2:]
+            if count == 0 or first + count > self.blocks:
+                return b'\x01\x10'  # Block not available
+            start, end = first * self.block_size, (first + count) * self.block_size
+            if cmd in (0x20, 0x23):
+                return b'\x00' + bytes(self.memory[start:end])
+            if cmd == 0x24 and not self.write_multiple:
+                return b'\x01\x01'  # Command not supported
+            if len(data) != end - start:
+                return b'\x01\x0F'
+            self.memory[start:end] = data
+            return b'\x00'
+        return b'\x01\x01'
+
+
+class ISO14443BTag:
+    '''Scriptable ISO14443B PICC, answers REQB/WUPB (one slot) with its ATQB and HLTB.'''
+
+    IDLE, READY, HALT = range(3)
+
+    def __init__(self, pupi, application_data=bytes(4), protocol_info=bytes((0x00, 0x71, 0x71))):
+        self.pupi = bytes(pupi)
+        if len(self.pupi) != 4:
+            raise ValueError("PUPI must be 4 bytes long")
+        self.application_data = bytes(application_data)
+        self.protocol_info = bytes(protocol_info)
+        self.state = self.IDLE
+
+    def power_off(self):
+        self.state = self.IDLE
+
+    def answer(self, data):
+        '''Response to a frame (without CRC_B), None if the tag keeps silent.'''
+        if len(data) == 3 and data[0] == 0x05:
+            if self.state == self.HALT and not data[2] & 0x08:
+                return None  # REQB, only WUPB wakes up a halted tag
+            self.state = self.READY
+            return b'\x50' + self.pupi + self.application_data + self.protocol_info
+        if len(data) == 5 and data[0] == 0x50 and data[1:5] == self.pupi:
+            self.state = self.HALT
+            return b'\x00'
+        return None
+
+
+class FeliCaTag:
+    '''Scriptable FeliCa (NFC-F) card, answers POLLING for its system code or 0xFFFF.'''
+
+    def __init__(self, idm, pmm=bytes(8), system_code=0x12FC):
+        self.idm = bytes(idm)
+        if len(self.idm) != 8:
+            raise ValueError("IDm must be 8 bytes long")
+        self.pmm = bytes(pmm)
+        self.system_code = system_code
+
+    def power_off(self):
+        pass
+
+    def answer(self, data):
+        if len(data) == 6 and data[0:2] == b'\x06\x00':
+            code = int.from_bytes(data[2:4], byteorder='big')
+            if code in (0xFFFF, self.system_code):
+                return b'\x12\x01' + self.idm + self.pmm
+        return None
+
+
+class SimulatedPN5180(Transport):
+    '''PN5180 modelled behind its host interface.
+
+    The model implements the BUSY handshake (BUSY rises after an SPI frame, stays high while
+    NSS is high until the command is processed), the register file, the EEPROM, the
+    transceive state machine reported in RF_STATUS, the IRQ line and the RF exchange
+    with a population of ISO14443A/B, ISO15693 and FeliCa tags, including collisions.
+
+    All durations are taken from the real chip and multiplied with 'time_scale':
+    1.0 runs at the pace of the hardware, 0 makes every operation instantaneous.
+
+    The SPI clock set with set_speed() adds the transfer time of every frame. While it is
+    None (the default) the transfers take no time, faster than any real SPI bus. Above 'max_spi_hz' the wiring is modelled as too slow: response frames are
+    read with bit errors. frame_cs=True models NSS driven by the SPI controller; BUSY then
+    rises FRAMED_BUSY_DELAY_NS after the frame, the transfer returns before.'''
+
+    # BUSY high time after NSS is released, per host command (ns)
+    BUSY_TIME_NS = {
+        PN5180._PN5180_WRITE_REGISTER: 10000,
+        PN5180._PN5180_WRITE_REGISTER_OR_MASK: 10000,
+        PN5180._PN5180_WRITE_REGISTER_AND_MASK: 10000,
+        PN5180._PN5180_READ_REGISTER: 10000,
+        PN5180._PN5180_WRITE_EEPROM: 3000000,
+        PN5180._PN5180_READ_EEPROM: 30000,
+        PN5180._PN5180_SEND_DATA: 15000,
+        PN5180._PN5180_READ_DATA: 10000,
+        PN5180._PN5180_SWITCH_MODE: 10000,
+        PN5180._PN5180_MFC_AUTHENTICATE: 1200000,
+        PN5180._PN5180_LOAD_RF_CONFIG: 400000,
+        PN5180._PN5180_RF_ON: 50000,
+        PN5180._PN5180_RF_OFF: 50000,
+    }
+    READ_FRAME_BUSY_NS = 5000    # BUSY high time after the response frame
+    FRAMED_BUSY_DELAY_NS = 20000 # frame_cs: BUSY rises this long after the frame, not scaled
+    BOOT_TIME_NS = 2000000       # Reset release until IDLE_IRQ
+    BOOT_BUSY_DELAY_NS = 50000   # Reset release until BUSY is high, not scaled
+    RF_ON_TIME_NS = 400000       # RF_ON command until TX_RFON_IRQ
+    LPCD_CHECK_NS = 2000000      # LPCD wake-up: oscillator start and AGC measurement
+    LPCD_MIN_CYCLE_NS = 1000000  # Real time between two LPCD checks at least, not scaled
+    BIT_TIME_NS = 9440           # 128 / 13.56 MHz, one bit at 106 kbit/s
+    FDT_NS = 86000               # Frame delay time PCD -> PICC (n = 9)
+    VICC_BIT_NS = 37760          # ISO15693, 1 out of 4 coding and high data rate answers
+    VICC_T1_NS = 320900          # ISO15693 request EOF to answer SOF
+    VICC_SOF_NS = 151000         # ISO15693 answer SOF
+    TYPE_B_FDT_NS = 150000       # ISO14443B frame delay time incl. TR0/TR1 and SOF
+    FELICA_BIT_NS = 4720         # FeliCa, one bit at 212 kbit/s
+    FELICA_POLLING_NS = 2417000  # FeliCa POLLING answer time, slot 0
+
+    def __init__(self, tags=(), time_scale=1.0, max_spi_hz=7000000, frame_cs=False):
+        self.time_scale = time_scale
+        self.max_spi_hz = max_spi_hz
+        self.frame_cs = frame_cs
+        self.spi_speed_hz = None
+        self.tags = list(tags)
+        self.eeprom = bytearray(255)
+        self.eeprom[PN5180._DIE_IDENTIFIER:PN5180._DIE_IDENTIFIER + 16] = bytes(range(0x51, 0x61))
+        self.eeprom[PN5180._PRODUCT_VERSION:PN5180._PRODUCT_VERSION + 2] = bytes([0x05, 0x03])
+        self.eeprom[PN5180._FIRMWARE_VERSION:PN5180._FIRMWARE_VERSION + 2] = bytes([0x05, 0x03])
+        self.eeprom[PN5180._EEPROM_VERSION:PN5180._EEPROM_VERSION + 2] = bytes([0x06, 0x01])
+        self.eeprom[PN5180._IRQ_PIN_CONFIG] = 0x01  # IRQ active high
+
+        # Statistics of the host interface traffic
+        self.commands = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.protocol_errors = 0  # Frames started while BUSY was high
+        self.lpcd_checks = 0      # Antenna checks done in LPCD
+        self.external_field = False  # Field of another reader: RF_ON fails with GENERAL_ERROR
+
+        self._nss = self.HIGH
+        self._rst = self.HIGH
+        self._events = []
+        self._seq = 0
+        self._power_on(time.monotonic_ns())
+
+    # ------------------------------------
+    #       Scripting
+
+    def add_tag(self, tag):
+        self.tags.append(tag)
+
+    def remove_tag(self, tag):
+        '''Take a tag out of the field, it loses power.'''
+        self.tags.remove(tag)
+        tag.power_off()
+
+    def hang(self):
+        '''The host interface hangs: BUSY stays high until the next reset.'''
+        self._busy_until = float('inf')
+
+    def schedule(self, delay, action):
+        '''Call action(self) 'delay' seconds from now (real time, not scaled), e.g. to let
+        tags arrive and leave while the host is polling.'''
+        self._at(time.monotonic_ns() + int(delay * 1e9), lambda now: action(self))
+
+    # ------------------------------------
+    #       Transport
+
+    def begin(self):
+        self._nss = self.HIGH
+        self._rst = self.HIGH
+
+    def set_nss(self, level):
+        if not self.frame_cs:
+            self._set_nss(level)
+
+    def _set_nss(self, level):
+        now = self._advance()
+        if level == self.LOW and self._nss == self.HIGH:
+            if self._is_busy(now):
+                self.protocol_errors += 1
+            self._frame = bytearray()
+            self._frame_io = False
+        elif level == self.HIGH and self._nss == self.LOW and self._frame_io:
+            if self._frame:
+                duration = self._execute(bytes(self._frame), now)
+            else:
+                duration = self.READ_FRAME_BUSY_NS
+            self._frame_io = False
+            duration = self._scale(duration)
+            # NSS of the SPI controller: the transfer may return before BUSY is seen high
+            self._busy_from = now + self.FRAMED_BUSY_DELAY_NS if (self.frame_cs and duration) else now
+            self._busy_until = self._busy_from + duration
+        self._nss = level
+
+    def get_busy(self):
+        now = self._advance()
+        if self._rst == self.LOW:
+            return self.LOW  # Held in reset, BUSY rises only after the release
+        if self._frame_io:
+            return self.HIGH
+        return self.HIGH if self._busy_from <= now < self._busy_until else self.LOW
+
+    def set_rst(self, level):
+        now = self._advance()
+        if level == self.HIGH and self._rst == self.LOW:
+            self._power_on(now, self.BOOT_BUSY_DELAY_NS)
+        elif level == self.LOW:
+            self._rf_field(False)
+        self._rst = level
+
+    def get_irq(self):
+        self._advance()
+        active = (self.irq_status & self.regs.get(regs._IRQ_ENABLE, 0)) != 0
+        if self.eeprom[PN5180._IRQ_PIN_CONFIG] & 0x01:
+            return self.HIGH if active else self.LOW
+        return self.LOW if active else self.HIGH
+
+    def wait_irq(self, timeout):
+        # Sleep until the next chip event instead of spinning, like a host blocked on the edge
+        deadline = time.monotonic_ns() + int(timeout * 1e9)
+        while True:
+            now = time.monotonic_ns()
+            if self.get_irq() == (self.HIGH if self.irq_active_high else self.LOW):
+                return True
+            if now >= deadline:
+                return False
+            wake = min(deadline, self._events[0][0]) if self._events else deadline
+            time.sleep(max(0, wake - now) / 1e9)
+
+    def write_bytes(self, data):
+        if self.frame_cs:
+            self._set_nss(self.LOW)
+        self._clock(len(data))
+        self._advance()
+        if self._nss == self.LOW:
+            self._frame += bytes(data)
+            self._frame_io = True
+            self.bytes_in += len(data)
+        if self.frame_cs:
+            self._set_nss(self.HIGH)
+
+    def read_into(self, buffer):
+        if self.frame_cs:
+            self._set_nss(self.LOW)
+        self._clock(len(buffer))
+        self._advance()
+        self._frame_io = True
+        length = len(buffer)
+        self.bytes_out += length
+        data = self._response[:length]
+        self._response = self._response[length:]
+        if self.spi_speed_hz is not None and self.spi_speed_hz > self.max_spi_hz:
+            data = bytes(b ^ 0x01 for b in data)  # Sampled too late, bit errors
+        buffer[:len(data)] = data
+        buffer[len(data):] = b'\xff' * (length - len(data))
+        if self.frame_cs:
+            self._set_nss(self.HIGH)
+
+    def set_speed(self, speed_hz):
+        self.spi_speed_hz = speed_hz
+
+    def get_speed(self):
+        return self.spi_speed_hz
+
+    def _clock(self, length):
+        '''Host blocked for the SPI transfer of 'length' bytes.'''
+        if self.spi_speed_hz and self.time_scale:
+            end = time.monotonic_ns() + self._scale(length * 8 * 1e9 / self.spi_speed_hz)
+            while time.monotonic_ns() < end:
+                pass
+
+    # ------------------------------------
+    #       Chip model
+
+    def _scale(self, ns):
+        return int(ns * self.time_scale)
+
+    def _at(self, t, fn):
+        self._seq += 1
+        heapq.heappush(self._events, (t, self._seq, fn))
+
+    def _advance(self):
+        now = time.monotonic_ns()
+        while self._events and self._events[0][0] <= now:
+            t, _, fn = heapq.heappop(self._events)
+            fn(t)
+        return now
+
+    def _is_busy(self, now):
+        '''The chip is not ready for a frame, BUSY may not show it yet.'''
+        return self._rst == self.LOW or self._frame_io or now < self._busy_until
+
+    def _power_on(self, now, busy_delay=0):
+        self.regs = {}
+        self.irq_status = 0
+        self.rx_status = 0
+        self.rx_buffer = b''
+        self.tx_config = 0xFF
+        self.rx_config = 0xFF
+        self.rf_on = False
+        self._state = PN5180_Transceive_Stat.PN5180_TS_Idle
+        self._rf_seq = 0
+        self._frame = bytearray()
+        self._frame_io = False
+        self._response = b''
+        self._events = [e for e in self._events if e[2].__name__ != '_chip_event']
+        heapq.heapify(self._events)
+        boot = self._scale(self.BOOT_TIME_NS)
+        self._busy_from = now + busy_delay if boot else now
+        self._busy_until = self._busy_from + boot
+
+        def _chip_event(t):
+            self.irq_status |= PN5180._IDLE_IRQ_STAT
+        self._at(self._busy_until, _chip_event)
+
+    def _chip_at(self, t, fn):
+        '''Event owned by the chip, dropped on reset.'''
+        def _chip_event(now):
+            fn(now)
+        self._at(t, _chip_event)
+
+    def _rf_field(self, on):
+        self.rf_on = on
+        if not on:
+            for tag in self.tags:
+                tag.power_off()
+
+    def _read_reg(self, reg):
+        if reg == regs._IRQ_STATUS:
+            return self.irq_status
+        if reg == regs._RX_STATUS:
+            return self.rx_status
+        if reg == regs._RF_STATUS:
+            return self._state.value << 24
+        return self.regs.get(reg, 0)
+
+    def _write_reg(self, reg, value):
+        value &= 0xFFFFFFFF
+        if reg == regs._IRQ_CLEAR:
+            self.irq_status &= ~value
+            return
+        if reg in (regs._IRQ_STATUS, regs._RX_STATUS, regs._RF_STATUS):
+            return  # Read only
+        old = self.regs.get(reg, 0)
+        self.regs[reg] = value
+        if reg == regs._SYSTEM_CONFIG and (old & 0x07) != (value & 0x07):
+            self._rf_seq += 1
+            if (value & 0x07) == 0x03:  # Transceive, we are initiator
+                self._state = PN5180_Transceive_Stat.PN5180_TS_WaitTransmit
+            else:
+                self._state = PN5180_Transceive_Stat.PN5180_TS_Idle
+
+    def _execute(self, frame, now):
+        '''Process a complete command frame, returns the BUSY time in ns.'''
+        cmd = frame[0]
+        self.commands[cmd] += 1
+        self._response = b''
+        if cmd in (PN5180._PN5180_WRITE_REGISTER, PN5180._PN5180_WRITE_REGISTER_OR_MASK,
+                   PN5180._PN5180_WRITE_REGISTER_AND_MASK) and len(frame) == 6:
+            value = int.from_bytes(frame[2:6], byteorder='little')
+            if cmd == PN5180._PN5180_WRITE_REGISTER_OR_MASK:
+                value |= self._read_reg(frame[1])
+            elif cmd == PN5180._PN5180_WRITE_REGISTER_AND_MASK:
+                value &= self._read_reg(frame[1])
+            self._write_reg(frame[1], value)
+        elif cmd == PN5180._PN5180_READ_REGISTER and len(frame) == 2:
+            self._response = self._read_reg(frame[1]).to_bytes(4, byteorder='little')
+        elif cmd == PN5180._PN5180_WRITE_EEPROM and len(frame) >= 3 and frame[1] + len(frame) - 2 <= 255:
+            self.eeprom[frame[1]:frame[1] + len(frame) - 2] = frame[2:]
+        elif cmd == PN5180._PN5180_READ_EEPROM and len(frame) == 3 and frame[1] + frame[2] <= 255:
+            self._response = bytes(self.eeprom[frame[1]:frame[1] + frame[2]])
+        elif cmd == PN5180._PN5180_SEND_DATA and len(frame) >= 2 and frame[1] <= 7:
+            if not self._send_data(frame[2:], frame[1], now):
+                self.irq_status |= PN5180._GENERAL_ERROR_IRQ_STAT
+        elif cmd == PN5180._PN5180_READ_DATA and len(frame) == 2:
+            self._response = self.rx_buffer
+        elif cmd == PN5180._PN5180_LOAD_RF_CONFIG and len(frame) == 3:
+            if frame[1] != 0xFF:
+                self.tx_config = frame[1]
+            if frame[2] != 0xFF:
+                self.rx_config = frame[2]
+            # The RF configuration switches the CRC on, sends SOF, data and EOF and leaves the
+            # transceiver idle
+            self.regs[regs._CRC_RX_CONFIG] = 0x01
+            self.regs[regs._CRC_TX_CONFIG] = 0x01
+            self.regs[regs._TX_CONFIG] = 0x000007C0
+            self._write_reg(regs._SYSTEM_CONFIG, self.regs.get(regs._SYSTEM_CONFIG, 0) & ~0x07)
+        elif cmd == PN5180._PN5180_RF_ON and len(frame) == 2 and self.external_field:
+            self.irq_status |= PN5180._GENERAL_ERROR_IRQ_STAT  # RF collision avoidance
+        elif cmd == PN5180._PN5180_RF_ON and len(frame) == 2:
+            self._rf_field(True)
+            self._chip_at(now + self._scale(self.RF_ON_TIME_NS),
+                          lambda t: self._set_irq(PN5180._TX_RFON_IRQ_STAT))
+        elif cmd == PN5180._PN5180_SWITCH_MODE and len(frame) == 4 and frame[1] == PN5180._SWITCH_MODE_LPCD:
+            self._rf_field(False)
+            self._lpcd(now, self._scale(int.from_bytes(frame[2:4], byteorder='little') * 1000000))
+        elif cmd == PN5180._PN5180_MFC_AUTHENTICATE and len(frame) == 13:
+            self._response = bytes([self._authenticate(frame[1:7], frame[7], frame[8], frame[9:13])])
+        elif cmd == PN5180._PN5180_RF_OFF and len(frame) == 2:
+            self._rf_field(False)
+            self._set_irq(PN5180._TX_RFOFF_IRQ_STAT)
+        else:
+            self.irq_status |= PN5180._GENERAL_ERROR_IRQ_STAT
+        return self.BUSY_TIME_NS.get(cmd, 10000)
+
+    def _set_irq(self, mask):
+        self.irq_status |= mask
+
+    def _authenticate(self, key, key_type, block, uid):
+        '''Status of MFC_AUTHENTICATE: 0 authenticated, 1 wrong key, 2 no card.'''
+        self.regs[regs._SYSTEM_CONFIG] = self.regs.get(regs._SYSTEM_CONFIG, 0) & ~0x40
+        for tag in self.tags if self.rf_on else ():
+            if tag.state == tag.ACTIVE and tag.uid[-4:] == uid and hasattr(tag, 'authenticate'):
+                if not tag.authenticate(key_type, block, key):
+                    return 1
+                self.regs[regs._SYSTEM_CONFIG] |= 0x40  # MFC_CRYPTO_ON
+                return 0
+        return 2
+
+    def _lpcd(self, now, period):
+        '''Sleep 'period', then check the antenna. Any tag in the field detunes it.
+        The cycle takes LPCD_MIN_CYCLE_NS at least, with time_scale 0 it would not let
+        the time advance.'''
+        def check(t):
+            self.lpcd_checks += 1
+            if self.tags:
+                self._set_irq(PN5180._LPCD_IRQ_STAT)
+            else:
+                self._lpcd(t, period)
+        cycle = max(period + self._scale(self.LPCD_CHECK_NS), self.LPCD_MIN_CYCLE_NS)
+        self._chip_at(now + cycle, check)
+
+    def _send_data(self, data, valid_bits, now):
+        if self._state != PN5180_Transceive_Stat.PN5180_TS_WaitTransmit:
+            return False
+        if self.tx_config in (0x0D, 0x0E):
+            return self._send_data_15693(data, now)
+        if 0x04 <= self.tx_config <= 0x09:
+            return self._send_data_frame(data, now)
+
+        nbits = len(data) * 8
+        if valid_bits and data:
+            nbits -= 8 - valid_bits
+        bits = to_bits(data, nbits)
+        crc_tx = bool(self.regs.get(regs._CRC_TX_CONFIG, 0) & 0x01)
+        tx_bits = nbits + (16 if crc_tx else 0)
+        rates = (self._bitrate(self.tx_config, 0x00), self._bitrate(self.rx_config, 0x80))
+
+        def deliver(tx_end):
+            # Every tag powered by the field answers, overlapping answers collide bit by bit.
+            # Tags switched to another bitrate (PPS) don't understand the frame.
+            answers = []
+            for tag in self.tags if self.rf_on else ():
+                if not isinstance(tag, ISO14443ATag) or getattr(tag, 'rates', (0, 0)) != rates:
+                    continue
+                answer = tag.receive(bits, crc_tx)
+                if answer is not None:
+                    resp, resp_bits, with_crc = answer
+                    resp = to_bits(resp, resp_bits) if not isinstance(resp, list) else resp
+                    if with_crc:
+                        resp = resp + to_bits(crc_a(from_bits(resp)))
+                    answers.append(resp)
+            if not answers:
+                return
+
+            rx_len = max(len(a) for a in answers)
+            received = []
+            collision = None
+            for i in range(rx_len):
+                values = {a[i] if i < len(a) else None for a in answers}
+                if len(values) > 1 and collision is None:
+                    collision = i
+                received.append(1 if 1 in values else 0)
+
+            rx_end = tx_end + self._scale(self.FDT_NS + rx_len * (self.BIT_TIME_NS >> rates[1]))
+            self._chip_at(rx_end, lambda t: self._receive(seq, received, collision))
+
+        seq = self._transmit(now + self._scale(tx_bits * (self.BIT_TIME_NS >> rates[0])), deliver)
+        return True
+
+    def _transmit(self, tx_end, deliver):
+        '''Start a transmission ending at 'tx_end'. The tags get the frame at its end only,
+        deliver(tx_end) is not called if the host stops the transceiver before. Returns the
+        sequence number of the exchange.'''
+        self.rx_buffer = b''
+        self.rx_status = 0
+        self._rf_seq += 1
+        seq = self._rf_seq
+        self._state = PN5180_Transceive_Stat.PN5180_TS_Transmitting
+        self._chip_at(tx_end, lambda t: self._transmitted(seq, t, deliver))
+        return seq
+
+    def _send_data_15693(self, data, now):
+        '''ISO15693 request, or the EOF that moves an INVENTORY to its next slot.'''
+        data = bytes(data)
+        eof_only = not data and not (self.regs.get(regs._TX_CONFIG, 0) & 0x400)
+
+        def deliver(tx_end):
+            vicinity = [tag for tag in self.tags if isinstance(tag, ISO15693Tag)] if self.rf_on else []
+            answers = []
+            if eof_only:
+                if getattr(self, '_slots', None) is not None and self._slot < 15:
+                    self._slot += 1
+                    answers = self._slots.get(self._slot, [])
+            elif len(data) >= 2:
+                self._slots = None
+                flags, cmd = data[0], data[1]
+                if flags & 0x04 and cmd == 0x01 and len(data) >= 3:  # INVENTORY
+                    mask_length = data[2]
+                    mask = int.from_bytes(data[3:3 + (mask_length + 7) // 8], byteorder='little')
+                    self._slots, self._slot = {}, 0
+                    for tag in vicinity:
+                        slot = tag.inventory_slot(mask_length, mask, flags & 0x20)
+                        if slot is not None:
+                            self._slots.setdefault(slot, []).append(tag.inventory_response())
+                    answers = self._slots.get(0, [])
+                elif flags & 0x20 and len(data) >= 10:  # Addressed
+                    for tag in vicinity:
+                        if tag.uid == data[2:10]:
+                            answers.append(tag.request(cmd, data[10:]))
+                        elif cmd == 0x25 and tag.state == tag.SELECTED:
+                            tag.state = tag.READY
+                else:
+                    for tag in vicinity:
+                        if tag.state == tag.QUIET or (flags & 0x10 and tag.state != tag.SELECTED):
+                            continue
+                        answers.append(tag.request(cmd, data[2:]))
+                answers = [a for a in answers if a is not None]
+            if not answers:
+                return
+
+            received = bytes(answers[0])
+            collision = None
+            if len(answers) > 1:  # Manchester collision at the first differing bit
+                rx_bits = [to_bits(a) for a in answers]
+                length = max(len(b) for b in rx_bits)
+                for i in range(length):
+                    if len({b[i] if i < len(b) else None for b in rx_bits}) > 1:
+                        collision = i
+                        break
+                received = from_bits([1 if any(i < len(b) and b[i] for b in rx_bits) else 0 for i in range(length)])
+            sof = tx_end + self._scale(self.VICC_T1_NS + self.VICC_SOF_NS)
+            rx_end = sof + self._scale((len(received) + 2) * 8 * self.VICC_BIT_NS)
+
+            def sof_detected(t):
+                if seq == self._rf_seq:
+                    self._set_irq(PN5180._RX_SOF_DET_IRQ_STAT)
+            self._chip_at(sof, sof_detected)
+            self._chip_at(rx_end, lambda t: self._receive_frame(seq, received, collision))
+
+        tx_bytes = len(data) + (2 if data else 0)
+        seq = self._transmit(now + self._scale(tx_bytes * 8 * self.VICC_BIT_NS + 2 * self.VICC_BIT_NS), deliver)
+        return True
+
+    def _send_data_frame(self, data, now):
+        '''ISO14443B (106 kbit/s, 10 bits per character) or FeliCa (212 kbit/s) frame, byte
+        oriented; overlapping answers are received with an integrity error.'''
+        data = bytes(data)
+        if self.tx_config <= 0x07:
+            kind, bit_ns, bits, delay = ISO14443BTag, self.BIT_TIME_NS, 10, self.TYPE_B_FDT_NS
+        else:
+            kind, bit_ns, bits, delay = FeliCaTag, self.FELICA_BIT_NS, 8, self.FELICA_POLLING_NS
+
+        def deliver(tx_end):
+            answers = [tag.answer(data) for tag in self.tags if isinstance(tag, kind)] if self.rf_on else []
+            answers = [a for a in answers if a is not None]
+            if not answers:
+                return
+            received = answers[0]
+            collision = None if len(answers) == 1 else 0
+            rx_end = tx_end + self._scale(delay + (len(received) + 2) * bits * bit_ns)
+            self._chip_at(rx_end, lambda t: self._receive_frame(seq, received, collision))
+
+        seq = self._transmit(now + self._scale((len(data) + 2) * bits * bit_ns), deliver)
+        return True
+
+    def _receive_frame(self, seq, data, collision):
+        if seq != self._rf_seq:
+            return
+        self.rx_buffer = data
+        self.rx_status = (len(data) & 0x1FF) | (1 << 12)
+        if collision is not None:
+            self.rx_status |= (1 << 16) | (1 << 18) | ((collision & 0x7F) << 19)
+        self._state = PN5180_Transceive_Stat.PN5180_TS_WaitTransmit
+        self.irq_status |= PN5180._RX_IRQ_STAT
+
+    def _bitrate(self, config, base):
+        '''0..3 for 106..848 kbit/s of the ISO14443A RF configurations, 0 for the others.'''
+        return config - base if base <= config <= base + 3 else 0
+
+    def _transmitted(self, seq, t, deliver):
+        if seq != self._rf_seq:
+            return  # Transceive stopped meanwhile, the frame was cut off
+        self.irq_status |= PN5180._TX_IRQ_STAT
+        self._state = PN5180_Transceive_Stat.PN5180_TS_WaitForData
+        deliver(t)
+
+    def _receive(self, seq, bits, collision):
+        if seq != self._rf_seq:
+            return  # Transceive stopped meanwhile
+        integrity_error = 0
+        if self.regs.get(regs._CRC_RX_CONFIG, 0) & 0x01:
+            frame = from_bits(bits)
+            if len(bits) % 8 == 0 and len(bits) >= 24 and crc_a(frame[:-2]) == frame[-2:]:
+                bits = bits[:-16]
+            else:
+                integrity_error = 1
+        align = (self.regs.get(regs._CRC_RX_CONFIG, 0) >> 6) & 0x07
+        self.rx_buffer = from_bits(bits, align)
+        total = align + len(bits)
+        self.rx_status = (len(self.rx_buffer) & 0x1FF) | ((total & 0x07) << 9) | (1 << 12) \
+            | (integrity_error << 16)
+        if collision is not None:
+            self.rx_status |= (1 << 18) | (((align + collision) & 0x7F) << 19)
+        self._state = PN5180_Transceive_Stat.PN5180_TS_WaitTransmit
+        self.irq_status |= PN5180._RX_IRQ_STAT
@@ -0,0 +1,243 @@
+# Name:         PN5180 Python Library
+# Description:  Binary trace of the PN5180 host interface and its replay.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import struct
+import time
+from collections import namedtuple
+
+from Transport import Transport
+
+# File layout: MAGIC, one flags byte (FLAG_FRAME_CS), then the records. A record is
+# _RECORD (kind, us since the previous record, duration in us, payload length) followed
+# by the payload:
+#   WRITE : command frame sent, duration = BUSY high time after the frame
+#   READ  : response frame received, duration = BUSY high time after the frame
+#   IRQ   : wait for the IRQ line, payload = 1 byte result, duration = time waited
+#   RESET : RESET_N edge, payload = 1 byte level
+MAGIC = b'PN5180TR'
+FLAG_FRAME_CS = 0x01
+WRITE, READ, IRQ, RESET = range(4)
+KIND_NAMES = ('WRITE', 'READ', 'IRQ', 'RESET')
+_RECORD = struct.Struct('<BIIH')
+
+TraceRecord = namedtuple('TraceRecord', ['kind', 'timestamp_us', 'duration_us', 'data'])
+
+
+class TraceMismatch(Exception):
+    '''The host did something else than the replayed trace recorded.'''
+
+
+def read_trace(path):
+    '''Generator over the TraceRecords of a trace file, timestamps in us from its start.'''
+    with open(path, 'rb') as f:
+        if (f.read(len(MAGIC)) != MAGIC):
+            raise ValueError("{} is not a PN5180 trace".format(path))
+        f.read(1)
+        timestamp = 0
+        while True:
+            header = f.read(_RECORD.size)
+            if (len(header) < _RECORD.size):
+                return
+            kind, delta, duration, length = _RECORD.unpack(header)
+            timestamp += delta
+            yield TraceRecord(kind, timestamp, duration, f.read(length))
+
+
+class TraceRecorder(Transport):
+    '''Transport wrapper writing every SPI frame, BUSY time, IRQ wait and reset of the
+    wrapped transport to a trace file.
+
+    The records stream through a write buffer of 'buffer_size' bytes, memory stays bounded
+    however long the session is. The BUSY time of a frame is measured from its end until
+    the host saw BUSY low, the record is written then.'''
+
+    def __init__(self, transport, path, buffer_size=65536):
+        self.transport = transport
+        self.frame_cs = transport.frame_cs
+        self.records = 0
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(MAGIC + bytes((FLAG_FRAME_CS if self.frame_cs else 0,)))
+        self._last = time.monotonic_ns()
+        self._pending = None      # (kind, start ns, frame end ns, data) waiting for BUSY low
+
+    def _write(self, kind, start, duration_ns, data):
+        self._file.write(_RECORD.pack(kind, min((start - self._last) // 1000, 0xFFFFFFFF),
+                                      min(duration_ns // 1000, 0xFFFFFFFF), len(data)))
+        self._file.write(data)
+        self._last = start
+        self.records += 1
+
+    def _flush_pending(self, busy_low):
+        kind, start, end, data = self._pending
+        self._pending = None
+        self._write(kind, start, busy_low - end, data)
+
+    def _frame(self, kind, start, data):
+        if (self._pending is not None):
+            self._flush_pending(start)
+        self._pending = (kind, start, time.monotonic_ns(), bytes(data))
+
+    def begin(self):
+        self.transport.begin()
+
+    def set_nss(self, level):
+        self.transport.set_nss(level)
+
+    def get_busy(self):
+        level = self.transport.get_busy()
+        if (level == self.LOW) and (self._pending is not None):
+            self._flush_pending(time.monotonic_ns())
+        return level
+
+    def set_rst(self, level):
+        now = time.monotonic_ns()
+        if (self._pending is not None):
+            self._flush_pending(now)
+        self.transport.set_rst(level)
+        self._write(RESET, now, 0, bytes((level,)))
+
+    def get_irq(self):
+        return self.transport.get_irq()
+
+    def set_irq_polarity(self, active_high):
+        self.irq_active_high = active_high
+        self.transport.set_irq_polarity(active_high)
+
+    def wait_irq(self, timeout):
+        start = time.monotonic_ns()
+        if (self._pending is not None):
+            self._flush_pending(start)
+        active = self.transport.wait_irq(timeout)
+        self._write(IRQ, start, time.monotonic_ns() - start, bytes((1 if active else 0,)))
+        return active
+
+    def write_bytes(self, data):
+        start = time.monotonic_ns()
+        self.transport.write_bytes(data)
+        self._frame(WRITE, start, data)
+
+    def read_into(self, buffer):
+        start = time.monotonic_ns()
+        self.transport.read_into(buffer)
+        self._frame(READ, start, buffer)
+
+    def set_speed(self, speed_hz):
+        self.transport.set_speed(speed_hz)
+
+    def get_speed(self):
+        return self.transport.get_speed()
+
+    def close(self):
+        if (self._pending is not None):
+            self._flush_pending(time.monotonic_ns())
+        self._file.close()
+        self.transport.close()
+
+
+def record(reader, path, buffer_size=65536):
+    '''Start recording the host interface of a PN5180 object to 'path', returns the
+    TraceRecorder. reader.close() ends the trace.'''
+    recorder = TraceRecorder(reader._transport, path, buffer_size)
+    reader._transport = recorder
+    return recorder
+
+
+class TraceReplay(Transport):
+    '''Transport answering like the chip of a recorded trace, for offline regression tests.
+
+    Every command frame the host sends is compared with the recorded one, response frames,
+    IRQ waits and resets are served from the trace; a deviation raises TraceMismatch.
+    timing=True reproduces the recorded BUSY and IRQ wait times, so the host sees the
+    chip latency of the session; timing=False answers at once. The trace is read while
+    it is replayed. Host code that polls IRQ_STATUS (no IRQ pin) issues a timing dependent
+    number of reads and can only be replayed with timing=True, if at all.'''
+
+    def __init__(self, path, timing=False):
+        self.timing = timing
+        self.replayed = 0
+        self._records = read_trace(path)
+        with open(path, 'rb') as f:
+            f.seek(len(MAGIC))
+            self.frame_cs = bool(f.read(1)[0] & FLAG_FRAME_CS)
+        self._nss = self.HIGH
+        self._in_frame = False
+        self._frame = bytearray()
+        self._busy_until = 0
+        self._busy_ns = 0
+
+    def _next(self, kind):
+        record = next(self._records, None)
+        if (record is None):
+            raise TraceMismatch("Trace ended, host wants {}".format(KIND_NAMES[kind]))
+        if (record.kind != kind):
+            raise TraceMismatch("Record {}: host wants {}, trace has {}".format(
+                self.replayed, KIND_NAMES[kind], KIND_NAMES[record.kind]))
+        self.replayed += 1
+        return record
+
+    def _end_frame(self):
+        '''NSS high after a frame: the chip is busy for the recorded time.'''
+        if self._frame:
+            record = self._next(WRITE)
+            if (record.data != self._frame):
+                raise TraceMismatch("Record {}: host sent {}, trace has {}".format(
+                    self.replayed - 1, bytes(self._frame).hex(), record.data.hex()))
+            self._busy_ns = record.duration_us * 1000
+            self._frame = bytearray()
+        self._in_frame = False
+        self._busy_until = time.monotonic_ns() + self._busy_ns if self.timing else 0
+
+    def begin(self):
+        self._nss = self.HIGH
+
+    def set_nss(self, level):
+        if self.frame_cs:
+            return
+        if (level == self.HIGH) and (self._nss == self.LOW) and self._in_frame:
+            self._end_frame()
+        self._nss = level
+
+    def get_busy(self):
+        if self._in_frame or (time.monotonic_ns() < self._busy_until):
+            return self.HIGH
+        return self.LOW
+
+    def set_rst(self, level):
+        record = self._next(RESET)
+        if (record.data[0] != level):
+            raise TraceMismatch("Record {}: RESET_N {}, trace has {}".format(self.replayed - 1, level, record.data[0]))
+
+    def get_irq(self):
+        return self.LOW
+
+    def wait_irq(self, timeout):
+        record = self._next(IRQ)
+        if self.timing:
+            time.sleep(min(record.duration_us / 1e6, timeout))
+        return bool(record.data[0])
+
+    def write_bytes(self, data):
+        self._frame += bytes(data)
+        self._in_frame = True
+        if self.frame_cs:
+            self._end_frame()
+
+    def read_into(self, buffer):
+        record = self._next(READ)
+        if (len(record.data) != len(buffer)):
+            raise TraceMismatch("Record {}: host reads {} bytes, trace has {}".format(
+                self.replayed - 1, len(buffer), len(record.data)))
+        buffer[:] = record.data
+        self._busy_ns = record.duration_us * 1000
+        self._in_frame = True
+        if self.frame_cs:
+            self._end_frame()
+
+    def close(self):
+        self._records.close()
@@ -0,0 +1,262 @@
+# Name:         PN5180 Python Library
+# Description:  The PN5180 host interface transports.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import spidev
+    import RPi.GPIO as GPIO
+except ImportError:  # Not running on a Raspberry Pi, only the simulated transport is usable
+    spidev = None
+    GPIO = None
+
+# SPI settings of an RPiTransport:
+#   speed_hz  : SPI clock, the PN5180 supports up to 7 MHz (PN5180.tune_spi_speed() finds
+#               the highest one the wiring allows)
+#   kernel_cs : NSS is the chip select line of 'device', driven by the SPI controller. Every
+#               SPI frame is one ioctl; NSS must be wired to the CE pin (GPIO8 for SPI0.0).
+SpiProfile = namedtuple('SpiProfile', ['speed_hz', 'kernel_cs'], defaults=(50000, False))
+
+# PN5180 Pins Definition of the examples and tools (PN5180_ReadUID.py, Daemon.py,
+# Benchmark.py): SPI0.0, BCM numbers of NSS, BUSY, RESET_N and IRQ
+PN5180_SPI_BUS = 0
+PN5180_SPI_DEV = 0
+PN5180_NNS = 8
+PN5180_BUSY = 16
+PN5180_RST = 13
+PN5180_IRQ = 23
+
+
+class Transport:
+    '''Host interface of a single PN5180: the SPI port together with the NSS, BUSY,
+    RESET_N and IRQ signal lines.
+
+    The PN5180 class never touches spidev or RPi.GPIO itself, every pin toggle and SPI
+    transfer goes through a Transport. RPiTransport drives the real hardware,
+    Simulator.SimulatedPN5180 models the chip in software.'''
+
+    LOW = 0
+    HIGH = 1
+
+    # True if write_bytes()/read_into() are complete SPI frames with NSS driven by the SPI
+    # controller, set_nss() does nothing then
+    frame_cs = False
+    # Level of the active IRQ line (EEPROM IRQ_PIN_CONFIG, active high by default)
+    irq_active_high = True
+
+    def begin(self):
+        '''Configure the signal lines. NSS and RESET_N are left high (inactive).'''
+        raise NotImplementedError
+
+    def set_nss(self, level: int):
+        raise NotImplementedError
+
+    def get_busy(self) -> int:
+        raise NotImplementedError
+
+    def set_rst(self, level: int):
+        raise NotImplementedError
+
+    def get_irq(self) -> int:
+        raise NotImplementedError
+
+    def wait_irq(self, timeout: float) -> bool:
+        '''Block until the IRQ line is active (see irq_active_high) or 'timeout' seconds
+        have passed. Returns True if the line is active.'''
+        raise NotImplementedError
+
+    def set_irq_polarity(self, active_high: bool):
+        '''Level of the active IRQ line, as configured in the EEPROM (IRQ_PIN_CONFIG).'''
+        self.irq_active_high = active_high
+
+    def write_bytes(self, data):
+        '''Clock out one SPI frame (or part of it) while NSS is low.'''
+        raise NotImplementedError
+
+    def read_into(self, buffer):
+        '''Clock in len(buffer) bytes into the writable buffer while NSS is low.'''
+        raise NotImplementedError
+
+    def set_speed(self, speed_hz: int):
+        '''Change the SPI clock, transports without one ignore it.'''
+        pass
+
+    def get_speed(self):
+        '''SPI clock in Hz, None if the transport has none.'''
+        return None
+
+    def close(self):
+        pass
+
+
+class RPiTransport(Transport):
+    '''spidev + RPi.GPIO transport.
+
+    By default NSS is driven as a plain GPIO, the BUSY handshake then keeps NSS low until
+    BUSY rose. With SpiProfile(kernel_cs=True) the SPI controller drives NSS: the PN5180
+    raises BUSY while it still receives the frame, so a frame is one ioctl (writebytes2
+    for command frames, xfer2 with 0xFF fill bytes for response frames) and the GPIO
+    toggles are saved.'''
+
+    def __init__(self, bus, device, nss_pin, busy_pin, rst_pin, irq_pin, profile=None):
+        if spidev is None or GPIO is None:
+            raise RuntimeError("spidev and RPi.GPIO are required to access the PN5180 hardware")
+
+        # 11.4.1 Physical Host Interface
+        # The interface of the PN5180 to a host microcontroller is based on a SPI interface,
+        # extended by signal line BUSY. The maximum SPI speed is 7 Mbps and fixed to CPOL = 0 and CPHA = 0.
+        profile = profile or SpiProfile()
+        self._spi = spidev.SpiDev()
+        self._spi.open(bus, device)
+        self._spi.max_speed_hz = profile.speed_hz
+        self._spi.mode = 0b00
+        self._spi.no_cs = not profile.kernel_cs
+        self.frame_cs = profile.kernel_cs
+
+        self._nss_pin = nss_pin   # active low
+        self._busy_pin = busy_pin
+        self._rst_pin = rst_pin
+        self._irq_pin = irq_pin   # None: not wired, the PN5180 class polls IRQ_STATUS
+        self._irq_edge = threading.Event()
+        self._irq_detect = False
+
+    def begin(self):
+        # Reffering to the pins Broadcom SoC, unless the mode is set already (ReaderPool)
+        if GPIO.getmode() is None:
+            GPIO.setmode(GPIO.BCM)
+        if not self.frame_cs:
+            GPIO.setup(self._nss_pin, GPIO.OUT)    # Chip Select Pin
+            GPIO.output(self._nss_pin, GPIO.HIGH)  # Disable
+        GPIO.setup(self._busy_pin, GPIO.IN)    # Busy Pin
+        GPIO.setup(self._rst_pin, GPIO.OUT)    # Reset Pin
+        GPIO.output(self._rst_pin, GPIO.HIGH)  # No Reset
+
+        if self._irq_pin is not None:
+            GPIO.setup(self._irq_pin, GPIO.IN)     # IRQ Pin
+            self._detect_irq_edge()
+
+    def _detect_irq_edge(self):
+        '''The edge to the active level wakes up wait_irq().'''
+        if self._irq_detect:
+            GPIO.remove_event_detect(self._irq_pin)
+        edge = GPIO.RISING if self.irq_active_high else GPIO.FALLING
+        GPIO.add_event_detect(self._irq_pin, edge, callback=lambda channel: self._irq_edge.set())
+        self._irq_detect = True
+
+    def set_irq_polarity(self, active_high):
+        changed = (active_high != self.irq_active_high)
+        self.irq_active_high = active_high
+        if changed and self._irq_detect:
+            self._detect_irq_edge()
+
+    def set_nss(self, level):
+        if not self.frame_cs:
+            GPIO.output(self._nss_pin, level)
+
+    def get_busy(self):
+        return GPIO.input(self._busy_pin)
+
+    def set_rst(self, level):
+        GPIO.output(self._rst_pin, level)
+
+    def get_irq(self):
+        if self._irq_pin is None:  # Not wired, the line reads inactive
+            return self.LOW if self.irq_active_high else self.HIGH
+        return GPIO.input(self._irq_pin)
+
+    def wait_irq(self, timeout):
+        if self._irq_pin is None:
+            time.sleep(timeout)
+            return False
+        active = GPIO.HIGH if self.irq_active_high else GPIO.LOW
+        # Clear before sampling the level, so an edge between both steps is not lost
+        self._irq_edge.clear()
+        if GPIO.input(self._irq_pin) == active:
+            return True
+        return self._irq_edge.wait(timeout)
+
+    def write_bytes(self, data):
+        self._spi.writebytes2(data)  # Takes any bytes-like object, no list conversion
+
+    def read_into(self, buffer):
+        if self.frame_cs:
+            buffer[:] = bytes(self._spi.xfer2([0xFF] * len(buffer)))
+        else:
+            buffer[:] = bytes(self._spi.readbytes(len(buffer)))
+
+    def set_speed(self, speed_hz):
+        self._spi.max_speed_hz = speed_hz
+
+    def get_speed(self):
+        return self._spi.max_speed_hz
+
+    def close(self):
+        if self._irq_detect:
+            GPIO.remove_event_detect(self._irq_pin)
+            self._irq_detect = False
+        self._spi.close()
+
+
+class SharedBusTransport(Transport):
+    '''Transport of a PN5180 that shares its SPI bus with other PN5180s.
+
+    Every SPI frame (NSS low to NSS high) is done under the bus lock, so frames of different
+    chips never overlap. The lock is released between the frames of a command and while the
+    host waits for an IRQ: another chip on the same bus can be served in the meantime.'''
+
+    def __init__(self, transport, bus_lock):
+        self.transport = transport
+        self.bus_lock = bus_lock
+        self.frame_cs = transport.frame_cs
+        self._owned = False
+
+    def begin(self):
+        self.transport.begin()
+
+    def set_nss(self, level):
+        if (level == self.LOW) and not self._owned:
+            self.bus_lock.acquire()
+            self._owned = True
+        self.transport.set_nss(level)
+        if (level == self.HIGH) and self._owned:
+            self._owned = False
+            self.bus_lock.release()
+
+    def get_busy(self):
+        return self.transport.get_busy()
+
+    def set_rst(self, level):
+        self.transport.set_rst(level)
+
+    def get_irq(self):
+        return self.transport.get_irq()
+
+    def wait_irq(self, timeout):
+        return self.transport.wait_irq(timeout)
+
+    def set_irq_polarity(self, active_high):
+        self.irq_active_high = active_high
+        self.transport.set_irq_polarity(active_high)
+
+    def write_bytes(self, data):
+        self.transport.write_bytes(data)
+
+    def read_into(self, buffer):
+        self.transport.read_into(buffer)
+
+    def set_speed(self, speed_hz):
+        self.transport.set_speed(speed_hz)
+
+    def get_speed(self):
+        return self.transport.get_speed()
+
+    def close(self):
+        self.transport.close()
@@ -0,0 +1,44 @@
+# Name:         PN5180 Python Library
+# Description:  Shared fixtures of the tests, the readers run on the simulator.
+#
+# Copyright (c) 2021 by Grzegorz Wozny. All rights reserved.
+#
+# Based on 3rd Part Solution:
+#       by Andreas Trappmann:   https://github.com/ATrappmann/PN5180-Library
+#
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Protocol import ISO14443
+from Simulator import SimulatedPN5180
+
+
+@pytest.fixture
+def make_reader():
+    '''make_reader(*tags, cls=ISO14443, setup=True, **simulator options) -> (reader, sim).
+    The simulator runs at time_scale=0 unless given, setup=True switches the field on.
+    A slowed down simulator gets deadlines that a loaded test machine still meets.'''
+    readers = []
+
+    def make(*tags, cls=ISO14443, setup=True, **options):
+        options.setdefault('time_scale', 0)
+        sim = SimulatedPN5180(tags, **options)
+        reader = cls(0, 0, 8, 16, 13, 23, transport=sim)
+        if options['time_scale']:
+            reader.rx_timeout = 0.1
+            reader.command_timeout_us = 100000
+        reader.begin()
+        assert reader.reset()
+        if setup:
+            assert reader.setup_rf()
+        readers.append(reader)
+        return reader, sim
+
+    yield make
+    for reader in readers:
+        reader.close()
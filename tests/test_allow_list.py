@@ -0,0 +1,38 @@
+import os
+
+import AllowList
+
+UIDS = [bytes.fromhex('08112233'), bytes.fromhex('04112233445566'), bytes.fromhex('04112233445566778899')]
+
+
+def test_lookup(tmp_path):
+    path = str(tmp_path / 'uids.idx')
+    AllowList.compile_allow_list(UIDS, path)
+    allowed = AllowList.AllowList(path)
+    assert all(uid in allowed for uid in UIDS)
+    assert bytes.fromhex('08112234') not in allowed
+    assert len(allowed) == 3
+
+
+def test_stat_once_per_interval(tmp_path, monkeypatch):
+    path = str(tmp_path / 'uids.idx')
+    AllowList.compile_allow_list(UIDS, path)
+    allowed = AllowList.AllowList(path, check_interval=60)
+    calls = []
+    stat = os.stat
+    monkeypatch.setattr(AllowList.os, 'stat', lambda p: calls.append(p) or stat(p))
+    for _ in range(1000):
+        assert UIDS[0] in allowed
+    assert len(calls) <= 1
+
+
+def test_removed_file_keeps_the_list(tmp_path):
+    path = str(tmp_path / 'uids.idx')
+    AllowList.compile_allow_list(UIDS, path)
+    allowed = AllowList.AllowList(path, check_interval=0)
+    os.unlink(path)
+    assert UIDS[1] in allowed
+    assert not allowed.reload()
+    AllowList.compile_allow_list(UIDS[:1], path)
+    assert allowed.reload()
+    assert UIDS[1] not in allowed
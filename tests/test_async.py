@@ -0,0 +1,40 @@
+import asyncio
+
+from AsyncPN5180 import AsyncISO14443
+from Polling import TAG_ARRIVED, TAG_DEPARTED
+from Simulator import ISO14443ATag
+
+UID = bytes.fromhex('04112233445566')
+
+
+def test_tags_switches_the_field_on(make_reader):
+    reader, sim = make_reader(ISO14443ATag(UID), setup=False)
+
+    async def first_event():
+        device = AsyncISO14443(reader)
+        async for event in device.tags(interval=0):
+            await device.close()
+            return event
+
+    event = asyncio.run(first_event())
+    assert (event.kind, event.uid) == (TAG_ARRIVED, UID)
+
+
+def test_tags_survives_a_wedged_reader(make_reader):
+    tag = ISO14443ATag(UID)
+    reader, sim = make_reader(tag)
+
+    async def events():
+        device = AsyncISO14443(reader)
+        seen = []
+        async for event in device.tags(interval=0):
+            seen.append((event.kind, event.uid))
+            if (event.kind == TAG_ARRIVED):
+                sim.hang()               # BusyTimeout until the recovery resets the chip
+                sim.remove_tag(tag)
+            else:
+                break
+        await device.close()
+        return seen
+
+    assert asyncio.run(events()) == [(TAG_ARRIVED, UID), (TAG_DEPARTED, UID)]
@@ -0,0 +1,85 @@
+import errno
+import socket
+
+import pytest
+
+import Daemon
+from Daemon import DaemonClient, ReaderDaemon, decode_event, encode_event, _HEADER
+from Polling import TagEvent, TAG_ARRIVED, TAG_DEPARTED
+from ReaderPool import ReaderPool
+from Simulator import ISO14443ATag
+
+UID7 = bytes.fromhex('04112233445566')
+
+
+def test_event_with_long_names():
+    event = TagEvent(TAG_ARRIVED, bytes.fromhex('04112233445566'), 12.5, 'r' * 300, 'ISO14443A')
+    assert decode_event(encode_event(event)[_HEADER.size:]) == event
+
+
+def test_event_with_int_reader_name():
+    event = TagEvent(TAG_ARRIVED, UID7, 12.5, 3)
+    assert decode_event(encode_event(event)[_HEADER.size:]).reader == '3'
+
+
+def test_int_reader_name_and_a_broken_event(make_reader, tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / 'pn5180.sock')
+    tag = ISO14443ATag(UID7)
+    reader, sim = make_reader(tag)
+    pool = ReaderPool()
+    pool.add_reader(3, reader)
+    encoded = []
+
+    def encode(event):  # The first event can't be encoded
+        encoded.append(event)
+        if (len(encoded) == 1):
+            raise ValueError("broken event")
+        return encode_event(event)
+
+    monkeypatch.setattr(Daemon, 'encode_event', encode)
+    daemon = ReaderDaemon(pool, path)
+    daemon.start()
+    try:
+        client = DaemonClient(path)
+        assert client.read_eeprom('3', 0x10, 2) == bytes([0x05, 0x03])
+        sim.schedule(0.3, lambda sim: sim.remove_tag(tag))
+        event = client.get_event(5.0)
+        assert (event.kind, event.uid, event.reader) == (TAG_DEPARTED, UID7, '3')
+        client.close()
+    finally:
+        daemon.stop()
+    assert encoded[0].kind == TAG_ARRIVED
+    assert "broken event" in capsys.readouterr().out
+
+
+def test_start_keeps_a_served_socket(tmp_path):
+    path = str(tmp_path / 'pn5180.sock')
+    running = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    running.bind(path)
+    running.listen(1)
+    try:
+        with pytest.raises(OSError) as error:
+            ReaderDaemon(ReaderPool(), path).start()
+        assert error.value.errno == errno.EADDRINUSE
+    finally:
+        running.close()
+
+
+def test_start_replaces_a_stale_socket(make_reader, tmp_path):
+    path = str(tmp_path / 'pn5180.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    reader, sim = make_reader()
+    pool = ReaderPool()
+    name = 'reader-' + 'x' * 300
+    pool.add_reader(name, reader)
+    daemon = ReaderDaemon(pool, path)
+    daemon.start()
+    try:
+        client = DaemonClient(path)
+        assert client.read_eeprom(name, 0x10, 2) == bytes([0x05, 0x03])
+        client.close()
+    finally:
+        daemon.stop()
@@ -0,0 +1,57 @@
+import pytest
+
+import DeviceInfo
+from DeviceInfo import provision, read_device_info
+from PN5180 import _PN5180_READ_EEPROM, _PN5180_WRITE_EEPROM
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(DeviceInfo, '_cache', {})
+
+
+def test_provision_writes_one_contiguous_range(make_reader):
+    reader, sim = make_reader(setup=False)
+    writes = []
+    write_eeprom = reader.write_eeprom
+    reader.write_eeprom = lambda addr, data: writes.append((addr, bytes(data))) or write_eeprom(addr, data)
+    assert provision(reader, {0x30: 0x01, 0x32: b'\x34\x12'})
+    assert writes == [(0x30, bytes((0x01, sim.eeprom[0x31], 0x34, 0x12)))]
+    assert sim.commands[_PN5180_WRITE_EEPROM] == 1
+    assert reader.device_info.clock_config == 0x01
+    assert reader.device_info.mfc_auth_timeout == 0x1234
+
+
+def test_provision_skips_values_already_set(make_reader):
+    reader, sim = make_reader(setup=False)
+    assert provision(reader, {0x30: 0x01})
+    assert provision(reader, {0x30: 0x01, 0x31: sim.eeprom[0x31]})
+    assert sim.commands[_PN5180_WRITE_EEPROM] == 1
+
+
+@pytest.mark.parametrize('changes', [{0x00: 0x01}, {0x15: 0x01}, {0xFE: b'\x01\x02'}])
+def test_provision_rejects_read_only_and_out_of_range(make_reader, changes):
+    reader, sim = make_reader(setup=False)
+    before = bytes(sim.eeprom)
+    assert not provision(reader, changes)
+    assert sim.commands[_PN5180_WRITE_EEPROM] == 0
+    assert bytes(sim.eeprom) == before
+
+
+def test_file_cache_without_verify(make_reader, tmp_path, monkeypatch):
+    path = str(tmp_path / 'pn5180.json')
+    reader, sim = make_reader(setup=False)
+    info = read_device_info(reader, path)
+    assert sim.commands[_PN5180_READ_EEPROM] == 1
+
+    # A restart: new process cache, the snapshot comes from the file
+    monkeypatch.setattr(DeviceInfo, '_cache', {})
+    reader, sim = make_reader(setup=False)
+    cached = read_device_info(reader, path, verify=False)
+    assert cached.eeprom == info.eeprom
+    assert sim.commands[_PN5180_READ_EEPROM] == 0
+
+    monkeypatch.setattr(DeviceInfo, '_cache', {})
+    reader, sim = make_reader(setup=False)
+    assert read_device_info(reader, path).eeprom == info.eeprom
+    assert sim.commands[_PN5180_READ_EEPROM] == 1    # The 16 bytes of the die identifier
@@ -0,0 +1,114 @@
+import pytest
+
+import PN5180
+from PN5180 import NoTag, regs
+from Protocol import ISO14443_4, NTAG
+from Simulator import ISO14443ATag, ISO14443_4Tag, NtagTag
+
+UID4 = bytes.fromhex('08112233')
+UID7 = bytes.fromhex('04112233445566')
+UID10 = bytes.fromhex('04112233445566778899')
+
+
+@pytest.mark.parametrize('uid', [UID4, UID7, UID10])
+def test_read_card_serial(make_reader, uid):
+    reader, sim = make_reader(ISO14443ATag(uid))
+    buffer = bytearray(10)
+    assert reader.read_card_serial(buffer) == len(uid)
+    assert bytes(buffer[:len(uid)]) == uid
+
+
+def test_read_card_serial_without_tag(make_reader):
+    reader, sim = make_reader()
+    assert reader.read_card_serial(bytearray(10)) == 0
+
+
+def test_activate_type_A(make_reader):
+    reader, sim = make_reader(ISO14443ATag(UID7, sak=0x20))
+    tag = reader.activate_type_A()
+    assert (tag.uid, tag.atqa, tag.sak) == (UID7, bytes([0x44, 0x00]), 0x20)
+
+
+def test_activate_type_A_without_tag(make_reader):
+    reader, sim = make_reader()
+    with pytest.raises(NoTag):
+        reader.activate_type_A()
+
+
+def test_anticollision_selects_one_of_several(make_reader):
+    uids = [UID7, bytes.fromhex('04112233445567'), UID10, UID4]
+    reader, sim = make_reader(*[ISO14443ATag(uid) for uid in uids])
+    assert reader.activate_type_A().uid in uids
+
+
+def test_inventory_type_A(make_reader):
+    uids = [UID7, bytes.fromhex('04112233445567'), bytes.fromhex('041122334455E6'), UID10, UID4]
+    reader, sim = make_reader(*[ISO14443ATag(uid) for uid in uids])
+    assert sorted(tag.uid for tag in reader.inventory_type_A()) == sorted(uids)
+
+
+def test_halt_is_on_air_before_the_next_write(make_reader):
+    tag = ISO14443ATag(UID7)
+    reader, sim = make_reader(tag, time_scale=10)
+    reader.activate_type_A()
+    assert reader.mifare_halt()
+    PN5180.PN5180.write_register_with_and_mask(reader, regs._SYSTEM_CONFIG, 0xFFFFFFF8)
+    assert tag.state == tag.HALT
+
+
+def test_inventory_type_A_in_real_time(make_reader):
+    uids = [UID7, bytes.fromhex('04112233445567'), UID4]
+    reader, sim = make_reader(*[ISO14443ATag(uid) for uid in uids], time_scale=1)
+    assert sorted(tag.uid for tag in reader.inventory_type_A()) == sorted(uids)
+
+
+def test_inventory_type_A_lists_a_tag_once(make_reader, monkeypatch):
+    reader, sim = make_reader(ISO14443ATag(UID7), ISO14443ATag(UID4))
+    first = reader.activate_type_A()
+    again = iter([first, first, first, None])
+    monkeypatch.setattr(reader, '_activated', lambda request: next(again))
+    assert [tag.uid for tag in reader.inventory_type_A()] == [first.uid]
+
+
+def test_anticollision_clears_bit_align_on_failure(make_reader, monkeypatch):
+    tags = [ISO14443ATag(bytes.fromhex('08112233')), ISO14443ATag(bytes.fromhex('09112233'))]
+    reader, sim = make_reader(*tags)
+    wait_for_rx = PN5180.PN5180.wait_for_rx
+
+    def failing(self, *args):
+        # Fails the exchange sent with RX_BIT_ALIGN set
+        if (sim.regs.get(regs._CRC_RX_CONFIG, 0) & 0x1C0):
+            return False
+        return wait_for_rx(self, *args)
+
+    monkeypatch.setattr(PN5180.PN5180, 'wait_for_rx', failing)
+    with pytest.raises(PN5180.PN5180Error):
+        reader.activate_type_A()
+    assert 0 == sim.regs.get(regs._CRC_RX_CONFIG, 0) & 0x1C0
+    monkeypatch.setattr(PN5180.PN5180, 'wait_for_rx', wait_for_rx)
+    for tag in tags:
+        tag.state = tag.IDLE   # Left READY by the broken anticollision
+    assert reader.activate_type_A().uid in (bytes.fromhex('08112233'), bytes.fromhex('09112233'))
+
+
+def test_iso14443_4_apdu(make_reader):
+    card = ISO14443_4Tag(UID7, fsci=2, wtx_rounds=1, responses={b'\x00\xa4': b'\x6a\x82'})
+    reader, sim = make_reader(card)
+    session = ISO14443_4(reader)
+    assert session.activate() is not None
+    assert session.bitrate == (3, 3)
+    apdu = bytes(range(200))                 # Chained in blocks of the 32 byte FSC
+    assert session.transceive_apdu(apdu) == apdu + b'\x90\x00'
+    assert session.transceive_apdu(b'\x00\xa4') == b'\x6a\x82'
+    assert card.apdus == [apdu, b'\x00\xa4']
+    assert session.deselect()
+
+
+def test_ntag_memory(make_reader):
+    reader, sim = make_reader(NtagTag(UID7, 'NTAG215'))
+    tag = NTAG(reader)
+    assert tag.activate()
+    assert (tag.name, tag.pages) == ('NTAG215', 135)
+    assert tag.write_pages(4, b'ABCDEFGH')
+    assert tag.read_pages(4, 2) == b'ABCDEFGH'
+    assert len(tag.read_user_memory()) == 4 * (tag.user_end - 3)
@@ -0,0 +1,37 @@
+import random
+
+from Protocol import ISO15693
+from Simulator import ISO15693Tag
+
+
+def uids(count):
+    rng = random.Random(count)
+    return [bytes(rng.randrange(256) for _ in range(6)) + b'\x04\xe0' for _ in range(count)]
+
+
+def test_inventory_single_tag(make_reader):
+    uid = uids(1)[0]
+    reader, sim = make_reader(ISO15693Tag(uid), cls=ISO15693)
+    assert [tag.uid for tag in reader.inventory()] == [uid]
+
+
+def test_inventory_resolves_collisions(make_reader):
+    expected = uids(20)
+    reader, sim = make_reader(*[ISO15693Tag(uid) for uid in expected], cls=ISO15693)
+    assert sorted(tag.uid for tag in reader.inventory()) == sorted(expected)
+
+
+def test_read_multiple_blocks(make_reader):
+    uid = uids(1)[0]
+    tag = ISO15693Tag(uid)
+    tag.memory[0:8] = b'abcdefgh'
+    reader, sim = make_reader(tag, cls=ISO15693)
+    assert reader.get_system_information(uid).blocks == 28
+    assert reader.read_multiple_blocks(0, 2, uid) == b'abcdefgh'
+
+
+def test_stay_quiet_in_real_time(make_reader):
+    first, second = uids(2)
+    reader, sim = make_reader(ISO15693Tag(first), ISO15693Tag(second), cls=ISO15693, time_scale=1)
+    assert reader.stay_quiet(first)
+    assert [tag.uid for tag in reader.inventory()] == [second]
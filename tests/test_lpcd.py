@@ -0,0 +1,35 @@
+from PN5180 import _LPCD_FIELD_ON_TIME, _PN5180_SWITCH_MODE, _PN5180_WRITE_EEPROM
+from Simulator import ISO14443ATag
+
+UID = bytes.fromhex('04112233445566')
+
+
+def test_lpcd_calibrate_writes_changed_values_only(make_reader):
+    reader, sim = make_reader(setup=False)
+    assert reader.lpcd_calibrate(0x80, 0x05)
+    assert sim.commands[_PN5180_WRITE_EEPROM] == 1
+    assert sim.eeprom[_LPCD_FIELD_ON_TIME:_LPCD_FIELD_ON_TIME + 3] == bytes((0x80, 0x05, 0x01))
+    assert reader.lpcd_calibrate(0x80, 0x05)
+    assert sim.commands[_PN5180_WRITE_EEPROM] == 1
+
+
+def test_lpcd_timeout_stays_in_lpcd(make_reader):
+    reader, sim = make_reader(setup=False)
+    buffer = bytearray(13)
+    assert reader.lpcd_activate(buffer, 10, timeout=0.05) == 0
+    assert reader.lpcd_active
+    assert sim.lpcd_checks > 0
+    # The next call goes on waiting, without a new SWITCH_MODE
+    assert reader.lpcd_activate(buffer, 10, timeout=0.02) == 0
+    assert sim.commands[_PN5180_SWITCH_MODE] == 1
+
+
+def test_lpcd_wakes_and_activates(make_reader):
+    reader, sim = make_reader(setup=False)
+    tag = ISO14443ATag(UID)
+    sim.schedule(0.02, lambda sim: sim.add_tag(tag))
+    buffer = bytearray(13)
+    assert reader.lpcd_activate(buffer, 10, timeout=1.0) == 7
+    assert bytes(buffer[3:10]) == UID
+    assert not reader.lpcd_active
+    assert tag.state == tag.ACTIVE
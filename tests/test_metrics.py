@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+import PN5180 as pn5180
+import Protocol
+from Metrics import BUCKETS_NS, COMMAND_NAMES, Metrics
+from PN5180 import PN5180, BusyTimeout, regs
+from Simulator import ISO14443ATag
+
+UID7 = bytes.fromhex('04112233445566')
+
+
+def test_counters_follow_the_host_commands(make_reader):
+    reader, sim = make_reader(ISO14443ATag(UID7))
+    sim.commands.clear()
+    metrics = reader.metrics = Metrics()
+    reader.activate_type_A()
+    assert {op: h.count for op, h in metrics.commands.items()} == dict(sim.commands)
+    assert not metrics.failures
+    # A 7 byte UID takes two cascade levels
+    assert {name: h.count for name, h in metrics.phases.items()} == {'request': 1, 'anticollision': 2, 'select': 2}
+    assert metrics.spi_bytes_out > 2 * sum(sim.commands.values())
+    assert metrics.spi_bytes_in >= 2 + 5  # ATQA and a cascade level
+
+
+def test_hooks_see_every_event(make_reader):
+    reader, sim = make_reader(ISO14443ATag(UID7), setup=False)
+    metrics = reader.metrics = Metrics()
+    events = []
+    metrics.add_hook(lambda kind, name, duration_ns, ok: events.append((kind, name, ok)))
+    reader.setup_rf()
+    reader.activate_type_A()
+    assert {kind for kind, name, ok in events} == {'command', 'irq', 'phase'}
+    assert ('command', 'LOAD_RF_CONFIG', True) in events
+    assert [name for kind, name, ok in events if kind == 'phase'] == ['request'] + ['anticollision', 'select'] * 2
+    assert len([e for e in events if e[0] == 'command']) == sum(h.count for h in metrics.commands.values())
+
+    events.clear()
+    sim.hang()
+    with pytest.raises(BusyTimeout):
+        reader.write_register(regs._TIMER1_RELOAD, 0x1234)
+    assert events == [('command', 'WRITE_REGISTER', False)]
+    assert metrics.failures == {pn5180._PN5180_WRITE_REGISTER: 1}
+
+
+def test_prometheus(make_reader):
+    reader, sim = make_reader(ISO14443ATag(UID7))
+    metrics = reader.metrics = Metrics()
+    reader.activate_type_A()
+    reader.read_register(regs._IRQ_STATUS)
+    text = metrics.prometheus(labels={'reader': 'door'})
+    lines = text.splitlines()
+    assert '# TYPE pn5180_command_duration_seconds histogram' in lines
+    assert '# TYPE pn5180_spi_bytes_total counter' in lines
+    count = metrics.commands[pn5180._PN5180_READ_REGISTER].count
+    assert 'pn5180_command_duration_seconds_count{{command="READ_REGISTER",reader="door"}} {}'.format(count) in lines
+    assert 'pn5180_command_duration_seconds_bucket{{command="READ_REGISTER",le="+Inf",reader="door"}} {}'.format(count) in lines
+    buckets = [int(line.rsplit(' ', 1)[1]) for line in lines
+               if line.startswith('pn5180_command_duration_seconds_bucket{command="READ_REGISTER"')]
+    assert len(buckets) == len(BUCKETS_NS) + 1
+    assert buckets == sorted(buckets)  # Cumulative
+    assert 'pn5180_spi_bytes_total{{direction="in",reader="door"}} {}'.format(metrics.spi_bytes_in) in lines
+    assert 'pn5180_phase_duration_seconds_count{phase="select",reader="door"} 2' in lines
+    assert 'pn5180_irq_timeouts_total{reader="door"} 0' in lines
+    assert all(name in COMMAND_NAMES.values() for name in metrics.summary())
+
+
+def test_handshake_and_reset_delays_are_measured(make_reader):
+    reader, sim = make_reader(setup=False)
+    metrics = reader.metrics = Metrics()
+    reader.handshake = PN5180.HANDSHAKE_SAFE
+    reader.read_register(regs._IRQ_STATUS)  # Two frames, 2 ms and 1 ms around each NSS edge
+    assert metrics.sleep_ns >= 6000000
+    assert metrics.busy_wait_ns >= metrics.sleep_ns
+
+    metrics.reset()
+    reader.handshake = PN5180.HANDSHAKE_FAST
+    assert reader.reset()
+    assert metrics.sleep_ns >= PN5180.RESET_LOW_TIME * 1e9
+
+
+def test_reader_without_metrics_does_not_time(make_reader, monkeypatch):
+    reader, sim = make_reader(ISO14443ATag(UID7))
+    calls = []
+
+    def perf_counter_ns():
+        calls.append(1)
+        return 0
+
+    # PN5180 and Protocol take the time only for the metrics
+    monkeypatch.setattr(time, 'perf_counter_ns', perf_counter_ns)
+    assert reader.metrics is None
+    reader.activate_type_A()
+    reader.read_register(regs._IRQ_STATUS)
+    assert calls == []
+    assert pn5180.time is time and Protocol.time is time
@@ -0,0 +1,50 @@
+from PN5180 import _PN5180_MFC_AUTHENTICATE
+from Protocol import MIFARE_DEFAULT_KEYS
+from Simulator import MifareClassicTag
+
+UID4 = bytes.fromhex('08112233')
+UID7 = bytes.fromhex('04112233445566')
+
+
+def test_read_sectors_caches_the_key(make_reader):
+    # Second default key: the first read tries 0xFF..FF before it
+    tag = MifareClassicTag(UID4, key_a=MIFARE_DEFAULT_KEYS[1])
+    tag.memory[16 * 4:16 * 5] = b'sector 1 block 0'
+    reader, sim = make_reader(tag)
+    first = reader.read_sectors((1, 2))
+    assert sorted(first) == [1, 2]
+    assert first[1][0:16] == b'sector 1 block 0'
+    assert sim.commands[_PN5180_MFC_AUTHENTICATE] == 4
+    assert reader.mifare_keys[UID4][1] == (0x60, MIFARE_DEFAULT_KEYS[1])
+
+    assert reader.read_sectors((1, 2)) == first
+    assert sim.commands[_PN5180_MFC_AUTHENTICATE] == 6   # One per sector
+    assert tag.state == tag.HALT
+
+
+def test_read_sectors_falls_back_to_other_keys(make_reader):
+    key = bytes.fromhex('112233445566')
+    tag = MifareClassicTag(UID4)
+    trailer = tag.trailer(3)
+    tag.memory[trailer:trailer + 6] = key          # Key A
+    tag.memory[trailer + 10:trailer + 16] = key    # Key B
+    tag.memory[16 * 12:16 * 13] = b'sector 3 block 0'
+    reader, sim = make_reader(tag)
+    assert reader.read_sectors((3,)) == {}
+    result = reader.read_sectors((2, 3), keys=MIFARE_DEFAULT_KEYS + (key,))
+    assert sorted(result) == [2, 3]
+    assert result[3][0:16] == b'sector 3 block 0'
+    assert reader.mifare_keys[UID4][3][1] == key
+
+
+def test_dump_4k_card_with_double_size_uid(make_reader):
+    tag = MifareClassicTag(UID7, size=4096)
+    tag.memory[128 * 16:129 * 16] = b'sector 32 block0'
+    tag.memory[4096 - 32:4096 - 16] = b'sector 39 blk 14'
+    reader, sim = make_reader(tag)
+    data = reader.dump()
+    assert len(data) == 4096
+    assert data[128 * 16:129 * 16] == b'sector 32 block0'
+    assert data[4096 - 32:4096 - 16] == b'sector 39 blk 14'
+    # Key A of the trailers reads as zeros
+    assert data[4096 - 16:4096 - 10] == bytes(6)
@@ -0,0 +1,45 @@
+from Protocol import NTAG
+from Simulator import NtagTag
+
+UID7 = bytes.fromhex('04112233445566')
+
+
+def ntag(make_reader, model):
+    reader, sim = make_reader(NtagTag(UID7, model))
+    frames = []
+    exchange = reader._exchange
+    reader._exchange = lambda frame, buffer, timeout=None: frames.append(frame[0]) or exchange(frame, buffer, timeout)
+    tag = NTAG(reader)
+    assert tag.activate()
+    return tag, sim.tags[0], frames
+
+
+def test_ndef_with_three_byte_length(make_reader):
+    tag, sim_tag, frames = ntag(make_reader, 'NTAG215')
+    message = bytes(range(256)) + b'long message'
+    assert tag.write_ndef(message)
+    assert sim_tag.memory[16:20] == bytes((0x03, 0xFF, 0x01, 0x0C))
+    assert sim_tag.memory[20 + len(message)] == 0xFE
+    assert tag.read_ndef() == message
+
+
+def test_ndef_over_several_fast_reads(make_reader):
+    tag, sim_tag, frames = ntag(make_reader, 'NTAG216')
+    assert tag.user_end == 225
+    message = bytes(i & 0xFF for i in range(800))
+    assert tag.write_ndef(message)
+    del frames[:]
+    assert tag.read_ndef() == message
+    # The head with the capability container, then 186 pages in two FAST_READs
+    assert frames == [0x3A, 0x3A, 0x3A]
+
+
+def test_ultralight_reads_with_read(make_reader):
+    tag, sim_tag, frames = ntag(make_reader, 'MF0ICU')
+    assert (tag.name, tag.version) == ('MF0ICU', None)
+    message = b'\xd1\x01\x0cU\x04example.com'
+    assert tag.write_ndef(message)
+    assert tag.read_ndef() == message
+    assert tag.read_pages(4, 12) == bytes(sim_tag.memory[16:64])
+    assert 0x3A not in frames
+    assert 0x30 in frames
@@ -0,0 +1,164 @@
+import pytest
+
+from PN5180 import PN5180, Batch, BusyTimeout, CollisionError, NoTag, RfFieldError, RxError, TransceiveStateError, \
+    regs, _PN5180_READ_DATA, _RX_IRQ_STAT
+from Simulator import SimulatedPN5180, ISO14443ATag
+
+
+def test_failed_write_forgets_the_shadowed_value(make_reader):
+    reader, sim = make_reader(setup=False)
+    reader.register_shadow = True
+    reader.write_register(regs._TIMER1_RELOAD, 0x1234)
+    sim.hang()
+    with pytest.raises(BusyTimeout):
+        reader.write_register(regs._TIMER1_RELOAD, 0x5678)
+    assert regs._TIMER1_RELOAD not in reader._shadow
+    assert reader.reset()
+    reader.write_register(regs._TIMER1_RELOAD, 0x1234)
+    assert sim.regs[regs._TIMER1_RELOAD] == 0x1234
+
+
+def test_reset_waits_for_the_busy_rise(make_reader):
+    reader, sim = make_reader(setup=False, time_scale=1)
+    sim.protocol_errors = 0
+    assert reader.reset()  # BUSY is still low right after the release
+    assert sim.protocol_errors == 0
+    assert sim.irq_status == 0
+
+
+def test_rf_on_fails_in_an_external_field(make_reader):
+    reader, sim = make_reader(setup=False)
+    sim.external_field = True
+    with pytest.raises(RfFieldError):
+        reader.setup_rf()
+    assert not sim.rf_on
+    sim.external_field = False
+    assert reader.setup_rf()
+
+
+def test_tune_spi_speed(make_reader):
+    reader, sim = make_reader(setup=False, max_spi_hz=4000000)
+    sim.set_speed(500000)
+    assert reader.tune_spi_speed() == 4000000
+    assert sim.get_speed() == 4000000
+
+
+def test_tune_spi_speed_survives_busy_timeouts(make_reader, monkeypatch):
+    reader, sim = make_reader(setup=False)
+    sim.set_speed(500000)
+    reader.register_shadow = True
+    read_eeprom = reader.read_eeprom
+
+    def garbled(addr, buffer):
+        if (sim.get_speed() > 2000000):
+            sim.hang()
+            raise BusyTimeout("BUSY stuck high")
+        return read_eeprom(addr, buffer)
+
+    monkeypatch.setattr(reader, 'read_eeprom', garbled)
+    assert reader.tune_spi_speed() == 2000000
+    assert sim.get_speed() == 2000000
+    assert reader.register_shadow
+    assert reader.read_register(regs._TIMER1_RELOAD) is not None
+
+
+def test_batch_general_error(make_reader):
+    reader, sim = make_reader()
+    # SEND_DATA without arming the transceiver first
+    result = reader.run_batch(Batch()._command(bytes((0x09, 7, 0x52))).wait_for_rx())
+    assert not result.ok
+    assert isinstance(result.error, TransceiveStateError)
+
+
+def test_batch_leaves_the_shadow_alone_when_off(make_reader):
+    reader, sim = make_reader()
+    result = reader.run_batch(Batch().write_register(regs._TIMER1_RELOAD, 0x1234))
+    assert result.ok
+    assert sim.regs[regs._TIMER1_RELOAD] == 0x1234
+    assert reader._shadow == {}
+
+
+def test_irq_polled_with_backoff_without_irq_pin(monkeypatch):
+    sim = SimulatedPN5180(time_scale=0)
+    reader = PN5180(0, 0, 8, 16, 13, None, transport=sim)
+    reader.begin()
+    assert reader.reset()
+    reads = []
+    get_irq_status = reader.get_irq_status
+    monkeypatch.setattr(reader, 'get_irq_status', lambda: reads.append(1) or get_irq_status())
+    assert 0 == reader.wait_for_irq(_RX_IRQ_STAT, 0.02)
+    assert 5 <= len(reads) <= 40
+
+
+def test_shadow_skips_repeated_writes(make_reader):
+    reader, sim = make_reader(setup=False)
+    reader.register_shadow = True
+    sent = []
+    register_command = reader._register_command
+    reader._register_command = lambda cmd, reg, value: sent.append(cmd) or register_command(cmd, reg, value)
+
+    reader.write_register(regs._CRC_RX_CONFIG, 0x01)
+    reader.write_register(regs._CRC_RX_CONFIG, 0x01)
+    reader.write_register_with_or_mask(regs._CRC_RX_CONFIG, 0x01)
+    reader.write_register_with_and_mask(regs._CRC_RX_CONFIG, 0xFFFFFFFD)
+    assert len(sent) == 1
+    assert reader.shadow_saved == 3
+
+    reader.invalidate_shadow()
+    reader.write_register(regs._CRC_RX_CONFIG, 0x01)
+    assert len(sent) == 2
+    assert sim.regs[regs._CRC_RX_CONFIG] == 0x01
+
+
+def test_shadow_off_sends_every_write(make_reader):
+    reader, sim = make_reader(setup=False)
+    sent = []
+    register_command = reader._register_command
+    reader._register_command = lambda cmd, reg, value: sent.append(cmd) or register_command(cmd, reg, value)
+    reader.write_register(regs._CRC_RX_CONFIG, 0x01)
+    reader.write_register(regs._CRC_RX_CONFIG, 0x01)
+    assert len(sent) == 2
+    assert reader.shadow_saved == 0
+
+
+def crc(reader, tx, rx):
+    reader.write_register(regs._CRC_TX_CONFIG, int(tx))
+    reader.write_register(regs._CRC_RX_CONFIG, int(rx))
+
+
+def test_exchange_returns_answers_of_any_length(make_reader):
+    uid = bytes.fromhex('08112233')
+    reader, sim = make_reader(ISO14443ATag(uid, sak=0x08))
+    crc(reader, False, False)
+    sim.commands.clear()
+    assert reader.exchange(b'\x52', 7) == bytes([0x04, 0x00])  # WUPA -> ATQA
+    cl1 = uid + bytes([uid[0] ^ uid[1] ^ uid[2] ^ uid[3]])
+    assert reader.exchange(b'\x93\x20') == cl1                 # Anticollision CL1
+    crc(reader, True, True)
+    assert reader.exchange(b'\x93\x70' + cl1) == b'\x08'       # SELECT -> SAK, CRC removed
+    assert sim.commands[_PN5180_READ_DATA] == 3
+
+
+def test_exchange_without_tag(make_reader):
+    reader, sim = make_reader()
+    crc(reader, False, False)
+    with pytest.raises(NoTag):
+        reader.exchange(b'\x52', 7, timeout_us=5000)
+    assert sim.commands[_PN5180_READ_DATA] == 0
+
+
+def test_exchange_collision(make_reader):
+    reader, sim = make_reader(ISO14443ATag(bytes.fromhex('08112233')), ISO14443ATag(bytes.fromhex('08112234')))
+    crc(reader, False, False)
+    assert reader.exchange(b'\x52', 7) == bytes([0x04, 0x00])  # Same ATQA, no collision
+    with pytest.raises(CollisionError, match='bit 24'):
+        reader.exchange(b'\x93\x20')
+
+
+def test_exchange_integrity_error(make_reader):
+    reader, sim = make_reader(ISO14443ATag(bytes.fromhex('08112233')))
+    crc(reader, False, True)  # The ATQA has no CRC
+    with pytest.raises(RxError):
+        reader.exchange(b'\x52', 7)
+    with pytest.raises(RxError):  # RX_STATUS still flags the answer
+        reader.received_length()
@@ -0,0 +1,35 @@
+from Polling import TagPoller, TAG_ARRIVED, TAG_DEPARTED
+from Simulator import ISO14443ATag
+
+UID = bytes.fromhex('04112233445566')
+
+
+def test_arrival_presence_and_departure(make_reader):
+    tag = ISO14443ATag(UID)
+    reader, sim = make_reader()
+    poller = TagPoller(reader, interval=0, misses=2, verify_every=5)
+    assert poller.poll_once() == []
+
+    sim.add_tag(tag)
+    events = poller.poll_once()
+    assert [(e.kind, e.uid) for e in events] == [(TAG_ARRIVED, UID)]
+    for _ in range(10):                     # Presence checks and verifications
+        assert poller.poll_once() == []
+
+    sim.remove_tag(tag)
+    assert poller.poll_once() == []          # One miss is tolerated
+    assert [(e.kind, e.uid) for e in poller.poll_once()] == [(TAG_DEPARTED, UID)]
+
+
+def test_run_stops_after_cycles(make_reader):
+    reader, sim = make_reader(ISO14443ATag(UID))
+    events = []
+    TagPoller(reader, interval=0).run(events.append, cycles=5)
+    assert [e.kind for e in events] == [TAG_ARRIVED]
+
+
+def test_cycles_do_not_print(make_reader, capsys):
+    reader, sim = make_reader(ISO14443ATag(UID))
+    capsys.readouterr()
+    TagPoller(reader, interval=0, verify_every=2).run(lambda event: None, cycles=6)
+    assert capsys.readouterr().out == ''
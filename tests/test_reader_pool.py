@@ -0,0 +1,52 @@
+from Protocol import ISO14443
+from ReaderPool import ReaderPool
+from Simulator import SimulatedPN5180, ISO14443ATag
+from Polling import TAG_ARRIVED
+
+UIDS = (bytes.fromhex('04112233445566'), bytes.fromhex('04AABBCCDDEEFF'))
+
+
+class RecordingSimulator(SimulatedPN5180):
+    def __init__(self, name, log, *tags):
+        super().__init__(tags, time_scale=0)
+        self.name = name
+        self.log = log
+
+    def begin(self):
+        self.log.append(('begin', self.name))
+        super().begin()
+
+    def set_nss(self, level):
+        self.log.append(('spi', self.name))
+        super().set_nss(level)
+
+    def set_rst(self, level):
+        self.log.append(('reset', self.name))
+        super().set_rst(level)
+
+
+def make_pool(log):
+    pool = ReaderPool(interval=0)
+    for name, uid in zip(('a', 'b'), UIDS):
+        sim = RecordingSimulator(name, log, ISO14443ATag(uid))
+        pool.add_reader(name, ISO14443(0, 0, 8, 16, 13, 23, transport=sim), bus=0)
+    return pool
+
+
+def test_all_lines_set_up_before_any_reset_or_spi_traffic():
+    log = []
+    pool = make_pool(log)
+    assert pool.begin() == []
+    first = next(i for i, entry in enumerate(log) if entry[0] != 'begin')
+    assert sorted(log[:first]) == [('begin', 'a'), ('begin', 'b')]
+    pool.close()
+
+
+def test_events_of_both_readers():
+    pool = make_pool([])
+    pool.begin()
+    pool.start()
+    events = [pool.get_event(timeout=2) for _ in range(2)]
+    pool.close()
+    assert sorted((e.reader, e.kind, e.uid) for e in events) == \
+        [('a', TAG_ARRIVED, UIDS[0]), ('b', TAG_ARRIVED, UIDS[1])]
@@ -0,0 +1,49 @@
+from Polling import TAG_ARRIVED, TAG_DEPARTED
+from Protocol import MultiProtocol
+from Scheduler import PollingScheduler, TYPE_A, ISO15693
+from Simulator import ISO14443ATag, ISO15693Tag
+
+UID_A = bytes.fromhex('04112233445566')
+UID_V = bytes.fromhex('0102030405060708')
+
+
+def scheduler(make_reader, *tags, **options):
+    reader, sim = make_reader(*tags, cls=MultiProtocol, setup=False)
+    scheduler = PollingScheduler(reader, technologies=(TYPE_A, ISO15693), **options)
+    assert scheduler.setup()
+    return scheduler, sim
+
+
+def test_share_follows_the_hit_rate(make_reader):
+    s, sim = scheduler(make_reader, ISO14443ATag(UID_A), alpha=0.5, min_share=0.25)
+    for i in range(40):
+        s.poll_once()
+    assert s.polls['ISO14443A'] == 40
+    assert s.hit_rate['ISO14443A'] > 0.99
+    assert s.hit_rate['ISO15693'] == 0
+    # Polled in the first cycle, then every 1 / min_share cycles
+    assert 9 <= s.polls['ISO15693'] <= 12
+
+
+def test_loaded_configuration_polled_first(make_reader):
+    s, sim = scheduler(make_reader, ISO14443ATag(UID_A), ISO15693Tag(UID_V), min_share=1.0)
+    events = []
+    for i in range(5):
+        events += s.poll_once()
+    assert s.polls == {'ISO14443A': 5, 'ISO15693': 5}
+    # One LOAD_RF_CONFIG per cycle: each cycle starts with the one the last ended with
+    assert s.switches == 5
+    assert sorted((e.technology, e.uid) for e in events if e.kind == TAG_ARRIVED) == \
+        [('ISO14443A', UID_A), ('ISO15693', UID_V)]
+
+
+def test_departure_per_technology(make_reader):
+    tag = ISO14443ATag(UID_A)
+    s, sim = scheduler(make_reader, tag, ISO15693Tag(UID_V), misses=2, min_share=1.0)
+    s.poll_once()
+    assert s.tags == {UID_A: 'ISO14443A', UID_V: 'ISO15693'}
+    sim.remove_tag(tag)
+    assert s.poll_once() == []
+    events = s.poll_once()
+    assert [(e.kind, e.uid, e.technology) for e in events] == [(TAG_DEPARTED, UID_A, 'ISO14443A')]
+    assert s.tags == {UID_V: 'ISO15693'}
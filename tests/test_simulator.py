@@ -0,0 +1,61 @@
+import pytest
+
+from PN5180 import PN5180, regs, _TX_IRQ_STAT
+from Protocol import _HLTA
+from Simulator import ISO14443ATag
+
+UID = bytes.fromhex('04112233445566')
+
+
+def test_boot_and_registers(make_reader):
+    reader, sim = make_reader(setup=False)
+    assert reader.write_register(regs._TIMER1_RELOAD, 0x12345)
+    assert reader.read_register(regs._TIMER1_RELOAD) == 0x12345
+    version = bytearray(2)
+    assert reader.read_eeprom(0x10, version)
+    assert version == bytes([0x05, 0x03])
+    assert sim.protocol_errors == 0
+
+
+def test_frame_reaches_tag_at_end_of_transmission(make_reader):
+    tag = ISO14443ATag(UID)
+    reader, sim = make_reader(tag, time_scale=10)
+    reader.activate_type_A()
+    assert tag.state == tag.ACTIVE
+    # Transceiver stopped while the HLTA is still on air: the tag never got it
+    PN5180.send_data(reader, _HLTA, 2, 0x00)
+    PN5180.write_register_with_and_mask(reader, regs._SYSTEM_CONFIG, 0xFFFFFFF8)
+    assert tag.state == tag.ACTIVE
+
+
+def test_frame_delivered_after_tx_irq(make_reader):
+    tag = ISO14443ATag(UID)
+    reader, sim = make_reader(tag, time_scale=10)
+    reader.activate_type_A()
+    reader.clear_irq_status(_TX_IRQ_STAT)
+    PN5180.send_data(reader, _HLTA, 2, 0x00)
+    assert reader.wait_for_irq(_TX_IRQ_STAT, 0.1)
+    assert tag.state == tag.HALT
+
+
+@pytest.mark.parametrize('handshake', [PN5180.HANDSHAKE_SAFE, PN5180.HANDSHAKE_FAST])
+@pytest.mark.parametrize('time_scale', [0, 1])
+def test_handshakes_follow_busy(make_reader, handshake, time_scale):
+    tag = ISO14443ATag(UID)
+    reader, sim = make_reader(tag, time_scale=time_scale)
+    reader.handshake = handshake
+    assert reader.activate_type_A().uid == UID
+    version = bytearray(2)
+    assert reader.read_eeprom(0x10, version)
+    assert version == bytes([0x05, 0x03])
+    assert sim.protocol_errors == 0
+
+
+def test_controller_driven_nss_waits_for_busy(make_reader):
+    tag = ISO14443ATag(UID)
+    reader, sim = make_reader(tag, time_scale=1, frame_cs=True)
+    assert reader.activate_type_A().uid == UID
+    version = bytearray(2)
+    assert reader.read_eeprom(0x10, version)
+    assert version == bytes([0x05, 0x03])
+    assert sim.protocol_errors == 0
@@ -0,0 +1,47 @@
+import pytest
+
+from Protocol import ISO14443
+from Simulator import NtagTag
+from Trace import record, read_trace, TraceReplay, TraceMismatch, WRITE, READ
+
+UID = bytes.fromhex('04112233445566')
+
+
+def session(reader):
+    reader.begin()
+    reader.reset()
+    reader.setup_rf()
+    buffer = bytearray(10)
+    return [reader.read_card_serial(buffer), bytes(buffer)]
+
+
+@pytest.mark.parametrize('frame_cs', [False, True])
+def test_record_and_replay(make_reader, tmp_path, frame_cs):
+    path = str(tmp_path / 'session.trace')
+    reader, sim = make_reader(NtagTag(UID), setup=False, frame_cs=frame_cs)
+    recorder = record(reader, path)
+    reader.setup_rf()
+    buffer = bytearray(10)
+    expected = [reader.read_card_serial(buffer), bytes(buffer)]
+    reader.close()
+    assert recorder.records > 0
+    kinds = {r.kind for r in read_trace(path)}
+    assert {WRITE, READ} <= kinds
+
+    # The replay starts where the recording started, after begin() and reset()
+    replayed = ISO14443(0, 0, 8, 16, 13, 23, transport=TraceReplay(path))
+    replayed.setup_rf()
+    buffer = bytearray(10)
+    assert [replayed.read_card_serial(buffer), bytes(buffer)] == expected
+
+
+def test_replay_detects_other_traffic(make_reader, tmp_path):
+    path = str(tmp_path / 'session.trace')
+    reader, sim = make_reader(NtagTag(UID), setup=False)
+    record(reader, path)
+    reader.setup_rf()
+    reader.close()
+
+    replayed = ISO14443(0, 0, 8, 16, 13, 23, transport=TraceReplay(path))
+    with pytest.raises(TraceMismatch):
+        replayed.read_register(0x13)
@@ -0,0 +1,90 @@
+import pytest
+
+import DeviceInfo
+import PN5180
+import Transport
+from DeviceInfo import read_device_info
+from Simulator import ISO14443ATag
+
+UID = bytes.fromhex('04112233445566')
+
+
+class FakeGPIO:
+    BCM, IN, OUT, LOW, HIGH, RISING, FALLING = 'BCM', 'IN', 'OUT', 0, 1, 'RISING', 'FALLING'
+
+    def __init__(self):
+        self.levels = {}
+        self.detect = {}
+        self.mode = None
+
+    def getmode(self):
+        return self.mode
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction):
+        assert pin is not None
+        self.levels.setdefault(pin, self.LOW)
+
+    def output(self, pin, level):
+        self.levels[pin] = level
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def add_event_detect(self, pin, edge, callback):
+        assert pin is not None
+        self.detect[pin] = edge
+
+    def remove_event_detect(self, pin):
+        del self.detect[pin]
+
+
+class FakeSpiDev:
+    def open(self, bus, device):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def gpio(monkeypatch):
+    gpio = FakeGPIO()
+    monkeypatch.setattr(Transport, 'GPIO', gpio)
+    monkeypatch.setattr(Transport, 'spidev', type('spidev', (), {'SpiDev': FakeSpiDev}))
+    return gpio
+
+
+def test_rpi_transport_without_irq_pin(gpio):
+    transport = Transport.RPiTransport(0, 0, 8, 16, 13, None)
+    transport.begin()
+    assert gpio.detect == {}
+    assert transport.get_irq() == Transport.Transport.LOW
+    assert transport.wait_irq(0.001) is False
+    transport.close()
+
+
+def test_rpi_transport_irq_polarity(gpio):
+    transport = Transport.RPiTransport(0, 0, 8, 16, 13, 23)
+    transport.begin()
+    assert gpio.detect == {23: gpio.RISING}
+    transport.set_irq_polarity(False)
+    assert gpio.detect == {23: gpio.FALLING}
+    gpio.levels[23] = gpio.HIGH
+    assert transport.wait_irq(0.001) is False
+    gpio.levels[23] = gpio.LOW
+    assert transport.wait_irq(0.001) is True
+    transport.close()
+    assert gpio.detect == {}
+
+
+def test_active_low_irq_from_eeprom(make_reader, monkeypatch):
+    monkeypatch.setattr(DeviceInfo, '_cache', {})
+    reader, sim = make_reader(ISO14443ATag(UID), setup=False)
+    sim.eeprom[PN5180._IRQ_PIN_CONFIG] = 0x00     # IRQ active low
+    read_device_info(reader)
+    assert sim.irq_active_high is False
+    assert reader.setup_rf()
+    assert reader.activate_type_A().uid == UID